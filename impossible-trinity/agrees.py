@@ -0,0 +1,79 @@
+"""
+Per-user agree tracking
+
+Each user may agree with an IT once. Agree rows are keyed on
+``(user_id, it_id)`` and written with ``INSERT ... ON CONFLICT DO NOTHING``, so
+repeating the request is harmless and needs no read before the write. The set
+of IT ids a user has agreed with is cached per process, so a whole page of
+cards can render its "already agreed" state from one lookup.
+"""
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from cache import LRUCache
+from counters import agree_buffer, increment_agree
+from models import db, ImpossibleTrinity, Agree
+
+# user_id -> frozenset of agreed IT ids
+_agreed = LRUCache(maxsize=10000, ttl=300)
+
+
+def agreed_ids(user_id):
+    """IT ids the user has agreed with (one query per user per TTL)"""
+    ids = _agreed.get(user_id)
+    if ids is None:
+        ids = frozenset(db.session.execute(
+            select(Agree.it_id).where(Agree.user_id == user_id)
+        ).scalars())
+        _agreed.set(user_id, ids)
+    return ids
+
+
+def _remember(user_id, it_id):
+    _agreed.set(user_id, agreed_ids(user_id) | {it_id})
+
+
+def _stored_count(it_id):
+    row = db.session.execute(
+        select(ImpossibleTrinity.agree_count).where(ImpossibleTrinity.id == it_id)
+    ).first()
+    return None if row is None else (row[0] or 0)
+
+
+def record_agree(user_id, it_id):
+    """Agree with an IT at most once
+
+    Returns ``(created, count)`` where ``count`` is the live agree count, or
+    None if the IT does not exist.
+    """
+    if it_id in agreed_ids(user_id) or agree_buffer.enabled:
+        count = _stored_count(it_id)
+        if count is None:
+            return False, None
+        created = it_id not in agreed_ids(user_id)
+        if created:
+            agree_buffer.add(user_id, it_id)
+            _remember(user_id, it_id)
+        return created, count + agree_buffer.pending(it_id)
+
+    created = db.session.execute(
+        sqlite_insert(Agree.__table__)
+        .values(user_id=user_id, it_id=it_id)
+        .on_conflict_do_nothing()
+    ).rowcount > 0
+    count = increment_agree(it_id) if created else _stored_count(it_id)
+    if count is None:
+        db.session.rollback()
+        return False, None
+    db.session.commit()
+    _remember(user_id, it_id)
+    return created, count
+
+
+def forget_item(it_id):
+    """Drop an IT's agree rows in the current transaction (before deleting the IT)"""
+    db.session.execute(delete(Agree.__table__).where(Agree.__table__.c.it_id == it_id))
+    # Ids can be reused by SQLite, so cached sets must not outlive the row
+    _agreed.evict(lambda ids: it_id in ids)
+    agree_buffer.discard(it_id)
@@ -1,149 +1,300 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, Response, stream_with_context, send_file
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from sqlalchemy.orm import joinedload
 import bcrypt
-import csv
-import io
-from models import db, User, ImpossibleTrinity, Comment
+import hmac
+import os
+from models import db, User, ImpossibleTrinity, Comment, Job
+from search import ensure_index, rebuild_index, prepare_index
+from pagination import keyset_page, neighbours
+from schema import upgrade_schema, schema_version, check_schema
+from storage import sqlite_storage, pragma_values
+from counters import repair_comment_counts, agree_buffer, live_agree_count
+from agrees import agreed_ids, record_agree, forget_item
+from pagecache import page_cache
+from catalogue import field_catalogue, rebuild_catalogue
+from csvio import iter_export_batches, iter_csv_bytes
+from jobs import job_runner, job_to_dict
+from users import load_user, snapshot
+from grid import grid_page, grid_total, parse_columns
+from stats import user_stats
+from feed import VIEW_FIELDS, feed_page, feed_total, parse_fields, serialize
+from compression import compressed
+from assets import asset_pipeline, build_assets
+from metrics import metrics
+from images import image_store, accepts_webp, IMAGE_FORMATS, IMAGE_MAX_AGE, THUMB_WIDTHS, FEATURE_WIDTHS
+from related import related_index, related_items
+from ranking import refresh_hot_scores
+from comments import (comment_page, comments_count, serialize_comments, create_comment, remove_comment,
+                      COMMENTS_PER_PAGE, MAX_COMMENTS_PER_PAGE)
 from datetime import datetime
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Send JSON as UTF-8 (Chinese text would triple in size as \uXXXX escapes) in field order
+app.json.ensure_ascii = False
+app.json.sort_keys = False
+# Batch agree clicks in memory and flush every N ms (0 = write through)
+app.config['AGREE_FLUSH_INTERVAL_MS'] = int(os.environ.get('AGREE_FLUSH_INTERVAL_MS', 0))
+# Rows per INSERT batch/commit for CSV imports
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+# Threads running background import/export jobs
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# Hours a finished export stays downloadable before its file is deleted
+app.config['JOB_RETENTION_HOURS'] = int(os.environ.get('JOB_RETENTION_HOURS', 24))
+# Rendered-page cache for index/detail (TTL 0 disables; a redis:// URL shares it across workers)
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 60))
+app.config['PAGE_CACHE_URL'] = os.environ.get('PAGE_CACHE_URL')
+# Comma-separated hosts images may be fetched from (unset: any public host)
+app.config['IMAGE_ALLOWED_HOSTS'] = [h for h in os.environ.get('IMAGE_ALLOWED_HOSTS', '').split(',') if h] or None
+# Bearer token Prometheus must send to /metrics (admin sessions are always allowed)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 
 # Initialize extensions
 db.init_app(app)
+sqlite_storage.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+agree_buffer.init_app(app)
+page_cache.init_app(app)
+job_runner.init_app(app)
+asset_pipeline.init_app(app)
+image_store.init_app(app)
+metrics.init_app(app)
+related_index.init_app(app)
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+# Newest-first feed ordering, backed by ix_impossible_trinity_created_at_id
+FEED_ORDER = (ImpossibleTrinity.created_at, ImpossibleTrinity.id)
+DASHBOARD_PER_PAGE = 50
+
+# Cached, session-independent user snapshots (see users.py)
+login_manager.user_loader(load_user)
 
 # Context processor to make current_user available in all templates
 @app.context_processor
 def inject_user():
-    return dict(current_user=current_user)
+    agreed = agreed_ids(current_user.id) if current_user.is_authenticated else frozenset()
+    return dict(current_user=current_user, agreed_ids=agreed)
+
+app.add_template_global(live_agree_count)
+app.add_template_global(image_store.cached_image, 'cached_image')
+app.add_template_global(THUMB_WIDTHS, 'THUMB_WIDTHS')
+app.add_template_global(FEATURE_WIDTHS, 'FEATURE_WIDTHS')
 
 # Routes
 @app.route('/')
+@page_cache.cached(lambda view_args: ['list'], args=('view', 'field', 'q', 'sort'))
 def index():
     view_type = request.args.get('view', 'card')  # card or table
+    if view_type not in VIEW_FIELDS:
+        view_type = 'card'
     field_filter = request.args.get('field', '')
     search_query = request.args.get('q', '').strip()
     
-    # Get all unique fields
-    fields = db.session.query(ImpossibleTrinity.field).distinct().order_by(ImpossibleTrinity.field).all()
-    fields = [f[0] for f in fields]
-    
-    # Query with filters
-    query = ImpossibleTrinity.query
-    
-    # Apply field filter if provided
-    if field_filter:
-        query = query.filter_by(field=field_filter)
+    # Field chips with item counts, from the maintained catalogue
+    fields = field_catalogue()
     
-    # Apply search query if provided
-    if search_query:
-        search_pattern = f'%{search_query}%'
-        query = query.filter(
-            db.or_(
-                ImpossibleTrinity.name.ilike(search_pattern),
-                ImpossibleTrinity.name_en.ilike(search_pattern),
-                ImpossibleTrinity.field.ilike(search_pattern),
-                ImpossibleTrinity.element1.ilike(search_pattern),
-                ImpossibleTrinity.element2.ilike(search_pattern),
-                ImpossibleTrinity.element3.ilike(search_pattern),
-                ImpossibleTrinity.description.ilike(search_pattern)
-            )
-        )
-    
-    # Use pagination for both views to improve performance
+    # Same query as /api/its, so infinite scroll continues this exact listing
     per_page = 20 if view_type == 'table' else 12
-    page = 1
-    pagination = query.order_by(
-        ImpossibleTrinity.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        its, next_cursor, sort = feed_page(
+            VIEW_FIELDS[view_type], field_filter, search_query,
+            request.args.get('sort'), per_page=per_page
+        )
+    except ValueError:
+        its, next_cursor, sort = feed_page(
+            VIEW_FIELDS[view_type], field_filter, search_query, per_page=per_page
+        )
     
     return render_template(
         'index.html',
-        its=pagination.items,
+        its=its,
         view_type=view_type,
-        has_more=pagination.has_next,
+        next_cursor=next_cursor,
         per_page=per_page,
         fields=fields,
         current_field=field_filter,
-        search_query=search_query
+        search_query=search_query,
+        sort=sort,
+        total=feed_total(field_filter, search_query) if field_filter or search_query else None
     )
 
 @app.route('/api/its')
+@compressed
 def api_its():
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 12, type=int)
-    pagination = ImpossibleTrinity.query.order_by(
-        ImpossibleTrinity.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
-
-    items = []
-    for it in pagination.items:
-        items.append({
-            'id': it.id,
-            'name': it.name,
-            'field': it.field,
-            'element1': it.element1,
-            'element2': it.element2,
-            'element3': it.element3,
-            'description': it.description,
-            'agree_count': it.agree_count,
-            'comments_count': len(it.comments),
-            'element1_sacrifice_explanation': it.element1_sacrifice_explanation,
-            'element2_sacrifice_explanation': it.element2_sacrifice_explanation,
-            'element3_sacrifice_explanation': it.element3_sacrifice_explanation,
-            'created_at': it.created_at.isoformat(),
-        })
+    cursor = request.args.get('cursor')
+    per_page = max(1, min(request.args.get('per_page', 12, type=int), 100))
+    field_filter = request.args.get('field', '')
+    search_query = request.args.get('q', '').strip()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        rows, next_cursor, sort = feed_page(
+            fields, field_filter, search_query, request.args.get('sort'), cursor, per_page
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    agreed = agreed_ids(current_user.id) if current_user.is_authenticated else frozenset()
 
     return jsonify({
-        'items': items,
-        'has_more': pagination.has_next,
-        'next_page': pagination.next_num if pagination.has_next else None
+        'items': serialize(rows, fields, agreed),
+        'has_more': next_cursor is not None,
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'total': feed_total(field_filter, search_query)
+    })
+
+@app.route('/api/fields')
+@compressed
+def api_fields():
+    return jsonify({
+        'fields': [
+            {
+                'name': f.name,
+                'item_count': f.item_count,
+                'last_updated': f.last_updated.isoformat() if f.last_updated else None,
+            }
+            for f in field_catalogue()
+        ]
     })
 
 @app.route('/detail/<int:id>')
+@page_cache.cached(lambda view_args: ['structure', f"item:{view_args['id']}"])
 def detail(id):
-    it = ImpossibleTrinity.query.get_or_404(id)
-    
-    # Get previous and next records (ordered by created_at descending)
-    previous_it = ImpossibleTrinity.query.filter(
-        ImpossibleTrinity.created_at > it.created_at
-    ).order_by(ImpossibleTrinity.created_at.asc()).first()
+    it = ImpossibleTrinity.query.options(
+        joinedload(ImpossibleTrinity.creator)
+    ).filter_by(id=id).first_or_404()
     
-    next_it = ImpossibleTrinity.query.filter(
-        ImpossibleTrinity.created_at < it.created_at
-    ).order_by(ImpossibleTrinity.created_at.desc()).first()
+    # Neighbours in feed order: "previous" is the next newer IT
+    previous_id, next_id = neighbours(db.session, FEED_ORDER, (it.created_at, it.id))
     
-    return render_template('detail.html', it=it, previous_it=previous_it, next_it=next_it)
+    comments, authors, comments_cursor = comment_page(it.id)
+    return render_template(
+        'detail.html',
+        it=it,
+        previous_id=previous_id,
+        next_id=next_id,
+        comments=comments,
+        authors=authors,
+        comments_cursor=comments_cursor,
+        related=related_items(it.id)
+    )
+
+@app.route('/detail/<int:id>/comments')
+@page_cache.cached(lambda view_args: [f"item:{view_args['id']}"], args=('cursor',))
+def detail_comments(id):
+    """Next page of comments as an HTML fragment (the "load more" button)"""
+    try:
+        comments, authors, next_cursor = comment_page(id, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    return render_template('_comment_items.html', comments=comments, authors=authors,
+                           next_cursor=next_cursor)
+
+@app.route('/api/its/<int:id>/comments')
+@compressed
+def api_comments(id):
+    """A page of comments as JSON; authors are listed once per page, keyed by user id"""
+    total = comments_count(id)
+    if total is None:
+        return jsonify({'error': 'not found'}), 404
+    per_page = max(1, min(request.args.get('per_page', COMMENTS_PER_PAGE, type=int), MAX_COMMENTS_PER_PAGE))
+    try:
+        rows, authors, next_cursor = comment_page(id, request.args.get('cursor'), per_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    items, authors = serialize_comments(rows, authors)
+    return jsonify({
+        'items': items,
+        'authors': authors,
+        'has_more': next_cursor is not None,
+        'next_cursor': next_cursor,
+        'total': total
+    })
+
+@app.route('/api/its/<int:id>/comments', methods=['POST'])
+@login_required
+def api_add_comment(id):
+    """Post a comment; returns it as JSON plus its rendered fragment"""
+    payload = request.get_json(silent=True) or request.form
+    content = (payload.get('content') or '').strip()
+    if not content:
+        return jsonify({'error': '评论内容不能为空'}), 400
+    row, count = create_comment(id, current_user.id, content)
+    if row is None:
+        return jsonify({'error': 'not found'}), 404
+    page_cache.invalidate(id)
+    authors = {current_user.id: current_user}
+    items, names = serialize_comments([row], authors)
+    return jsonify({
+        'comment': items[0],
+        'authors': names,
+        'html': render_template('_comment_items.html', comments=[row], authors=authors, next_cursor=None),
+        'comments_count': count
+    }), 201
+
+@app.route('/api/comments/<int:id>', methods=['DELETE'])
+@login_required
+def api_delete_comment(id):
+    if not current_user.is_admin:
+        return jsonify({'error': '需要管理员权限'}), 403
+    comment = db.session.get(Comment, id)
+    if comment is None:
+        return jsonify({'error': 'not found'}), 404
+    it_id = comment.it_id
+    count = remove_comment(comment)
+    page_cache.invalidate(it_id)
+    return jsonify({'deleted': id, 'comments_count': count})
+
+@app.route('/img/<digest>/<int:width>')
+def image(digest, width):
+    """Cached image rendition: WebP when the browser asks for it, else JPEG"""
+    formats = ['webp', 'jpg'] if accepts_webp(request.accept_mimetypes) else ['jpg']
+    for fmt in formats:
+        path = image_store.path(digest, width, fmt)
+        if path is not None:
+            break
+    else:
+        abort(404)
+    response = send_file(path, mimetype=IMAGE_FORMATS[fmt], max_age=IMAGE_MAX_AGE)
+    response.vary.add('Accept')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: bearer METRICS_TOKEN, or an admin session
+
+    No address is trusted: behind a reverse proxy every request comes from
+    localhost.
+    """
+    token = app.config['METRICS_TOKEN']
+    allowed = bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode('utf-8'), f'Bearer {token}'.encode('utf-8')
+    )
+    if not (allowed or (current_user.is_authenticated and current_user.is_admin)):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/comment/<int:id>', methods=['POST'])
 @login_required
 def add_comment(id):
-    it = ImpossibleTrinity.query.get_or_404(id)
-    content = request.form.get('content')
+    """Form fallback of api_add_comment for browsers without JavaScript"""
+    content = (request.form.get('content') or '').strip()
     
     if content:
-        comment = Comment(
-            content=content,
-            it_id=it.id,
-            user_id=current_user.id
-        )
-        db.session.add(comment)
-        db.session.commit()
+        row, _ = create_comment(id, current_user.id, content)
+        if row is None:
+            abort(404)
+        page_cache.invalidate(id)
         flash('评论添加成功！')
     else:
         flash('评论内容不能为空')
     
-    return redirect(url_for('detail', id=it.id))
+    return redirect(url_for('detail', id=id))
 
 @app.route('/comment/delete/<int:id>', methods=['POST'])
 @login_required
@@ -155,8 +306,8 @@ def delete_comment(id):
         flash('需要管理员权限')
         return redirect(url_for('detail', id=it_id))
 
-    db.session.delete(comment)
-    db.session.commit()
+    remove_comment(comment)
+    page_cache.invalidate(it_id)
     flash('评论已删除')
     return redirect(url_for('detail', id=it_id))
 
@@ -169,7 +320,7 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and bcrypt.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8')):
-            login_user(user)
+            login_user(snapshot(user))
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('index'))
         else:
@@ -255,6 +406,7 @@ def add_it():
         
         db.session.add(it)
         db.session.commit()
+        page_cache.invalidate(structure=True)
         
         flash('不可能三角创建成功！')
         return redirect(url_for('index'))
@@ -291,6 +443,7 @@ def edit_it(id):
         it.updated_at = datetime.utcnow()
         
         db.session.commit()
+        page_cache.invalidate(it.id, structure=True)
         
         flash('不可能三角更新成功！')
         return redirect(url_for('detail', id=it.id))
@@ -307,8 +460,10 @@ def delete_it(id):
         flash('您没有权限删除此内容')
         return redirect(url_for('index'))
     
+    forget_item(it.id)
     db.session.delete(it)
     db.session.commit()
+    page_cache.invalidate(id, structure=True)
     
     flash('不可能三角已删除')
     return redirect(url_for('dashboard') if not current_user.is_admin else url_for('admin'))
@@ -319,9 +474,23 @@ def dashboard():
     if current_user.is_admin:
         return redirect(url_for('admin'))
     
-    user_its = ImpossibleTrinity.query.filter_by(creator_id=current_user.id).order_by(
-        ImpossibleTrinity.created_at.desc()).all()
-    return render_template('dashboard.html', its=user_its)
+    # One page of the user's ITs (newest first) plus memoized totals
+    try:
+        user_its, next_cursor = keyset_page(
+            ImpossibleTrinity.query.filter_by(creator_id=current_user.id),
+            FEED_ORDER,
+            cursor=request.args.get('cursor'),
+            per_page=DASHBOARD_PER_PAGE
+        )
+    except ValueError:
+        return redirect(url_for('dashboard'))
+    return render_template(
+        'dashboard.html',
+        its=user_its,
+        next_cursor=next_cursor,
+        first_page=not request.args.get('cursor'),
+        stats=user_stats(current_user.id)
+    )
 
 @app.route('/admin')
 @login_required
@@ -330,91 +499,102 @@ def admin():
         flash('需要管理员权限')
         return redirect(url_for('index'))
     
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = 1000  # Show 1000 records per page
-    
-    # Use pagination with eager loading to avoid N+1 query problem
-    pagination = ImpossibleTrinity.query.options(
-        joinedload(ImpossibleTrinity.creator),
-        joinedload(ImpossibleTrinity.comments)
-    ).order_by(
-        ImpossibleTrinity.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    # The IT table itself is loaded page by page from /admin/grid
+    jobs = Job.query.order_by(Job.id.desc()).limit(10).all()
     
     return render_template(
         'admin.html',
-        its=pagination.items,
-        pagination=pagination,
-        per_page=per_page
+        fields=field_catalogue(),
+        total=grid_total(),
+        jobs=jobs
     )
 
+@app.route('/admin/grid')
+@login_required
+@compressed
+def admin_grid():
+    """JSON rows for the admin grid: projection, filters, sort and keyset paging"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'forbidden'}), 403
+    
+    field = request.args.get('field') or None
+    creator = request.args.get('creator') or None
+    q = request.args.get('q', '').strip() or None
+    try:
+        columns, rows, next_cursor = grid_page(
+            columns=parse_columns(request.args.get('columns')),
+            sort=request.args.get('sort', 'created_at'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            cursor=request.args.get('cursor'),
+            per_page=request.args.get('per_page', 100, type=int),
+            field=field,
+            creator=creator,
+            q=q
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'columns': columns,
+        'rows': [
+            [v.isoformat() if isinstance(v, datetime) else v for v in row]
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+        'total': grid_total(field, creator, q)
+    })
+
 @app.route('/agree/<int:id>', methods=['POST'])
 @login_required
 def agree_it(id):
-    it = ImpossibleTrinity.query.get_or_404(id)
-    it.agree_count += 1
-    db.session.commit()
-    return jsonify({'success': True, 'count': it.agree_count})
+    created, count = record_agree(current_user.id, id)
+    if count is None:
+        abort(404)
+    if created:
+        page_cache.invalidate(id)
+    return jsonify({'success': True, 'agreed': True, 'created': created, 'count': count})
+
+def job_accepted(job, message):
+    """Respond to a job submission: JSON for API clients, flash + redirect for the admin page"""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('job_status', id=job.id)
+        }), 202
+    flash(message)
+    return redirect(url_for('admin'))
 
-@app.route('/admin/export', methods=['GET'])
+@app.route('/admin/export', methods=['GET', 'POST'])
 @login_required
 def export_csv():
-    """Export all Impossible Trinities to CSV"""
+    """Export all Impossible Trinities to CSV
+
+    GET streams the file directly (?compress=gzip for .csv.gz); POST queues a
+    background job whose file is downloaded from /admin/jobs/<id>/download.
+    """
     if not current_user.is_admin:
         flash('需要管理员权限')
         return redirect(url_for('index'))
     
-    # Create a string buffer for CSV output
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    header = [
-        'name', 'name_en', 'field', 
-        'element1', 'element2', 'element3',
-        'description', 'hyperlink',
-        'feature_image_url', 'element1_image_url', 'element2_image_url', 'element3_image_url',
-        'element1_sacrifice_explanation', 'element2_sacrifice_explanation', 'element3_sacrifice_explanation'
-    ]
-    writer.writerow(header)
+    compress = request.values.get('compress') == 'gzip'
+    if request.method == 'POST':
+        job = job_runner.submit('export', current_user.id, compress=compress)
+        return job_accepted(job, f'导出任务 #{job.id} 已提交')
     
-    # Write data rows
-    its = ImpossibleTrinity.query.all()
-    for it in its:
-        row = [
-            it.name,
-            it.name_en,
-            it.field,
-            it.element1,
-            it.element2,
-            it.element3,
-            it.description,
-            it.hyperlink or '',
-            it.feature_image_url or '',
-            it.element1_image_url or '',
-            it.element2_image_url or '',
-            it.element3_image_url or '',
-            it.element1_sacrifice_explanation or '',
-            it.element2_sacrifice_explanation or '',
-            it.element3_sacrifice_explanation or ''
-        ]
-        writer.writerow(row)
+    filename = f'impossible_trinities_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    if compress:
+        filename += '.gz'
     
-    # Create response
-    output.seek(0)
-    response = send_file(
-        io.BytesIO(output.getvalue().encode('utf-8-sig')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'impossible_trinities_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return Response(
+        stream_with_context(iter_csv_bytes(iter_export_batches(), compress=compress)),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
-    return response
 
 @app.route('/admin/import', methods=['POST'])
 @login_required
 def import_csv():
-    """Import Impossible Trinities from CSV"""
+    """Queue a background import of Impossible Trinities from CSV"""
     if not current_user.is_admin:
         flash('需要管理员权限')
         return redirect(url_for('index'))
@@ -433,58 +613,124 @@ def import_csv():
         flash('请上传CSV文件')
         return redirect(url_for('admin'))
     
-    try:
-        # Read CSV file
-        stream = io.TextIOWrapper(file, encoding='utf-8-sig')
-        csv_reader = csv.DictReader(stream)
-        
-        imported_count = 0
-        skipped_count = 0
-        
-        for row in csv_reader:
-            try:
-                # Create new Impossible Trinity
-                it = ImpossibleTrinity(
-                    name=row.get('name', ''),
-                    name_en=row.get('name_en', 'Impossible Trinity'),
-                    field=row.get('field', ''),
-                    element1=row.get('element1', ''),
-                    element2=row.get('element2', ''),
-                    element3=row.get('element3', ''),
-                    description=row.get('description', ''),
-                    hyperlink=row.get('hyperlink', '') or None,
-                    feature_image_url=row.get('feature_image_url', '') or None,
-                    element1_image_url=row.get('element1_image_url', '') or None,
-                    element2_image_url=row.get('element2_image_url', '') or None,
-                    element3_image_url=row.get('element3_image_url', '') or None,
-                    element1_sacrifice_explanation=row.get('element1_sacrifice_explanation', '') or None,
-                    element2_sacrifice_explanation=row.get('element2_sacrifice_explanation', '') or None,
-                    element3_sacrifice_explanation=row.get('element3_sacrifice_explanation', '') or None,
-                    creator_id=current_user.id
-                )
-                
-                db.session.add(it)
-                imported_count += 1
-                
-            except Exception as e:
-                print(f"Error importing row: {e}")
-                skipped_count += 1
-                continue
-        
-        db.session.commit()
-        
-        if imported_count > 0:
-            flash(f'成功导入 {imported_count} 条记录')
-        if skipped_count > 0:
-            flash(f'跳过 {skipped_count} 条无效记录')
-            
-    except Exception as e:
-        flash(f'导入失败: {str(e)}')
-        return redirect(url_for('admin'))
-    
-    return redirect(url_for('admin'))
+    on_duplicate = 'update' if request.form.get('on_duplicate') == 'update' else 'skip'
+    job = job_runner.submit(
+        'import',
+        current_user.id,
+        upload=file,
+        creator_id=current_user.id,
+        on_duplicate=on_duplicate,
+        batch_size=app.config['IMPORT_BATCH_SIZE']
+    )
+    return job_accepted(job, f'导入任务 #{job.id} 已提交，完成后结果会显示在任务列表中')
+
+@app.route('/admin/jobs/<int:id>')
+@login_required
+def job_status(id):
+    if not current_user.is_admin:
+        return jsonify({'error': '需要管理员权限'}), 403
+    job = Job.query.get_or_404(id)
+    status = job_to_dict(job)
+    if job.status == 'done' and job.output_path:
+        status['download_url'] = url_for('job_download', id=job.id)
+    return jsonify(status)
+
+@app.route('/admin/jobs/<int:id>/download')
+@login_required
+def job_download(id):
+    if not current_user.is_admin:
+        flash('需要管理员权限')
+        return redirect(url_for('index'))
+    job = Job.query.get_or_404(id)
+    if job.status != 'done' or not job.output_path or not os.path.exists(job.output_path):
+        abort(404)
+    return send_file(job.output_path, as_attachment=True,
+                     download_name=os.path.basename(job.output_path))
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Apply pending schema migrations to the database"""
+    for version in upgrade_schema():
+        print(f'Applied migration {version}')
+    with db.engine.connect() as connection:
+        print(f'Database schema is at version {schema_version(connection)}')
+        for name, value in pragma_values(connection).items():
+            print(f'  {name} = {value}')
+
+@app.cli.command('repair-counters')
+def repair_counters_command():
+    """Recompute denormalized comment counts, the field catalogue and hot scores"""
+    updated = repair_comment_counts()
+    print(f'Recounted comments for {updated} Impossible Trinities')
+    rebuild_catalogue(db.session.connection())
+    db.session.commit()
+    print(f'Rebuilt field catalogue ({len(field_catalogue())} fields)')
+    rescored = refresh_hot_scores(db.session.connection())
+    db.session.commit()
+    print(f'Rescored {rescored} hot scores')
+
+@app.cli.command('refresh-hot')
+def refresh_hot_command():
+    """Recompute every hot score from the agree and comment counters"""
+    rescored = refresh_hot_scores(db.session.connection())
+    db.session.commit()
+    page_cache.invalidate()
+    print(f'Rescored {rescored} Impossible Trinities')
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """Rebuild the full-text search index from the database"""
+    connection = db.session.connection()
+    if not ensure_index(connection):
+        print('FTS5 is not available in this SQLite build, search uses ILIKE')
+        return
+    rebuild_index(connection)
+    db.session.commit()
+    print(f'Indexed {ImpossibleTrinity.query.count()} Impossible Trinities')
+
+@app.cli.command('rebuild-related')
+def rebuild_related_command():
+    """Recompute every IT's related list from scratch and save the model web processes load"""
+    if not related_index.enabled:
+        print('NumPy/SciPy are not installed, related ITs are disabled')
+        return
+    count = related_index.rebuild(db.session.connection())
+    db.session.commit()
+    print(f'Computed related lists for {count} Impossible Trinities')
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static assets into static/dist"""
+    manifest = build_assets(app.static_folder)
+    asset_pipeline.load(app.static_folder)
+    for source, hashed in manifest.items():
+        print(f'{source} -> {hashed}')
+
+def warm_up():
+    """Build what each worker would otherwise build on its first requests"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    field_catalogue()
+    prepare_index()
+
+def create_app(workers=1):
+    """Production entry point (see wsgi.py and gunicorn.conf.py)
+
+    Routes are registered on the module-level ``app``; this only checks that
+    the schema is current (migrations are ``flask upgrade-db``, never part of
+    startup) and warms the process before workers are forked from it.
+    ``workers`` is the number of processes that will serve it; with more than
+    one, page caching needs ``PAGE_CACHE_URL`` and is off without it.
+    """
+    page_cache.require_shared(workers, app.logger)
+    with app.app_context():
+        check_schema()
+        warm_up()
+        # Forked workers must not share the master's SQLite connections
+        db.engine.dispose()
+    return app
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
     app.run(debug=True, port=5002)
@@ -0,0 +1,128 @@
+"""
+Fingerprinted, precompressed static assets
+
+``build_assets`` (``flask --app app build-assets``) copies every stylesheet
+and script under ``static/`` to ``static/dist/`` with a content hash in the
+filename, writes ``.gz`` and ``.br`` variants next to each copy, and records
+``source -> hashed name`` in ``static/dist/manifest.json``.
+
+With a manifest present, ``url_for('static', filename='css/style.css')``
+resolves to the hashed copy, so templates keep their usual calls. Hashed
+files can never change under the same URL, so they are served with a one-year
+``immutable`` Cache-Control and a repeat visitor does not request them again,
+not even to revalidate. The precompressed variant matching Accept-Encoding is
+sent as is, with no compression work per request.
+
+Without a manifest (a fresh checkout), or in debug mode, assets are served
+from their source paths by Flask's default handler.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from flask import current_app, send_from_directory
+
+from compression import accepted_encodings, brotli
+
+ASSET_EXTENSIONS = ('.css', '.js')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+# One year, the longest lifetime browsers honour
+ASSET_MAX_AGE = 365 * 24 * 3600
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def build_assets(static_folder):
+    """Write hashed and precompressed copies plus the manifest; returns the manifest"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            source = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            with open(os.path.join(root, name), 'rb') as f:
+                data = f.read()
+            hashed = f'{os.path.dirname(source)}/{stem}.{fingerprint(data)}{ext}'.lstrip('/')
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            # mtime=0 keeps the .gz bytes identical across builds
+            with open(target + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+            manifest[source] = f'{DIST_DIR}/{hashed}'
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetPipeline:
+    """Points ``url_for('static')`` at hashed copies and serves them immutable"""
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.hashed = frozenset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.load(app.static_folder)
+        app.url_defaults(self._hashed_filename)
+        self._send_static = app.view_functions['static']
+        app.view_functions['static'] = self.send_static
+
+    def load(self, static_folder):
+        """(Re)read the manifest; an absent manifest serves source files"""
+        try:
+            with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.hashed = frozenset(self.manifest.values())
+
+    def _hashed_filename(self, endpoint, values):
+        if endpoint != 'static' or current_app.debug:
+            return
+        hashed = self.manifest.get(values.get('filename'))
+        if hashed is not None:
+            values['filename'] = hashed
+
+    def send_static(self, filename):
+        if filename not in self.hashed:
+            return self._send_static(filename=filename)
+        mimetype = MIMETYPES[os.path.splitext(filename)[1]]
+        folder = current_app.static_folder
+        # The first accepted variant on disk: a build may lack some (no brotli module)
+        for encoding in accepted_encodings():
+            variant = filename + ENCODING_SUFFIXES[encoding]
+            if os.path.exists(os.path.join(folder, variant)):
+                response = send_from_directory(folder, variant, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(folder, filename, mimetype=mimetype,
+                                           max_age=ASSET_MAX_AGE)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+asset_pipeline = AssetPipeline()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Load test: POST /agree/<id> with and without write-behind batching
+
+Runs against a throwaway SQLite database. Each worker thread logs in as its
+own user and agrees with every item once, in random order, so all clicks are
+new agrees competing for the SQLite write lock; the script reports agrees/sec,
+p50/p99 latency and checks that no agree was lost or double-counted.
+
+Usage: python benchmarks/bench_agree.py [--threads 8] [--clicks 500] [--flush-ms 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp.name, 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from app import app
+from counters import agree_buffer
+from models import db, User, ImpossibleTrinity
+from schema import upgrade_schema
+
+PASSWORD_HASH = bcrypt.hashpw(b'bench', bcrypt.gensalt(4)).decode('utf-8')
+
+
+def setup(items):
+    with app.app_context():
+        upgrade_schema()
+        user = User(username='bench-owner', password_hash=PASSWORD_HASH)
+        db.session.add(user)
+        db.session.flush()
+        for i in range(items):
+            db.session.add(ImpossibleTrinity(
+                name=f'条目 {i}', field='基准', element1='a', element2='b', element3='c',
+                description='bench', creator_id=user.id
+            ))
+        db.session.commit()
+        return [it.id for it in ImpossibleTrinity.query.all()]
+
+
+def create_users(prefix, count):
+    with app.app_context():
+        for n in range(count):
+            db.session.add(User(username=f'{prefix}-{n}', password_hash=PASSWORD_HASH))
+        db.session.commit()
+
+
+def total_agrees():
+    with app.app_context():
+        return db.session.query(db.func.sum(ImpossibleTrinity.agree_count)).scalar() or 0
+
+
+def run(ids, threads, flush_ms):
+    agree_buffer.interval = flush_ms / 1000.0
+    prefix = f'bench-{flush_ms}'
+    create_users(prefix, threads)
+    before = total_agrees()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(n):
+        order = list(ids)
+        random.Random(n).shuffle(order)
+        client = app.test_client()
+        client.post('/login', data={'username': f'{prefix}-{n}', 'password': 'bench'})
+        mine = []
+        for it_id in order:
+            start = time.perf_counter()
+            response = client.post(f'/agree/{it_id}')
+            mine.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    agree_buffer.flush()
+
+    latencies.sort()
+    sent = threads * len(ids)
+    lost = sent - len(errors) - (total_agrees() - before)
+    label = f'write-behind {flush_ms}ms' if flush_ms else 'atomic UPDATE'
+    print(f'{label:<22}{sent / elapsed:>12.0f}'
+          f'{latencies[len(latencies) // 2] * 1000:>10.2f}'
+          f'{latencies[int(len(latencies) * 0.99)] * 1000:>10.2f}'
+          f'{len(errors):>8}{lost:>6}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clicks', type=int, default=500, help='items, i.e. agrees per user')
+    parser.add_argument('--flush-ms', type=int, default=50)
+    args = parser.parse_args()
+
+    ids = setup(args.clicks)
+    print(f'{args.threads} users x {args.clicks} items')
+    print(f'{"mode":<22}{"agrees/s":>12}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}{"lost":>6}')
+    run(ids, args.threads, 0)
+    run(ids, args.threads, args.flush_ms)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/its bytes per page and server CPU per request
+
+Fills a throwaway database with N rows (long descriptions and explanations,
+like real entries), then walks the whole feed page by page through the test
+client with each variant and reports average response bytes and CPU time per
+request. ``legacy`` is the old view reproduced as it was: full ORM rows, every
+text column serialized, no compression.
+
+Usage: python benchmarks/bench_api.py [N] [--per-page 20]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+_db_path = os.path.join(_tmp.name, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + _db_path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify, request
+
+from app import app, FEED_ORDER
+from compression import brotli
+from counters import live_agree_count
+from csvio import CSV_COLUMNS
+from models import db, ImpossibleTrinity
+from pagination import keyset_page
+from schema import upgrade_schema
+
+FIELDS = ['宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '社会学']
+WORDS = ['开放经济', '汇率', '资本', '自由流动', '货币政策', '独立性', '一致性', '可用性', '分区容错',
+         '成本', '质量', '进度', '安全', '效率', '公平', '稳定', '增长', '通胀', '就业', '目标',
+         '同时', '不可能', '实现', '其中', '两个', '国家', '系统', '约束', '权衡', '选择']
+
+
+def text(rng, words):
+    return '，'.join(''.join(rng.choice(WORDS) for _ in range(4)) for _ in range(words // 4)) + '。'
+
+CARD_FIELDS = ('id,name,field,element1,element2,element3,element1_sacrifice_explanation,'
+               'element2_sacrifice_explanation,element3_sacrifice_explanation,'
+               'description_preview,agree_count,agreed,comments_count')
+TABLE_FIELDS = 'id,name,field,element1,element2,element3,agree_count,comments_count,created_at'
+
+
+@app.route('/bench/legacy-its')
+def legacy_its():
+    its, next_cursor = keyset_page(ImpossibleTrinity.query, FEED_ORDER,
+                                   request.args.get('cursor'), request.args.get('per_page', 12, type=int))
+    items = [{
+        'id': it.id, 'name': it.name, 'field': it.field,
+        'element1': it.element1, 'element2': it.element2, 'element3': it.element3,
+        'description': it.description, 'agree_count': live_agree_count(it), 'agreed': False,
+        'comments_count': it.comments_count,
+        'element1_sacrifice_explanation': it.element1_sacrifice_explanation,
+        'element2_sacrifice_explanation': it.element2_sacrifice_explanation,
+        'element3_sacrifice_explanation': it.element3_sacrifice_explanation,
+        'created_at': it.created_at.isoformat(),
+    } for it in its]
+    return jsonify({'items': items, 'has_more': next_cursor is not None, 'next_cursor': next_cursor})
+
+
+def fill(n):
+    rng = random.Random(5)
+    columns = CSV_COLUMNS + ['created_at', 'updated_at', 'agree_count', 'comments_count', 'creator_id']
+    conn = sqlite3.connect(_db_path)
+    conn.executemany(
+        'INSERT INTO impossible_trinity (%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns))),
+        ((f'不可能三角 {i}', 'Impossible Trinity', rng.choice(FIELDS), '元素一', '元素二', '元素三',
+          text(rng, 160), None, None, None, None, None, text(rng, 40), text(rng, 40), text(rng, 40),
+          f'2024-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}', '2024-01-01 00:00:00',
+          rng.randint(0, 50), rng.randint(0, 10), 1) for i in range(n))
+    )
+    conn.commit()
+    conn.close()
+
+
+def walk(client, path, params, encoding):
+    """Fetch every page; returns (requests, total bytes, cpu seconds)"""
+    cursor, pages, size, cpu = None, 0, 0, 0.0
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        start = time.process_time()
+        response = client.get(path, query_string=query, headers={'Accept-Encoding': encoding})
+        cpu += time.process_time() - start
+        pages += 1
+        size += len(response.data)
+        cursor = json.loads(decode(response))['next_cursor']
+        if not cursor:
+            return pages, size, cpu
+
+
+def decode(response):
+    coding = response.headers.get('Content-Encoding')
+    if coding == 'br':
+        return brotli.decompress(response.data)
+    if coding == 'gzip':
+        return gzip.decompress(response.data)
+    return response.data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('rows', type=int, nargs='?', default=5000)
+    parser.add_argument('--per-page', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade_schema()
+        db.engine.dispose()
+    fill(args.rows)
+
+    variants = [
+        ('legacy', '/bench/legacy-its', {}, 'identity'),
+        ('all fields', '/api/its', {}, 'identity'),
+        ('all fields gzip', '/api/its', {}, 'gzip'),
+        ('cards gzip', '/api/its', {'fields': CARD_FIELDS}, 'gzip'),
+        ('table', '/api/its', {'fields': TABLE_FIELDS}, 'identity'),
+        ('table gzip', '/api/its', {'fields': TABLE_FIELDS}, 'gzip'),
+    ]
+    if brotli is not None:
+        variants += [
+            ('cards br', '/api/its', {'fields': CARD_FIELDS}, 'br'),
+            ('table br', '/api/its', {'fields': TABLE_FIELDS}, 'br'),
+        ]
+
+    client = app.test_client()
+    print(f'{args.rows:,} rows, {args.per_page} per page')
+    print(f'{"variant":<18}{"bytes/page":>12}{"cpu ms/req":>12}')
+    for label, path, params, encoding in variants:
+        pages, size, cpu = walk(client, path, dict(params, per_page=args.per_page), encoding)
+        print(f'{label:<18}{size / pages:>12.0f}{cpu / pages * 1000:>12.2f}')
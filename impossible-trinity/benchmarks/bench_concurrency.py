@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark: read concurrency while a writer is active, rollback journal vs. WAL
+
+Builds a throwaway database with N rows, copies it once per storage profile,
+then runs reader threads issuing the feed and field-filter queries while one
+writer thread keeps committing small transactions (agree bumps plus an
+insert). Reports reads/s, read latency percentiles, reads that failed with
+"database is locked" and the writer's commit rate.
+
+* legacy -- what the app used before: rollback journal, synchronous=FULL and
+            the driver's default 5 s lock timeout
+* wal    -- storage.DEFAULT_PRAGMAS
+
+Usage: python benchmarks/bench_concurrency.py [N] [--readers 8] [--seconds 5]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+_db_path = os.path.join(_tmp.name, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + _db_path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import app
+from models import db
+from csvio import CSV_COLUMNS
+from schema import upgrade_schema
+from storage import DEFAULT_PRAGMAS, SQLiteStorage
+
+FIELDS = ['宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '社会学']
+FILLER = '在开放经济中，一个国家不可能同时实现这三个目标，最多只能同时实现其中的两个。'
+
+PROFILES = {
+    'legacy': {'busy_timeout': 5000, 'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'wal': DEFAULT_PRAGMAS,
+}
+
+FEED = text(
+    'SELECT id, name, field, element1, element2, element3, agree_count, comments_count '
+    'FROM impossible_trinity ORDER BY created_at DESC, id DESC LIMIT 12'
+)
+BY_FIELD = text(
+    'SELECT id, name, field, element1, element2, element3, agree_count, comments_count '
+    'FROM impossible_trinity WHERE field = :field ORDER BY created_at DESC, id DESC LIMIT 12'
+)
+BUMP = text('UPDATE impossible_trinity SET agree_count = agree_count + 1 WHERE id = :id')
+INSERT = text(
+    "INSERT INTO impossible_trinity (name, field, element1, element2, element3, description, "
+    "created_at, updated_at, agree_count, comments_count, creator_id) "
+    "VALUES (:name, :field, 'a', 'b', 'c', :description, datetime('now'), datetime('now'), 0, 0, 1)"
+)
+
+
+def fill(n):
+    rng = random.Random(3)
+    columns = CSV_COLUMNS + ['created_at', 'updated_at', 'agree_count', 'comments_count', 'creator_id']
+    sql = 'INSERT INTO impossible_trinity (%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns)))
+    conn = sqlite3.connect(_db_path)
+    conn.executemany(sql, (
+        (f'不可能三角 {i}', 'Impossible Trinity', rng.choice(FIELDS), '元素一', '元素二', '元素三',
+         FILLER * 3, None, None, None, None, None, FILLER, FILLER, FILLER,
+         f'2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}', '2024-01-01 00:00:00', 0, 0, 1)
+        for i in range(n)
+    ))
+    conn.commit()
+    conn.close()
+
+
+def run(profile, n, readers, seconds):
+    path = os.path.join(_tmp.name, f'{profile}.db')
+    shutil.copy(_db_path, path)
+    # timeout=0: the pragmas alone decide how long a connection waits for a lock
+    engine = create_engine('sqlite:///' + path, connect_args={'timeout': 0}, pool_size=readers + 1)
+    SQLiteStorage(PROFILES[profile]).install(engine)
+
+    stop = threading.Event()
+    latencies = []
+    failed = [0]
+    commits = [0]
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        mine, errors = [], 0
+        with engine.connect() as connection:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    if rng.random() < 0.5:
+                        connection.execute(FEED).fetchall()
+                    else:
+                        connection.execute(BY_FIELD, {'field': rng.choice(FIELDS)}).fetchall()
+                    mine.append(time.perf_counter() - start)
+                except OperationalError:
+                    errors += 1
+                connection.rollback()
+        with lock:
+            latencies.extend(mine)
+            failed[0] += errors
+
+    def writer():
+        rng = random.Random(0)
+        while not stop.is_set():
+            try:
+                with engine.begin() as connection:
+                    connection.execute(BUMP, [{'id': rng.randint(1, n)} for _ in range(50)])
+                    connection.execute(INSERT, {'name': 'writer', 'field': rng.choice(FIELDS),
+                                                'description': FILLER * 10})
+                commits[0] += 1
+            except OperationalError:
+                pass
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0
+    print(f'{profile:<8}{len(latencies) / seconds:>10.0f}{pct(0.5):>9.2f}{pct(0.99):>9.2f}'
+          f'{(latencies[-1] * 1000 if latencies else 0):>9.1f}{failed[0]:>9}{commits[0] / seconds:>10.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('rows', type=int, nargs='?', default=50000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade_schema()
+        db.engine.dispose()
+    # Leave the template in rollback-journal mode so both copies start equal
+    conn = sqlite3.connect(_db_path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+    fill(args.rows)
+
+    print(f'{args.rows:,} rows, {args.readers} readers + 1 writer, {args.seconds:g}s each')
+    print(f'{"profile":<8}{"reads/s":>10}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}{"locked":>9}{"writes/s":>10}')
+    for profile in PROFILES:
+        run(profile, args.rows, args.readers, args.seconds)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming CSV export vs. the old build-everything-in-memory export
+
+Fills a throwaway SQLite database with N rows, then runs both export paths and
+reports wall time, output size and peak Python heap (tracemalloc). The legacy
+path is reproduced here as it was: ``query.all()`` -> StringIO -> BytesIO.
+
+Usage: python benchmarks/bench_export.py [N ...]   (default: 100000 1000000)
+"""
+
+import csv
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_tmp = tempfile.TemporaryDirectory()
+_db_path = os.path.join(_tmp.name, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + _db_path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from csvio import CSV_COLUMNS, iter_csv_bytes, iter_export_batches
+from models import db, ImpossibleTrinity
+from schema import upgrade_schema
+
+FIELDS = ['宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '社会学']
+FILLER = '在开放经济中，一个国家不可能同时实现这三个目标，最多只能同时实现其中的两个。'
+
+
+def fill(n):
+    """Insert rows straight through sqlite3; returns the total row count"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(_db_path)
+    (current,) = conn.execute('SELECT count(*) FROM impossible_trinity').fetchone()
+    rows = []
+    for i in range(current, n):
+        rows.append((
+            f'不可能三角 {i}', 'Impossible Trinity', rng.choice(FIELDS),
+            '元素一', '元素二', '元素三', FILLER * 4,
+            f'https://example.org/{i}', None, None, None, None,
+            FILLER, FILLER, FILLER,
+            '2024-01-01 00:00:00', '2024-01-01 00:00:00', 0, 0, 1,
+        ))
+        if len(rows) == 20000:
+            _insert(conn, rows)
+            rows = []
+    _insert(conn, rows)
+    conn.commit()
+    conn.close()
+
+
+def _insert(conn, rows):
+    if rows:
+        columns = CSV_COLUMNS + ['created_at', 'updated_at', 'agree_count', 'comments_count', 'creator_id']
+        conn.executemany(
+            'INSERT INTO impossible_trinity (%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns))),
+            rows
+        )
+
+
+def legacy_export():
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS)
+    for it in ImpossibleTrinity.query.all():
+        writer.writerow([getattr(it, c) or '' for c in CSV_COLUMNS])
+    output.seek(0)
+    return len(io.BytesIO(output.getvalue().encode('utf-8-sig')).getvalue())
+
+
+def streaming_export(compress=False):
+    return sum(len(chunk) for chunk in iter_csv_bytes(iter_export_batches(), compress=compress))
+
+
+def measure(label, fn):
+    with app.app_context():
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db.session.remove()
+    print(f'{label:<18}{elapsed:>10.2f}{size / 1e6:>12.1f}{peak / 1e6:>14.1f}')
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [100000, 1000000]
+    with app.app_context():
+        upgrade_schema()
+    for n in sizes:
+        fill(n)
+        print(f'\n== {n:,} rows ==')
+        print(f'{"path":<18}{"seconds":>10}{"output MB":>12}{"peak heap MB":>14}')
+        measure('legacy', legacy_export)
+        measure('streaming', streaming_export)
+        measure('streaming+gzip', lambda: streaming_export(compress=True))
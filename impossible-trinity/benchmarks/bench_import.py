@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk CSV import vs. the old one-ORM-object-per-row import
+
+Writes an N-row CSV (default 100000) to a temp file, imports it into an empty
+throwaway database with the legacy path (session.add per row, one commit),
+empties the tables, imports it again with csvio.import_rows, and finally
+re-imports the same file to show that duplicates are skipped.
+
+Usage: python benchmarks/bench_import.py [N] [--batch-size 1000]
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp.name, 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from csvio import CSV_COLUMNS, import_rows
+from models import db, User, ImpossibleTrinity
+from schema import upgrade_schema
+
+FIELDS = ['宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '社会学']
+FILLER = '在开放经济中，一个国家不可能同时实现这三个目标，最多只能同时实现其中的两个。'
+
+
+def write_csv(path, n):
+    rng = random.Random(11)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(n):
+            writer.writerow([
+                f'不可能三角 {i}', 'Impossible Trinity', rng.choice(FIELDS),
+                '元素一', '元素二', '元素三', FILLER * 3,
+                f'https://example.org/{i}', '', '', '', '',
+                FILLER, FILLER, FILLER,
+            ])
+
+
+def legacy_import(path, creator_id):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            db.session.add(ImpossibleTrinity(
+                creator_id=creator_id,
+                **{c: (row.get(c, '') or None) if 'url' in c or 'explanation' in c or c == 'hyperlink'
+                   else row.get(c, '') for c in CSV_COLUMNS}
+            ))
+    db.session.commit()
+
+
+def reset():
+    for table in ('impossible_trinity', 'field', 'it_search'):
+        db.session.execute(db.text(f'DELETE FROM {table}'))
+    db.session.commit()
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<26}{elapsed:>10.2f}{n / elapsed:>12.0f}   {result or ""}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('rows', type=int, nargs='?', default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    path = os.path.join(_tmp.name, 'import.csv')
+    write_csv(path, args.rows)
+
+    def bulk():
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            return import_rows(f, creator_id, batch_size=args.batch_size).as_dict()
+
+    with app.app_context():
+        upgrade_schema()
+        user = User(username='bench', password_hash='-', is_admin=True)
+        db.session.add(user)
+        db.session.commit()
+        creator_id = user.id
+
+        print(f'{args.rows:,} rows, batch size {args.batch_size}')
+        print(f'{"path":<26}{"seconds":>10}{"rows/s":>12}')
+        timed('legacy ORM', args.rows, lambda: legacy_import(path, creator_id))
+        reset()
+        timed('bulk import', args.rows, bulk)
+        timed('bulk re-import (dedup)', args.rows, bulk)
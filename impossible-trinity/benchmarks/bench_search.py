@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: FTS5 search index vs. the old seven-column ILIKE scan
+
+Generates N synthetic Impossible Trinities into a temporary SQLite file,
+builds the it_search index with the same tokenizer the app uses, then times
+the first result page (12 rows + total count) for a set of queries.
+
+Usage: python benchmarks/bench_search.py [N ...]   (default: 10000 100000 1000000)
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SEARCH_COLUMNS, SEARCH_WEIGHTS, build_match, tokenize
+
+FIELDS = ['宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '社会学', '物理学', '机器学习']
+WORDS = ['一致性', '可用性', '分区容错性', '资本自由流动', '固定汇率', '独立的货币政策',
+         '时间', '成本', '范围', '机密性', '完整性', '延迟', '吞吐量', '准确性',
+         'consistency', 'availability', 'latency', 'throughput', 'privacy', 'security']
+QUERIES = ['一致性', '货币', '资', 'latency', 'trilemma', '不存在的词']
+
+PAGE_SIZE = 12
+ILIKE_SQL = (
+    'SELECT id FROM impossible_trinity WHERE '
+    + ' OR '.join('%s LIKE :p' % c for c in SEARCH_COLUMNS)
+    + ' ORDER BY created_at DESC LIMIT %d' % PAGE_SIZE
+)
+ILIKE_COUNT_SQL = (
+    'SELECT count(*) FROM impossible_trinity WHERE '
+    + ' OR '.join('%s LIKE :p' % c for c in SEARCH_COLUMNS)
+)
+FTS_SQL = (
+    'SELECT rowid FROM it_search WHERE it_search MATCH :m ORDER BY bm25(it_search, %s) LIMIT %d'
+    % (', '.join(str(w) for w in SEARCH_WEIGHTS), PAGE_SIZE)
+)
+FTS_COUNT_SQL = 'SELECT count(*) FROM it_search WHERE it_search MATCH :m'
+
+
+def generate(conn, n, rng):
+    conn.execute(
+        'CREATE TABLE impossible_trinity (id INTEGER PRIMARY KEY, %s, created_at TEXT)'
+        % ', '.join(SEARCH_COLUMNS)
+    )
+    conn.execute(
+        'CREATE VIRTUAL TABLE it_search USING fts5(%s, tokenize = \'unicode61\')'
+        % ', '.join(SEARCH_COLUMNS)
+    )
+    batch = []
+    for i in range(1, n + 1):
+        elements = rng.sample(WORDS, 3)
+        row = (
+            i,
+            '%s与%s的权衡 #%d' % (elements[0], elements[1], i),
+            'Trilemma %d' % i,
+            rng.choice(FIELDS),
+            elements[0], elements[1], elements[2],
+            '在%s中，%s、%s和%s不可兼得。' % (rng.choice(FIELDS), *elements) + ' '.join(rng.sample(WORDS, 5)),
+            '2024-01-01 00:00:%09d' % i,
+        )
+        batch.append(row)
+        if len(batch) == 10000 or i == n:
+            conn.executemany('INSERT INTO impossible_trinity VALUES (%s)' % ', '.join('?' * 9), batch)
+            conn.executemany(
+                'INSERT INTO it_search (rowid, %s) VALUES (%s)' % (', '.join(SEARCH_COLUMNS), ', '.join('?' * 8)),
+                [(r[0], *(' '.join(tokenize(v)) for v in r[1:8])) for r in batch]
+            )
+            batch = []
+    conn.commit()
+
+
+def timed(conn, sql, params, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(n):
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        start = time.perf_counter()
+        generate(conn, n, rng)
+        print(f'\n== {n:,} rows (generated + indexed in {time.perf_counter() - start:.1f}s) ==')
+        print(f'{"query":<12}{"ILIKE ms":>12}{"FTS ms":>12}{"speedup":>10}')
+        repeat = 3 if n >= 1000000 else 5
+        for q in QUERIES:
+            like = timed(conn, ILIKE_SQL, {'p': f'%{q}%'}, repeat)
+            like += timed(conn, ILIKE_COUNT_SQL, {'p': f'%{q}%'}, repeat)
+            fts = timed(conn, FTS_SQL, {'m': build_match(q)}, repeat)
+            fts += timed(conn, FTS_COUNT_SQL, {'m': build_match(q)}, repeat)
+            print(f'{q:<12}{like:>12.2f}{fts:>12.2f}{like / fts:>9.1f}x')
+        conn.close()
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request throughput, dev server vs. gunicorn
+
+Fills a throwaway database with N rows, then starts each server in turn on
+the same machine and drives it with C keep-alive client threads for S
+seconds over a mix of the public pages and the feed API. Reports requests/s,
+latency percentiles and failed requests.
+
+* dev      -- ``app.run(debug=True)`` as ``python app.py`` starts it
+              (reloader off so it can be stopped)
+* gunicorn -- ``gunicorn -c gunicorn.conf.py wsgi:app`` with its defaults
+
+Usage: python benchmarks/bench_server.py [N] [--clients 16] [--seconds 10]
+"""
+
+import argparse
+import http.client
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_tmp = tempfile.TemporaryDirectory()
+_db_path = os.path.join(_tmp.name, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + _db_path
+sys.path.insert(0, ROOT)
+
+from app import app
+from csvio import CSV_COLUMNS
+from models import db
+from schema import upgrade_schema
+
+FIELDS = ['宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '社会学']
+FILLER = '在开放经济中，一个国家不可能同时实现这三个目标，最多只能同时实现其中的两个。'
+PORT = 8765
+
+SERVERS = {
+    'dev': [sys.executable, '-c',
+            f'from app import app; app.run(debug=True, use_reloader=False, port={PORT})'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                 '--bind', f'127.0.0.1:{PORT}', 'wsgi:app'],
+}
+
+
+def fill(n):
+    rng = random.Random(3)
+    columns = CSV_COLUMNS + ['created_at', 'updated_at', 'agree_count', 'comments_count', 'creator_id']
+    conn = sqlite3.connect(_db_path)
+    conn.executemany(
+        'INSERT INTO impossible_trinity (%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns))),
+        ((f'不可能三角 {i}', 'Impossible Trinity', rng.choice(FIELDS), '元素一', '元素二', '元素三',
+          FILLER * 8, None, None, None, None, None, FILLER, FILLER, FILLER,
+          f'2024-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}', '2024-01-01 00:00:00',
+          rng.randint(0, 50), 0, 1) for i in range(n))
+    )
+    conn.commit()
+    conn.close()
+
+
+def paths(rng, n):
+    """An endless mix of page and API requests"""
+    while True:
+        roll = rng.random()
+        if roll < 0.3:
+            yield '/'
+        elif roll < 0.45:
+            yield '/?field=' + rng.choice(['%E6%95%B0%E6%8D%AE%E5%BA%93', '%E7%A4%BE%E4%BC%9A%E5%AD%A6'])
+        elif roll < 0.75:
+            yield f'/detail/{rng.randint(1, n)}'
+        else:
+            yield '/api/its?per_page=12&fields=id,name,field,agree_count'
+
+
+def wait_ready(process):
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            conn.request('GET', '/api/fields')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def load(n, clients, seconds):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop = time.time() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+        mine = []
+        for path in paths(rng, n):
+            if time.time() >= stop:
+                break
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise OSError(response.status)
+                mine.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), errors[0]
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float('nan')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('rows', type=int, nargs='?', default=5000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    with app.app_context():
+        upgrade_schema()
+        db.engine.dispose()
+    fill(args.rows)
+
+    print(f'{args.rows:,} rows, {args.clients} clients, {args.seconds:g} s, {os.cpu_count()} CPUs')
+    print(f'{"server":<10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for label, command in SERVERS.items():
+        process = subprocess.Popen(command, cwd=ROOT, env=os.environ.copy(),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(process)
+            latencies, errors = load(args.rows, args.clients, args.seconds)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+        print(f'{label:<10}{len(latencies) / args.seconds:>10.0f}{pct(latencies, 0.5):>10.1f}'
+              f'{pct(latencies, 0.99):>10.1f}{errors:>8}')
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator: users, ITs, comments and agrees at production scale
+
+Writes a fresh database: the schema comes from the app (so it is stamped at
+the latest migration), the rows are bulk-loaded straight through sqlite3 with
+``executemany`` in one transaction, and the derived data (hot scores, field
+catalogue, full-text index) is built once at the end; the related lists,
+whose batch build dominates at scale, only with ``--related`` (otherwise run
+``flask rebuild-related`` later). The output depends only on the arguments
+and ``--seed``.
+
+Distributions are skewed like real traffic: fields and creators follow a
+Zipf law, a few popular ITs collect most agrees and comments, and a few
+active users write most comments. User 1 is ``admin``; every account's
+password is ``PASSWORD``.
+
+Usage: python benchmarks/datagen.py DATABASE [--users 1000] [--its 10000]
+           [--comments 50000] [--agrees 100000] [--seed 1] [--related]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'bench'
+EPOCH = datetime(2025, 1, 1)
+
+# (field, relative popularity rank); weights follow Zipf over this order
+FIELDS = [
+    '宏观经济学', '分布式系统', '项目管理', '信息安全', '数据库', '国际金融', '软件工程',
+    '机器学习', '社会学', '政治学', '产品设计', '供应链', '计算机网络', '投资学', '公共政策',
+    '城市规划', '医疗管理', '教育', '能源', '法学', '心理学', '新闻传播', '物理学', '哲学',
+]
+TOPICS = ['开放经济', '一致性', '可用性', '成本', '质量', '进度', '安全', '效率', '公平', '稳定',
+          '增长', '通胀', '就业', '隐私', '速度', '规模', '灵活性', '透明度', '自由', '秩序']
+PHRASES = ['在开放经济中', '一个系统不可能同时满足这三个目标', '最多只能同时实现其中的两个',
+           '这是长期实践中反复验证的权衡', '决策者必须明确取舍', '放弃其中之一换取另外两者',
+           '短期内可以掩盖矛盾', '但长期看约束始终存在', '不同国家的选择各不相同',
+           '技术进步可以放宽约束', '却无法彻底消除它', '典型案例包括', '资本自由流动',
+           '固定汇率', '货币政策独立性', '分区容错', '强一致性', '高可用']
+COMMENTS = ['很有启发', '这个例子不太准确', '补充一个反例', '我们团队也遇到过', '同意第二点',
+            '能否给出参考文献', '讲得很清楚', '第三个元素的解释值得商榷', '收藏了', '经典']
+
+
+def zipf_weights(n, s=1.1):
+    """Cumulative Zipf weights for ``random.choices(cum_weights=...)``"""
+    return list(itertools.accumulate(1.0 / (i + 1) ** s for i in range(n)))
+
+
+def text(rng, low, high):
+    parts = []
+    while sum(map(len, parts)) < rng.randint(low, high):
+        parts.append(rng.choice(PHRASES))
+    return '，'.join(parts) + '。'
+
+
+def fmt(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def generate(path, users=1000, its=10000, comments=50000, agrees=100000, seed=1, related=False,
+             log=print):
+    """Create ``path`` (which must not exist) and fill it; returns row counts"""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(path)
+    # The app binds its engine to DATABASE_URL when first imported
+    import bcrypt
+    from app import app
+    from catalogue import rebuild_catalogue
+    from models import db
+    from ranking import refresh_hot_scores
+    from related import related_index
+    from schema import upgrade_schema
+    from search import ensure_index
+
+    with app.app_context():
+        upgrade_schema()
+        db.engine.dispose()
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+    user_ids = range(1, users + 1)
+    it_ids = range(1, its + 1)
+
+    # Who is active and what is popular: random permutations ranked by Zipf
+    creators = rng.sample(user_ids, len(user_ids))
+    commenters = rng.sample(user_ids, len(user_ids))
+    popular = rng.sample(it_ids, len(it_ids))
+    user_weights = zipf_weights(users)
+    it_weights = zipf_weights(its, s=0.9)
+
+    # ITs in creation order over the year before EPOCH
+    span = 365 * 24 * 3600
+    created = sorted(EPOCH - timedelta(seconds=rng.random() * span) for _ in it_ids)
+
+    agree_pairs = set()
+    target = min(agrees, users * its)
+    while len(agree_pairs) < target:
+        batch = target - len(agree_pairs)
+        agree_pairs.update(zip(
+            rng.choices(user_ids, k=batch),
+            rng.choices(popular, cum_weights=it_weights, k=batch),
+        ))
+    agree_counts = Counter(it_id for _, it_id in agree_pairs)
+
+    comment_rows = []
+    for it_id, user_id in zip(rng.choices(popular, cum_weights=it_weights, k=comments),
+                              rng.choices(commenters, cum_weights=user_weights, k=comments)):
+        moment = created[it_id - 1] + timedelta(seconds=rng.random() * 30 * 24 * 3600)
+        comment_rows.append((rng.choice(COMMENTS) + '：' + text(rng, 10, 80), fmt(moment), it_id, user_id))
+    comment_counts = Counter(row[2] for row in comment_rows)
+
+    field_weights = zipf_weights(len(FIELDS))
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            'INSERT INTO user (id, username, password_hash, is_admin, created_at) VALUES (?, ?, ?, ?, ?)',
+            ((i, 'admin' if i == 1 else f'user{i:05d}', password_hash, i == 1,
+              fmt(EPOCH - timedelta(days=400) + timedelta(minutes=i))) for i in user_ids)
+        )
+        conn.executemany(
+            'INSERT INTO impossible_trinity (id, name, name_en, field, element1, element2, element3, '
+            'description, element1_sacrifice_explanation, element2_sacrifice_explanation, '
+            'element3_sacrifice_explanation, created_at, updated_at, agree_count, comments_count, '
+            'creator_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((i, f'{rng.choice(TOPICS)}{rng.choice(TOPICS)}不可能三角 #{i}', 'Impossible Trinity',
+              rng.choices(FIELDS, cum_weights=field_weights)[0],
+              *rng.sample(TOPICS, 3), text(rng, 120, 480),
+              text(rng, 30, 120), text(rng, 30, 120), text(rng, 30, 120),
+              fmt(created[i - 1]), fmt(created[i - 1]), agree_counts[i], comment_counts[i],
+              rng.choices(creators, cum_weights=user_weights)[0]) for i in it_ids)
+        )
+        conn.executemany(
+            'INSERT INTO comment (content, created_at, it_id, user_id) VALUES (?, ?, ?, ?)',
+            comment_rows
+        )
+        conn.executemany(
+            'INSERT INTO agree (user_id, it_id, created_at) VALUES (?, ?, ?)',
+            ((user_id, it_id, fmt(created[it_id - 1])) for user_id, it_id in agree_pairs)
+        )
+    conn.close()
+    loaded = time.perf_counter()
+
+    with app.app_context():
+        connection = db.session.connection()
+        rebuild_catalogue(connection)
+        refresh_hot_scores(connection)
+        ensure_index(connection)
+        if related and related_index.enabled:
+            related_index.rebuild(connection)
+        db.session.commit()
+        db.engine.dispose()
+
+    counts = {'users': users, 'its': its, 'comments': len(comment_rows), 'agrees': len(agree_pairs)}
+    log(f'{path}: ' + ', '.join(f'{v:,} {k}' for k, v in counts.items())
+        + f' (rows {loaded - started:.1f}s, derived data {time.perf_counter() - loaded:.1f}s)')
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('database')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--its', type=int, default=10000)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--agrees', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--related', action='store_true', help='also build the related lists')
+    args = parser.parse_args()
+    generate(args.database, args.users, args.its, args.comments, args.agrees, args.seed, args.related)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Load test: throughput and latency percentiles for every route, with a baseline
+
+Generates a database with datagen.py, then drives each scenario below through
+the app's test client from ``--threads`` concurrent sessions (each logged in
+as a different generated user; admin scenarios as ``admin``) and reports
+requests/s and p50/p95/p99 latency per scenario.
+
+Comparing with a baseline is opt-in, since timings only mean something on the
+machine that recorded them. ``--save-baseline FILE`` records the results
+together with the host name; ``--baseline FILE`` compares with such a file and
+exits non-zero when a scenario's p95 grew, or its throughput fell, by more than
+``--tolerance`` (50% by default: tail latencies of a few hundred requests on a
+shared machine easily move by a third between identical runs). A baseline
+recorded on another host is refused.
+
+Usage: python benchmarks/loadtest.py [--its 5000] [--users 500] [--threads 8]
+           [--requests 200] [--routes index_card,detail] [--no-page-cache]
+           [--baseline FILE | --save-baseline FILE] [--tolerance 0.5]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import datagen
+
+OK = (200, 201, 202, 302)
+
+
+# Scenarios: fn(client, rng, ctx) -> response; admin ones run as admin
+def index_card(client, rng, ctx):
+    return client.get('/')
+
+
+def index_table(client, rng, ctx):
+    return client.get('/?view=table')
+
+
+def index_field(client, rng, ctx):
+    return client.get('/', query_string={'field': rng.choice(datagen.FIELDS[:12])})
+
+
+def index_q(client, rng, ctx):
+    return client.get('/', query_string={'q': rng.choice(datagen.TOPICS)})
+
+
+def index_hot(client, rng, ctx):
+    return client.get('/', query_string={'sort': rng.choice(['hot', 'top'])})
+
+
+def _scroll(client, rng, ctx, sort):
+    # A scroll session: the first page, then a few pages deeper
+    cursor = ctx.setdefault('cursor', {}).get((sort, id(client)))
+    response = client.get('/api/its', query_string=dict(
+        per_page=12, fields='id,name,field,description_preview,agree_count,agreed,comments_count',
+        sort=sort, **({'cursor': cursor} if cursor else {})
+    ))
+    next_cursor = response.get_json().get('next_cursor')
+    ctx['cursor'][(sort, id(client))] = next_cursor if next_cursor and rng.random() < 0.8 else None
+    return response
+
+
+def api_its(client, rng, ctx):
+    return _scroll(client, rng, ctx, 'new')
+
+
+def api_its_hot(client, rng, ctx):
+    return _scroll(client, rng, ctx, 'hot')
+
+
+def detail(client, rng, ctx):
+    return client.get(f'/detail/{ctx["popular"](rng)}')
+
+
+def agree_it(client, rng, ctx):
+    return client.post(f'/agree/{rng.randint(1, ctx["its"])}')
+
+
+def add_comment(client, rng, ctx):
+    return client.post(f'/comment/{ctx["popular"](rng)}',
+                       data={'content': rng.choice(datagen.COMMENTS)})
+
+
+def api_comments(client, rng, ctx):
+    return client.get(f'/api/its/{ctx["popular"](rng)}/comments')
+
+
+def post_comment(client, rng, ctx):
+    # The detail page's AJAX path: JSON in, one rendered comment out
+    return client.post(f'/api/its/{ctx["popular"](rng)}/comments',
+                       json={'content': rng.choice(datagen.COMMENTS)})
+
+
+def admin(client, rng, ctx):
+    return client.get('/admin')
+
+
+def admin_grid(client, rng, ctx):
+    return client.get('/admin/grid', query_string={'sort': rng.choice(['created_at', 'agree_count', 'name']),
+                                                   'per_page': 200})
+
+
+def _wait_job(client, response):
+    status_url = response.get_json()['status_url']
+    while True:
+        status = client.get(status_url).get_json()
+        if status['status'] in ('done', 'failed'):
+            if status['status'] == 'failed':
+                raise RuntimeError(status['error'])
+            return response
+        time.sleep(0.02)
+
+
+def export(client, rng, ctx):
+    """Submit an export job and wait until its file is written"""
+    response = client.post('/admin/export', headers={'Accept': 'application/json'})
+    return _wait_job(client, response)
+
+
+def import_csv(client, rng, ctx):
+    """Upload 200 new rows and wait until the import job committed them"""
+    batch = ctx.setdefault('imports', [0])
+    with ctx['lock']:
+        batch[0] += 1
+        number = batch[0]
+    lines = ['name,name_en,field,element1,element2,element3,description']
+    lines += [f'导入三角 {number}-{i},Impossible Trinity,{rng.choice(datagen.FIELDS)},甲,乙,丙,'
+              f'{datagen.text(rng, 60, 200)}' for i in range(200)]
+    data = {'file': (io.BytesIO('\n'.join(lines).encode('utf-8')), f'bench{number}.csv')}
+    response = client.post('/admin/import', data=data, headers={'Accept': 'application/json'},
+                           content_type='multipart/form-data')
+    return _wait_job(client, response)
+
+
+# name -> (fn, runs as admin, share of --requests)
+SCENARIOS = {
+    'index_card': (index_card, False, 1),
+    'index_table': (index_table, False, 1),
+    'index_field': (index_field, False, 1),
+    'index_q': (index_q, False, 1),
+    'index_hot': (index_hot, False, 1),
+    'api_its': (api_its, False, 1),
+    'api_its_hot': (api_its_hot, False, 1),
+    'detail': (detail, False, 1),
+    'agree_it': (agree_it, False, 1),
+    'add_comment': (add_comment, False, 1),
+    'api_comments': (api_comments, False, 1),
+    'post_comment': (post_comment, False, 1),
+    'admin': (admin, True, 0.25),
+    'admin_grid': (admin_grid, True, 0.5),
+    'export': (export, True, 0.05),
+    'import': (import_csv, True, 0.05),
+}
+
+
+def login(app, username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': datagen.PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'login failed for {username}')
+    return client
+
+
+def run(app, fn, clients, total, ctx):
+    """Issue ``total`` calls of ``fn`` from len(clients) threads; returns (latencies, errors, seconds)"""
+    remaining = [total]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(client, seed):
+        rng = random.Random(seed)
+        mine = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                response = fn(client, rng, ctx)
+                if response.status_code not in OK:
+                    raise RuntimeError(f'HTTP {response.status_code}')
+                mine.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(c, i)) for i, c in enumerate(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), errors, time.perf_counter() - started
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float('nan')
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for scenarios that got slower than the baseline"""
+    failures = []
+    for name, result in results.items():
+        base = baseline.get('routes', {}).get(name)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            failures.append(f'{name}: p95 {result["p95_ms"]:.1f} ms vs baseline {base["p95_ms"]:.1f} ms')
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            failures.append(f'{name}: {result["rps"]:.0f} req/s vs baseline {base["rps"]:.0f} req/s')
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--its', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--comments', type=int, default=25000)
+    parser.add_argument('--agrees', type=int, default=50000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario (scaled by its share)')
+    parser.add_argument('--routes', help='comma-separated scenarios (default: all)')
+    parser.add_argument('--no-page-cache', action='store_true')
+    baseline_args = parser.add_mutually_exclusive_group()
+    baseline_args.add_argument('--baseline', metavar='FILE', help='compare with a baseline from this host')
+    baseline_args.add_argument('--save-baseline', metavar='FILE', help='record the results as a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    args = parser.parse_args()
+
+    names = args.routes.split(',') if args.routes else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenario: {unknown[0]}')
+
+    tmp = tempfile.TemporaryDirectory()
+    if args.no_page_cache:
+        os.environ['PAGE_CACHE_TTL'] = '0'
+    # Detail pages show related lists, so build them as a deployment would
+    datagen.generate(os.path.join(tmp.name, 'bench.db'), args.users, args.its,
+                     args.comments, args.agrees, related=True)
+    from app import app
+    app.config['JOB_DIR'] = os.path.join(tmp.name, 'jobs')
+
+    users = [login(app, f'user{i:05d}') for i in range(2, 2 + args.threads)]
+    admins = [login(app, 'admin') for _ in range(args.threads)]
+    weights = datagen.zipf_weights(args.its, s=0.9)
+    ctx = {
+        'its': args.its,
+        'lock': threading.Lock(),
+        'popular': lambda rng: rng.choices(range(1, args.its + 1), cum_weights=weights)[0],
+    }
+
+    print(f'{args.its:,} ITs, {args.users:,} users, {args.threads} threads, '
+          f'page cache {"off" if args.no_page_cache else "on"}')
+    print(f'{"scenario":<14}{"requests":>9}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+    results = {}
+    for name in names:
+        fn, as_admin, share = SCENARIOS[name]
+        total = max(args.threads, int(args.requests * share))
+        latencies, errors, seconds = run(app, fn, admins if as_admin else users, total, ctx)
+        results[name] = {
+            'rps': len(latencies) / seconds,
+            'p50_ms': pct(latencies, 0.5),
+            'p95_ms': pct(latencies, 0.95),
+            'p99_ms': pct(latencies, 0.99),
+        }
+        r = results[name]
+        print(f'{name:<14}{total:>9}{r["rps"]:>9.1f}{r["p50_ms"]:>9.1f}{r["p95_ms"]:>9.1f}'
+              f'{r["p99_ms"]:>9.1f}{len(errors):>8}')
+        if errors:
+            print(f'  first error: {errors[0]}')
+
+    settings = {k: getattr(args, k) for k in ('its', 'users', 'comments', 'agrees', 'threads',
+                                              'requests', 'no_page_cache')}
+    host = platform.node()
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'host': host, 'settings': settings, 'routes': results}, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {args.save_baseline}')
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('host') != host:
+            sys.exit(f'{args.baseline} was recorded on {baseline.get("host")!r}, not {host!r}; '
+                     f'record a baseline here with --save-baseline')
+        if baseline.get('settings') != settings:
+            print(f'Note: baseline was recorded with {baseline.get("settings")}')
+        failures = compare(results, baseline, args.tolerance)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%} of the baseline')
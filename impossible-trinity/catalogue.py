@@ -0,0 +1,99 @@
+"""
+Field catalogue
+
+The ``field`` table holds one row per distinct ``ImpossibleTrinity.field``
+with its item count, maintained incrementally by mapper events inside the
+writing transaction. The ordered list is memoized per process and dropped
+after any commit that changed it, so rendering the field chips costs no query
+on a warm worker.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from cache import LRUCache
+from hooks import defer, on_commit
+from models import db, ImpossibleTrinity, Field
+
+FieldSummary = namedtuple('FieldSummary', ['name', 'item_count', 'last_updated'])
+
+# Bounded staleness for other worker processes
+_memo = LRUCache(maxsize=1, ttl=60)
+
+
+def field_catalogue():
+    """All fields with their item counts, ordered by name"""
+    fields = _memo.get('all')
+    if fields is None:
+        rows = db.session.execute(
+            select(Field.name, Field.item_count, Field.last_updated).order_by(Field.name)
+        ).all()
+        fields = tuple(FieldSummary(*row) for row in rows)
+        _memo.set('all', fields)
+    return fields
+
+
+def adjust_counts(connection, deltas):
+    """Apply ``{field: delta}`` to the catalogue in the caller's transaction"""
+    now = datetime.utcnow()
+    table = Field.__table__
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        upsert = sqlite_insert(table).values(name=name, item_count=delta, last_updated=now)
+        connection.execute(upsert.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={'item_count': table.c.item_count + delta, 'last_updated': now}
+        ))
+    connection.execute(delete(table).where(table.c.item_count <= 0))
+
+
+def invalidate_catalogue():
+    """Forget the memoized list after writes that bypassed the mapper events"""
+    _memo.clear()
+
+
+def rebuild_catalogue(connection):
+    """Recompute the whole catalogue from impossible_trinity"""
+    trinities = ImpossibleTrinity.__table__
+    connection.execute(delete(Field.__table__))
+    connection.execute(Field.__table__.insert().from_select(
+        ['name', 'item_count', 'last_updated'],
+        select(trinities.c.field, func.count(), func.max(trinities.c.updated_at))
+        .group_by(trinities.c.field)
+    ))
+    invalidate_catalogue()
+
+
+def _changed(target, deltas):
+    defer(target, 'field_catalogue', True)
+    return deltas
+
+
+@event.listens_for(ImpossibleTrinity, 'after_insert')
+def _field_added(mapper, connection, target):
+    adjust_counts(connection, _changed(target, {target.field: 1}))
+
+
+@event.listens_for(ImpossibleTrinity, 'after_update')
+def _field_updated(mapper, connection, target):
+    history = inspect(target).attrs.field.history
+    if not history.has_changes():
+        return
+    deltas = {target.field: 1}
+    for old in history.deleted:
+        deltas[old] = deltas.get(old, 0) - 1
+    adjust_counts(connection, _changed(target, deltas))
+
+
+@event.listens_for(ImpossibleTrinity, 'after_delete')
+def _field_removed(mapper, connection, target):
+    adjust_counts(connection, _changed(target, {target.field: -1}))
+
+
+@on_commit('field_catalogue')
+def _drop_memo(values):
+    _memo.clear()
@@ -0,0 +1,87 @@
+"""
+Comments of an IT: cursor pages, compact JSON, create and delete
+
+A page selects only the comment columns, newest first over the
+``(it_id, created_at)`` index, and resolves the authors of the whole page at
+once through ``users.load_users`` (cached snapshots, one ``IN`` query for the
+rest) instead of loading an author per row. The same page feeds the detail
+page, the "load more" fragment and ``/api/its/<id>/comments``.
+
+``create_comment``/``remove_comment`` are the write paths behind both the
+classic form posts and the AJAX calls, which get back just the changed
+fragment and the new count rather than a re-rendered detail page.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import db, ImpossibleTrinity, Comment
+from pagination import keyset_page
+from users import load_users
+
+COMMENT_ORDER = (Comment.created_at, Comment.id)
+COMMENTS_PER_PAGE = 20
+MAX_COMMENTS_PER_PAGE = 100
+COMMENT_COLUMNS = (Comment.id, Comment.content, Comment.created_at, Comment.user_id)
+CommentRow = namedtuple('CommentRow', [c.key for c in COMMENT_COLUMNS])
+
+
+def comment_page(it_id, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """One page of an IT's comments, newest first
+
+    Returns ``(rows, authors, next_cursor)`` where ``authors`` maps user id to
+    a ``UserSnapshot``. Raises ValueError for a malformed cursor.
+    """
+    query = db.session.query(*COMMENT_COLUMNS).filter(Comment.it_id == it_id)
+    rows, next_cursor = keyset_page(query, COMMENT_ORDER, cursor=cursor, per_page=per_page)
+    return rows, load_users(row.user_id for row in rows), next_cursor
+
+
+def comments_count(it_id):
+    """Stored comment count of an IT, or None if it does not exist"""
+    return db.session.execute(
+        select(ImpossibleTrinity.comments_count).where(ImpossibleTrinity.id == it_id)
+    ).scalar()
+
+
+def serialize_comments(rows, authors):
+    """``(items, authors)``: comments reference their author by id, each name is sent once"""
+    items = [
+        {
+            'id': row.id,
+            'user_id': row.user_id,
+            'content': row.content,
+            'created_at': row.created_at.isoformat() if isinstance(row.created_at, datetime) else None,
+        }
+        for row in rows
+    ]
+    return items, {str(user_id): user.username for user_id, user in authors.items()}
+
+
+def create_comment(it_id, user_id, content):
+    """Post a comment; returns ``(row, new count)``, or ``(None, None)`` if the IT is gone
+
+    ``row`` has the same columns as a page row, so it renders with the same
+    fragment; it is read before the commit expires the ORM object.
+    """
+    if comments_count(it_id) is None:
+        return None, None
+    comment = Comment(content=content, it_id=it_id, user_id=user_id)
+    db.session.add(comment)
+    db.session.flush()
+    row = CommentRow(comment.id, comment.content, comment.created_at, comment.user_id)
+    count = comments_count(it_id)
+    db.session.commit()
+    return row, count
+
+
+def remove_comment(comment):
+    """Delete a loaded comment; returns the IT's new count"""
+    it_id = comment.it_id
+    db.session.delete(comment)
+    db.session.flush()
+    count = comments_count(it_id)
+    db.session.commit()
+    return count
@@ -0,0 +1,62 @@
+"""
+Response compression for JSON endpoints
+
+``compressed`` negotiates ``br`` or ``gzip`` from the request's
+``Accept-Encoding`` and compresses the finished response body. Brotli is used
+only when the optional ``brotli`` package is installed; gzip always works.
+Small bodies are sent as they are, since the framing would outweigh the
+saving.
+"""
+
+import gzip
+from functools import wraps
+
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 512
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+def accepted_encodings():
+    """The request's acceptable encodings among ``'br'`` and ``'gzip'``, preferred first"""
+    accepted = request.accept_encodings
+    return [encoding for encoding in ('br', 'gzip') if accepted[encoding] > 0]
+
+
+def choose_encoding():
+    """``'br'``, ``'gzip'`` or None: the best accepted encoding this process can produce"""
+    for encoding in accepted_encodings():
+        if encoding != 'br' or brotli is not None:
+            return encoding
+    return None
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compressed(view):
+    """Compress a view's response when the client allows it"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.status_code < 200
+                or 'Content-Encoding' in response.headers):
+            return response
+        data = response.get_data()
+        encoding = choose_encoding()
+        if encoding is None or len(data) < MIN_SIZE:
+            return response
+        response.set_data(compress_body(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+    return wrapper
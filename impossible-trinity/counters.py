@@ -0,0 +1,210 @@
+"""
+Denormalized counters on ImpossibleTrinity
+
+``comments_count`` mirrors ``COUNT(*)`` of an IT's comments so list views
+never have to load the comment rows. It is maintained with atomic
+``UPDATE ... SET comments_count = comments_count +/- 1`` statements issued from
+mapper events, which covers the comment routes as well as ORM cascades.
+
+Agree clicks bump ``agree_count`` with a single atomic UPDATE
+(``increment_agree``) or, when ``AGREE_FLUSH_INTERVAL_MS`` is set, through the
+write-behind ``agree_buffer``.
+
+Every counter UPDATE also rescores ``hot_score`` from the new values in the
+same statement (see ranking.py).
+"""
+
+import atexit
+import threading
+import time
+
+from sqlalchemy import bindparam, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, ImpossibleTrinity, Comment, Agree
+from ranking import hot_score_expr
+
+# Counter bumps are not edits: stop the column's onupdate from touching updated_at
+_KEEP_UPDATED_AT = {'updated_at': ImpossibleTrinity.__table__.c.updated_at}
+
+
+def _bump_comments(connection, it_id, delta):
+    trinities = ImpossibleTrinity.__table__
+    connection.execute(
+        update(trinities)
+        .where(trinities.c.id == it_id)
+        .values(
+            comments_count=trinities.c.comments_count + delta,
+            hot_score=hot_score_expr(trinities, comments=trinities.c.comments_count + delta),
+            **_KEEP_UPDATED_AT
+        )
+    )
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_added(mapper, connection, target):
+    _bump_comments(connection, target.it_id, 1)
+
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    _bump_comments(connection, target.it_id, -1)
+
+
+def repair_comment_counts(connection=None):
+    """Recompute every comments_count from the comment table"""
+    trinities = ImpossibleTrinity.__table__
+    comments = Comment.__table__
+    actual = (
+        select(func.count(comments.c.id))
+        .where(comments.c.it_id == trinities.c.id)
+        .scalar_subquery()
+    )
+    statement = update(trinities).values(comments_count=actual, **_KEEP_UPDATED_AT)
+    if connection is not None:
+        return connection.execute(statement).rowcount
+    result = db.session.execute(statement)
+    db.session.commit()
+    return result.rowcount
+
+
+def increment_agree(it_id, delta=1):
+    """Atomically add to agree_count in the current transaction
+
+    Returns the new stored count, or None if the IT does not exist.
+    """
+    trinities = ImpossibleTrinity.__table__
+    count = func.coalesce(trinities.c.agree_count, 0) + delta
+    return db.session.execute(
+        update(trinities)
+        .where(trinities.c.id == it_id)
+        .values(agree_count=count, hot_score=hot_score_expr(trinities, agrees=count), **_KEEP_UPDATED_AT)
+        .returning(trinities.c.agree_count)
+    ).scalar()
+
+
+class AgreeBuffer:
+    """Write-behind buffer for agree clicks
+
+    New ``(user_id, it_id)`` agrees are accumulated in memory and a daemon
+    thread applies them every ``AGREE_FLUSH_INTERVAL_MS`` as one batched
+    transaction, so a burst of clicks costs one SQLite write lock instead of
+    one per click. The flush inserts the Agree rows with ``ON CONFLICT DO
+    NOTHING`` and only counts the rows that were really new. Readers add
+    ``pending(it_id)`` to the stored count so totals still look live. With an
+    interval of 0 (the default) the buffer is disabled and every agree is
+    written through immediately.
+    """
+
+    def __init__(self):
+        self.interval = 0
+        self._app = None
+        self._lock = threading.Lock()
+        self._rows = set()
+        self._pending = {}
+        self._inflight = {}
+        # ITs discarded while a flush was writing
+        self._dropped = set()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('AGREE_FLUSH_INTERVAL_MS', 0)
+        self._app = app
+        self.interval = app.config['AGREE_FLUSH_INTERVAL_MS'] / 1000.0
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def add(self, user_id, it_id):
+        with self._lock:
+            if (user_id, it_id) in self._rows:
+                return
+            self._rows.add((user_id, it_id))
+            self._pending[it_id] = self._pending.get(it_id, 0) + 1
+            if self._thread is None:
+                # Started lazily so forked workers each get their own flusher
+                self._thread = threading.Thread(target=self._run, name='agree-flusher', daemon=True)
+                self._thread.start()
+
+    def discard(self, it_id):
+        """Forget the buffered agrees of a deleted IT, including those a flush is writing"""
+        with self._lock:
+            self._rows = {row for row in self._rows if row[1] != it_id}
+            self._pending.pop(it_id, None)
+            self._inflight.pop(it_id, None)
+            self._dropped.add(it_id)
+
+    def pending(self, it_id):
+        with self._lock:
+            return self._pending.get(it_id, 0) + self._inflight.get(it_id, 0)
+
+    def flush(self):
+        """Write all buffered agrees in one transaction, returning the number of rows handled"""
+        with self._lock:
+            if not self._rows or self._app is None:
+                return 0
+            rows, self._rows = self._rows, set()
+            batch, self._pending = self._pending, {}
+            self._dropped = set()
+            for it_id, delta in batch.items():
+                self._inflight[it_id] = self._inflight.get(it_id, 0) + delta
+
+        trinities = ImpossibleTrinity.__table__
+        # Only for ITs that still exist: a delete may commit while this runs
+        add_agree = sqlite_insert(Agree.__table__).from_select(
+            ['user_id', 'it_id'],
+            select(bindparam('user_id'), trinities.c.id).where(trinities.c.id == bindparam('it_id')),
+        ).on_conflict_do_nothing()
+        count = func.coalesce(trinities.c.agree_count, 0) + bindparam('delta')
+        add_count = (
+            update(trinities)
+            .where(trinities.c.id == bindparam('it_id'))
+            .values(agree_count=count, hot_score=hot_score_expr(trinities, agrees=count), **_KEEP_UPDATED_AT)
+        )
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as connection:
+                    deltas = {}
+                    for user_id, it_id in rows:
+                        if connection.execute(add_agree, {'user_id': user_id, 'it_id': it_id}).rowcount:
+                            deltas[it_id] = deltas.get(it_id, 0) + 1
+                    if deltas:
+                        connection.execute(
+                            add_count,
+                            [{'it_id': it_id, 'delta': delta} for it_id, delta in deltas.items()]
+                        )
+        except Exception:
+            # Keep the clicks for the next round instead of dropping them
+            with self._lock:
+                self._rows |= {row for row in rows if row[1] not in self._dropped}
+                for it_id, delta in batch.items():
+                    if it_id not in self._dropped:
+                        self._pending[it_id] = self._pending.get(it_id, 0) + delta
+            raise
+        finally:
+            with self._lock:
+                for it_id, delta in batch.items():
+                    left = self._inflight.get(it_id, 0) - delta
+                    if left > 0:
+                        self._inflight[it_id] = left
+                    else:
+                        self._inflight.pop(it_id, None)
+        return len(rows)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                self._app.logger.exception('Flushing the agree buffer failed')
+
+
+agree_buffer = AgreeBuffer()
+
+
+def live_agree_count(it):
+    """Stored agree_count plus agrees still waiting in the write-behind buffer"""
+    return (it.agree_count or 0) + agree_buffer.pending(it.id)
@@ -7,6 +7,7 @@ Run this script after initializing the database to create the first admin accoun
 import bcrypt
 from app import app
 from models import db, User
+from users import USER_CACHE_TTL
 
 def create_admin():
     with app.app_context():
@@ -18,10 +19,20 @@ def create_admin():
             print("Error: Username cannot be empty")
             return
         
-        # Check if user already exists
+        # An existing user can be promoted instead
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
-            print(f"Error: User '{username}' already exists")
+            if existing_user.is_admin:
+                print(f"Error: User '{username}' is already an admin")
+                return
+            answer = input(f"User '{username}' already exists. Promote to admin? [y/N]: ").strip().lower()
+            if answer != 'y':
+                return
+            # Committing through the ORM drops this user's cached identity (users.py)
+            existing_user.is_admin = True
+            db.session.commit()
+            print(f"\n✓ User '{username}' is now an admin")
+            print(f"✓ Running servers pick up the change within {USER_CACHE_TTL} seconds, or at their next restart")
             return
         
         password = input("Enter admin password: ").strip()
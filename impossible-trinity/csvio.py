@@ -0,0 +1,248 @@
+"""
+CSV export/import of Impossible Trinities
+
+Export streams: rows are read in keyset batches of only the exported columns
+(no ORM objects) and encoded chunk by chunk, so memory stays flat however
+large the table is.
+
+Import is a bulk pipeline: the upload is parsed as a stream, validated and
+written in batches (one multi-row INSERT/UPDATE and one commit per batch),
+deduplicated on the natural key ``(name, field)``. Core statements bypass the
+mapper events, so each batch updates the search index and field catalogue
+itself.
+"""
+
+import csv
+import io
+import zlib
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from catalogue import adjust_counts, invalidate_catalogue
+from images import image_store, image_urls
+from models import db, ImpossibleTrinity
+from ranking import hot_score
+from related import related_index
+from search import ensure_index, index_rows
+
+CSV_COLUMNS = [
+    'name', 'name_en', 'field',
+    'element1', 'element2', 'element3',
+    'description', 'hyperlink',
+    'feature_image_url', 'element1_image_url', 'element2_image_url', 'element3_image_url',
+    'element1_sacrifice_explanation', 'element2_sacrifice_explanation', 'element3_sacrifice_explanation'
+]
+
+EXPORT_BATCH_SIZE = 2000
+
+
+def iter_export_batches(batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of export tuples in id order, one keyset query per batch"""
+    table = ImpossibleTrinity.__table__
+    columns = [table.c.id] + [table.c[name] for name in CSV_COLUMNS]
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*columns).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < batch_size:
+            return
+
+
+def iter_csv_bytes(batches, compress=False):
+    """Encode header + batches as UTF-8 CSV with a BOM, optionally gzipped, chunk by chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def drain(prefix=''):
+        data = (prefix + buffer.getvalue()).encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return gzip.compress(data) if gzip else data
+
+    writer.writerow(CSV_COLUMNS)
+    yield drain('\ufeff')
+    for batch in batches:
+        writer.writerows(batch)
+        chunk = drain()
+        if chunk:
+            yield chunk
+    if gzip:
+        yield gzip.flush()
+
+
+IMPORT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('name', 'field', 'element1', 'element2', 'element3')
+OPTIONAL_COLUMNS = (
+    'hyperlink', 'feature_image_url', 'element1_image_url', 'element2_image_url', 'element3_image_url',
+    'element1_sacrifice_explanation', 'element2_sacrifice_explanation', 'element3_sacrifice_explanation'
+)
+# Columns rewritten when an existing (name, field) row is updated
+UPDATE_COLUMNS = [c for c in CSV_COLUMNS if c not in ('name', 'field')]
+
+
+class ImportReport:
+    """Outcome of one CSV import"""
+
+    MAX_ERRORS = 100
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errored = 0
+        self.errors = []
+
+    @property
+    def processed(self):
+        return self.inserted + self.updated + self.skipped + self.errored
+
+    def error(self, line, message):
+        self.errored += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def as_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'errored': self.errored,
+            'errors': self.errors,
+        }
+
+
+def clean_row(row):
+    """Validate one CSV row and map it to column values, raising ValueError"""
+    table = ImpossibleTrinity.__table__
+    values = {}
+    for column in CSV_COLUMNS:
+        value = (row.get(column) or '').strip()
+        limit = getattr(table.c[column].type, 'length', None)
+        if limit and len(value) > limit:
+            raise ValueError(f'{column} 超过 {limit} 个字符')
+        values[column] = value
+
+    missing = [c for c in REQUIRED_COLUMNS if not values[c]]
+    if missing:
+        raise ValueError('缺少字段: ' + ', '.join(missing))
+    values['name_en'] = values['name_en'] or 'Impossible Trinity'
+    for column in OPTIONAL_COLUMNS:
+        values[column] = values[column] or None
+    return values
+
+
+def _write_batch(batch, creator_id, on_duplicate, report):
+    table = ImpossibleTrinity.__table__
+    connection = db.session.connection()
+
+    # Repeated keys inside the batch collapse onto the first occurrence
+    unique = {}
+    for line, values in batch:
+        key = (values['name'], values['field'])
+        if key not in unique:
+            unique[key] = (line, values)
+        elif on_duplicate == 'update':
+            unique[key] = (unique[key][0], values)
+            report.updated += 1
+        else:
+            report.skipped += 1
+
+    found = connection.execute(
+        select(table.c.id, table.c.name, table.c.field)
+        .where(tuple_(table.c.name, table.c.field).in_(list(unique)))
+    ).all()
+    existing = {(name, field): it_id for it_id, name, field in found}
+
+    now = datetime.utcnow()
+    inserts = []
+    updates = []
+    for key, (line, values) in unique.items():
+        if key not in existing:
+            inserts.append(dict(
+                values, creator_id=creator_id, created_at=now, updated_at=now,
+                agree_count=0, comments_count=0, hot_score=hot_score(0, 0, now)
+            ))
+        elif on_duplicate == 'update':
+            updates.append(dict(values, id=existing[key]))
+        else:
+            report.skipped += 1
+
+    indexed = ensure_index(connection)
+    if inserts:
+        ids = connection.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), inserts
+        ).scalars().all()
+        for row, it_id in zip(inserts, ids):
+            row['id'] = it_id
+        adjust_counts(connection, Counter(row['field'] for row in inserts))
+    if updates:
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .values({**{c: bindparam('b_' + c) for c in UPDATE_COLUMNS}, 'updated_at': now}),
+            [{'b_' + k: v for k, v in row.items() if k == 'id' or k in UPDATE_COLUMNS} for row in updates]
+        )
+    if indexed:
+        index_rows(connection, inserts + updates)
+
+    db.session.commit()
+    for row in inserts + updates:
+        image_store.prefetch(row['id'], image_urls(row))
+    related_index.schedule(row['id'] for row in inserts + updates)
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+
+
+def import_rows(stream, creator_id, on_duplicate='skip', batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Import CSV text from ``stream`` in batches and return an ImportReport
+
+    ``on_duplicate`` is ``'skip'`` or ``'update'`` for rows whose
+    ``(name, field)`` already exists. ``progress(report)`` is called after
+    every committed batch.
+    """
+    report = ImportReport()
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or 'name' not in reader.fieldnames:
+        raise ValueError('CSV缺少表头或 name 列')
+
+    def flush(batch):
+        try:
+            _write_batch(batch, creator_id, on_duplicate, report)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            for line, _ in batch:
+                report.error(line, str(e.orig if hasattr(e, 'orig') else e))
+        invalidate_catalogue()
+        if progress:
+            progress(report)
+
+    batch = []
+    for row in reader:
+        try:
+            batch.append((reader.line_num, clean_row(row)))
+        except ValueError as e:
+            report.error(reader.line_num, str(e))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return report
+
+
+def count_records(stream):
+    """Data records in CSV text, as ``import_rows`` will see them
+
+    Counts parsed records rather than lines, so quoted fields spanning
+    several lines count once; blank lines are skipped like DictReader does.
+    """
+    return max(sum(1 for row in csv.reader(stream) if row) - 1, 0)
@@ -0,0 +1,180 @@
+"""
+The feed: rows for ``index()`` and ``/api/its``
+
+Both views build their query here, so the server-rendered first page and the
+infinite-scroll pages apply the same ``field`` filter, ``q`` search and sort,
+and page with the same keyset cursor. ``sort`` is ``new`` (the default),
+``hot`` (the stored time-decayed score, see ranking.py) or ``top`` (most
+agreed); search results sort by relevance (the bm25 rank, then id) unless
+another sort is asked for, and scroll like any other order.
+
+Clients pick the attributes they render with ``fields=``; each name maps to a
+column (or a small SQL expression), so the ``SELECT`` reads only those columns
+and the rows come back as plain tuples rather than ORM objects in the
+identity map. ``agreed`` is computed from the cached per-user agree set and
+``agree_count`` includes agrees still waiting in the write-behind buffer.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func
+
+from cache import LRUCache
+from catalogue import field_catalogue
+from counters import agree_buffer
+from models import db, ImpossibleTrinity
+from pagination import keyset_page
+from search import search_condition, search_hits
+
+# Card previews show 150 characters; one more tells the client to add "..."
+PREVIEW_LENGTH = 151
+
+COLUMNS = {
+    'id': ImpossibleTrinity.id,
+    'name': ImpossibleTrinity.name,
+    'name_en': ImpossibleTrinity.name_en,
+    'field': ImpossibleTrinity.field,
+    'element1': ImpossibleTrinity.element1,
+    'element2': ImpossibleTrinity.element2,
+    'element3': ImpossibleTrinity.element3,
+    'description': ImpossibleTrinity.description,
+    'description_preview': func.substr(
+        ImpossibleTrinity.description, 1, PREVIEW_LENGTH
+    ).label('description_preview'),
+    'agree_count': ImpossibleTrinity.agree_count,
+    'comments_count': ImpossibleTrinity.comments_count,
+    'element1_sacrifice_explanation': ImpossibleTrinity.element1_sacrifice_explanation,
+    'element2_sacrifice_explanation': ImpossibleTrinity.element2_sacrifice_explanation,
+    'element3_sacrifice_explanation': ImpossibleTrinity.element3_sacrifice_explanation,
+    'feature_image_url': ImpossibleTrinity.feature_image_url,
+    'created_at': ImpossibleTrinity.created_at,
+    'updated_at': ImpossibleTrinity.updated_at,
+}
+# Derived from other state rather than selected
+COMPUTED = {'agreed'}
+
+# What /api/its returned before fields= existed
+DEFAULT_FIELDS = [
+    'id', 'name', 'field', 'element1', 'element2', 'element3', 'description',
+    'agree_count', 'agreed', 'comments_count',
+    'element1_sacrifice_explanation', 'element2_sacrifice_explanation',
+    'element3_sacrifice_explanation', 'created_at',
+]
+
+# What index() renders for each view; static/js/main.js asks for the same
+VIEW_FIELDS = {
+    'card': [
+        'id', 'name', 'field', 'element1', 'element2', 'element3',
+        'element1_sacrifice_explanation', 'element2_sacrifice_explanation',
+        'element3_sacrifice_explanation', 'description_preview',
+        'agree_count', 'comments_count',
+    ],
+    'table': [
+        'id', 'name', 'field', 'element1', 'element2', 'element3',
+        'agree_count', 'comments_count', 'created_at',
+    ],
+}
+
+
+def parse_fields(value):
+    """``'name,field'`` -> validated field list; raises ValueError on unknown names"""
+    names = [n.strip() for n in (value or '').split(',') if n.strip()]
+    if not names:
+        return list(DEFAULT_FIELDS)
+    unknown = [n for n in names if n not in COLUMNS and n not in COMPUTED]
+    if unknown:
+        raise ValueError(f'unknown field: {unknown[0]}')
+    return list(dict.fromkeys(names))
+
+
+# Sort name -> fn(search hits) returning (keyset columns, descending). Each
+# order has an index, alone and after the field filter; top continues with
+# created_at like the admin grid's agree_count sort, whose index it shares.
+SORTS = {
+    'new': lambda hits: ((ImpossibleTrinity.created_at, ImpossibleTrinity.id), True),
+    'hot': lambda hits: ((ImpossibleTrinity.hot_score, ImpossibleTrinity.id), True),
+    'top': lambda hits: ((ImpossibleTrinity.agree_count, ImpossibleTrinity.created_at, ImpossibleTrinity.id), True),
+    'relevance': lambda hits: ((hits.c.rank, ImpossibleTrinity.id), False),
+}
+
+# (field, q) -> number of matching ITs
+_totals = LRUCache(maxsize=1024, ttl=60)
+
+
+def feed_query(fields, order):
+    """Column-level query for ``fields`` that also carries the ordering columns"""
+    columns = [COLUMNS[n] for n in fields if n in COLUMNS]
+    keys = {c.key for c in columns}
+    columns += [c for c in order if c.key not in keys]
+    return db.session.query(*columns)
+
+
+def filter_feed(query, field=None, q=None, hits=None):
+    """Apply the field filter and the search (FTS hits, or ILIKE without them)"""
+    if field:
+        query = query.filter(ImpossibleTrinity.field == field)
+    if q:
+        if hits is not None:
+            query = query.join(hits, hits.c.it_id == ImpossibleTrinity.id)
+        else:
+            query = query.filter(search_condition(q))
+    return query
+
+
+def resolve_sort(sort, hits):
+    """Default and validate a sort name; relevance needs full-text hits"""
+    if not sort or (sort == 'relevance' and hits is None):
+        sort = 'relevance' if hits is not None else 'new'
+    if sort not in SORTS:
+        raise ValueError(f'unknown sort: {sort}')
+    return sort
+
+
+def feed_page(fields, field=None, q=None, sort=None, cursor=None, per_page=12):
+    """One page of the feed
+
+    Returns ``(rows, next_cursor, sort)`` where ``sort`` is the order actually
+    used. Raises ValueError for an unknown sort or a malformed cursor.
+    """
+    hits = search_hits(q) if q else None
+    sort = resolve_sort(sort, hits)
+    order, descending = SORTS[sort](hits)
+    query = filter_feed(feed_query(fields, order), field, q, hits)
+    rows, next_cursor = keyset_page(query, order, cursor, per_page, descending)
+    return rows, next_cursor, sort
+
+
+def feed_total(field=None, q=None):
+    """Number of ITs matching the filters; cached per ``(field, q)``"""
+    if not q:
+        fields = field_catalogue()
+        if field:
+            return next((f.item_count for f in fields if f.name == field), 0)
+        return sum(f.item_count for f in fields)
+
+    key = (field or '', q)
+    total = _totals.get(key)
+    if total is None:
+        query = db.session.query(func.count(ImpossibleTrinity.id))
+        total = filter_feed(query, field, q, search_hits(q)).scalar()
+        _totals.set(key, total)
+    return total
+
+
+def serialize(rows, fields, agreed=frozenset()):
+    """Plain dicts for the requested fields, in request order"""
+    items = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name == 'agreed':
+                item[name] = row.id in agreed
+                continue
+            value = getattr(row, name)
+            if name == 'agree_count':
+                value = (value or 0) + agree_buffer.pending(row.id)
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            item[name] = value
+        items.append(item)
+    return items
@@ -0,0 +1,128 @@
+"""
+Server-side data grid for the admin page
+
+``grid_page`` answers one request of the admin grid: a projection of the
+requested columns, filtered, sorted on any indexed column and paged with a
+``(sort column, created_at, id)`` keyset cursor. Rows come back as plain tuples from a
+Core ``select`` (no ORM objects, no comment rows), so the cost of a page is
+independent of how many ITs or comments exist. The row count shown above the
+grid comes from the field catalogue instead of a ``COUNT(*)`` scan.
+"""
+
+from sqlalchemy import or_, select, tuple_
+
+from catalogue import field_catalogue
+from counters import agree_buffer
+from models import db, ImpossibleTrinity, User
+from pagination import decode_cursor, encode_cursor
+
+_it = ImpossibleTrinity.__table__
+
+# Grid column -> SQL expression
+COLUMNS = {
+    'id': _it.c.id,
+    'name': _it.c.name,
+    'name_en': _it.c.name_en,
+    'creator': User.__table__.c.username.label('creator'),
+    'field': _it.c.field,
+    'element1': _it.c.element1,
+    'element2': _it.c.element2,
+    'element3': _it.c.element3,
+    'agree_count': _it.c.agree_count,
+    'comments_count': _it.c.comments_count,
+    'created_at': _it.c.created_at,
+    'updated_at': _it.c.updated_at,
+}
+# Sortable column -> leading keyset column. Each key continues with
+# (created_at, id) and is served by an index, so deep pages stay index seeks;
+# creator sorts group by account (creator_id), not alphabetically.
+SORT_KEYS = {
+    'name': _it.c.name,
+    'creator': _it.c.creator_id,
+    'field': _it.c.field,
+    'agree_count': _it.c.agree_count,
+    'comments_count': _it.c.comments_count,
+    'created_at': None,
+    'id': None,
+}
+DEFAULT_COLUMNS = ['id', 'name', 'creator', 'field', 'element1', 'element2', 'element3',
+                   'agree_count', 'comments_count', 'created_at']
+MAX_PAGE = 500
+
+
+def parse_columns(value):
+    """``'name,field'`` -> validated column list, always starting with ``id``"""
+    names = [n for n in (value or '').split(',') if n] or DEFAULT_COLUMNS
+    unknown = [n for n in names if n not in COLUMNS]
+    if unknown:
+        raise ValueError(f'unknown column: {unknown[0]}')
+    return ['id'] + [n for n in dict.fromkeys(names) if n != 'id']
+
+
+def grid_page(columns=None, sort='created_at', descending=True, cursor=None,
+              per_page=100, field=None, creator=None, q=None):
+    """One page of grid rows
+
+    Returns ``(columns, rows, next_cursor)``; ``rows`` are lists in
+    ``columns`` order. Raises ValueError for unknown columns, an unsortable
+    sort key or a malformed cursor.
+    """
+    columns = columns or list(DEFAULT_COLUMNS)
+    if sort not in SORT_KEYS:
+        raise ValueError(f'cannot sort by {sort}')
+    per_page = max(1, min(per_page, MAX_PAGE))
+
+    if sort == 'id':
+        key = (_it.c.id,)
+    else:
+        key = tuple(c for c in (SORT_KEYS[sort], _it.c.created_at, _it.c.id) if c is not None)
+    # The keyset columns are fetched too (after the displayed ones) for the cursor
+    stmt = select(
+        *[COLUMNS[name] for name in columns],
+        *[c.label(f'key_{i}') for i, c in enumerate(key)]
+    )
+
+    if 'creator' in columns or creator:
+        stmt = stmt.select_from(_it.join(User.__table__, User.__table__.c.id == _it.c.creator_id))
+    if field:
+        stmt = stmt.where(_it.c.field == field)
+    if creator:
+        stmt = stmt.where(User.__table__.c.username == creator)
+    if q:
+        pattern = f'%{q}%'
+        stmt = stmt.where(or_(*(_it.c[name].ilike(pattern) for name in
+                                ('name', 'name_en', 'field', 'element1', 'element2', 'element3'))))
+
+    if cursor:
+        values = decode_cursor(cursor, key, descending)
+        if descending:
+            stmt = stmt.where(tuple_(*key) < tuple_(*values))
+        else:
+            stmt = stmt.where(tuple_(*key) > tuple_(*values))
+    stmt = stmt.order_by(*[c.desc() if descending else c.asc() for c in key]).limit(per_page + 1)
+
+    result = db.session.execute(stmt).all()
+    next_cursor = None
+    if len(result) > per_page:
+        result = result[:per_page]
+        next_cursor = encode_cursor(result[-1][len(columns):], key, descending)
+
+    # Add agrees still waiting in the write-behind buffer
+    live = columns.index('agree_count') if 'agree_count' in columns else None
+    rows = []
+    for row in result:
+        values = list(row[:len(columns)])
+        if live is not None:
+            values[live] = (values[live] or 0) + agree_buffer.pending(values[0])
+        rows.append(values)
+    return columns, rows, next_cursor
+
+
+def grid_total(field=None, creator=None, q=None):
+    """Row count from the field catalogue, or None when it cannot say"""
+    if creator or q:
+        return None
+    fields = field_catalogue()
+    if field:
+        return next((f.item_count for f in fields if f.name == field), 0)
+    return sum(f.item_count for f in fields)
@@ -0,0 +1,53 @@
+"""
+Gunicorn settings for serving the app in production
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Prefork workers, each with a few threads, load a preloaded and warmed app
+from the master process. Every setting can be overridden from the environment
+(``WEB_CONCURRENCY``, ``WEB_THREADS``, ``BIND``...) or the command line.
+
+Reloading without dropping requests: ``kill -HUP <master pid>`` replaces the
+workers gracefully with the current settings; for new code (which a preloaded
+master does not re-import on HUP) send ``USR2`` to start a new master beside
+the old one, then ``QUIT`` the old master. Either way the old workers exit
+once ``graceful_timeout`` has passed, and a background job still running in
+one of them fails; reload when the admin job list shows none running.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+# The in-process page cache is only invalidated in the worker that handled
+# the write, so several workers need a shared PAGE_CACHE_URL. Without one,
+# serve from a single process whose threads cover I/O waits; with one, use a
+# process per core.
+workers = int(os.environ.get('WEB_CONCURRENCY') or (
+    multiprocessing.cpu_count() if os.environ.get('PAGE_CACHE_URL') else 1
+))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+preload_app = True
+# Finish in-flight requests on reload/shutdown before killing a worker
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+keepalive = 5
+# Recycling workers (MAX_REQUESTS > 0) bounds slow leaks, but import/export
+# jobs run on threads inside the workers (jobs.py) and a recycled worker takes
+# its running jobs down with it; so it is off unless asked for
+max_requests = int(os.environ.get('MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('ACCESS_LOG') or None
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Connections opened in the master belong to it; drop them without closing
+    from app import app
+    from models import db
+    from pagecache import page_cache
+    with app.app_context():
+        db.engine.dispose(close=False)
+    # Also covers a worker count given on the command line (-w)
+    page_cache.require_shared(server.cfg.workers, app.logger)
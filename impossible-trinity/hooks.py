@@ -0,0 +1,81 @@
+"""
+Shared plumbing for write hooks and background work
+
+Mapper events fire inside a flush, before the transaction is known to
+commit. ``defer`` records a value under a name in the session, and the action
+registered for that name with ``on_commit`` runs once after the commit with
+every value collected. A rollback drops the values, and a change made outside
+a session runs its action at once.
+
+``ProcessPool`` is a thread pool made on first use, and made again in each
+process after a fork, since threads do not survive one.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+_INFO_KEY = 'deferred'
+_actions = {}
+
+
+def on_commit(name):
+    """Register ``fn(values)`` to run after each commit that deferred ``name`` values"""
+    def decorator(fn):
+        _actions[name] = fn
+        return fn
+    return decorator
+
+
+def defer(target, name, value):
+    """Queue a hashable ``value`` for the ``name`` action of ``target``'s session"""
+    session = object_session(target)
+    if session is None:
+        _actions[name]({value})
+    else:
+        session.info.setdefault(_INFO_KEY, {}).setdefault(name, set()).add(value)
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_deferred(session):
+    for name, values in session.info.pop(_INFO_KEY, {}).items():
+        _actions[name](values)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_deferred(session):
+    session.info.pop(_INFO_KEY, None)
+
+
+class ProcessPool:
+    """A ``ThreadPoolExecutor`` per process
+
+    ``on_create()`` runs whenever a process makes its pool, e.g. to reset
+    state describing queued work, which the fork left behind.
+    """
+
+    def __init__(self, thread_name_prefix, max_workers=1, on_create=None):
+        self.thread_name_prefix = thread_name_prefix
+        self.max_workers = max_workers
+        self.on_create = on_create
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix
+                    )
+                    self._pid = os.getpid()
+                    if self.on_create is not None:
+                        self.on_create()
+        return self._executor
+
+    def submit(self, fn, *args):
+        return self.executor().submit(fn, *args)
@@ -0,0 +1,403 @@
+"""
+Local image proxy and thumbnail cache
+
+``feature_image_url`` and ``element{1,2,3}_image_url`` point at third-party
+hosts. Rather than hotlinking them at full size, each URL is fetched once in
+the background (after an IT is saved or imported), decoded, and stored as
+resized WebP and JPEG renditions in a content-addressed cache on local disk::
+
+    IMAGE_CACHE_DIR/refs/<sha256(url)[:32]>      -> content digest
+    IMAGE_CACHE_DIR/<digest[:2]>/<digest>/<width>.webp|.jpg
+
+``/img/<digest>/<width>`` serves the renditions with a one-year immutable
+Cache-Control, since a digest always names the same bytes. Identical images
+behind different URLs share one entry. When the cache grows beyond
+``IMAGE_CACHE_MAX_BYTES`` the least recently served entries are removed;
+a removed image is fetched again the next time a page needs it.
+
+Until an image is cached (or when Pillow is not installed) templates fall
+back to the original URL. A URL that fails to fetch is retried with an
+exponential backoff rather than on every render of its page. The fetcher is pluggable: set ``IMAGE_FETCHER`` to
+any ``fn(url) -> bytes``, e.g. a local stub that reads fixture files.
+
+Any registered user chooses these URLs, so the default fetcher only talks to
+public addresses: every connection, including each redirect hop, resolves
+the host itself and refuses loopback, private, link-local and other
+non-global addresses. No proxy is used. ``IMAGE_ALLOWED_HOSTS`` can further
+restrict fetching to a list of hosts.
+"""
+
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+
+from flask import url_for
+from sqlalchemy import event, inspect
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+from cache import LRUCache
+from hooks import ProcessPool, defer, on_commit
+from models import ImpossibleTrinity
+from pagecache import page_cache
+
+IMAGE_COLUMNS = (
+    'feature_image_url', 'element1_image_url', 'element2_image_url', 'element3_image_url',
+)
+
+# Element thumbnails render at 40 CSS px, the feature image up to 900
+THUMB_WIDTHS = (40, 80)
+FEATURE_WIDTHS = (480, 960, 1440)
+WIDTHS = THUMB_WIDTHS + FEATURE_WIDTHS
+
+IMAGE_FORMATS = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 10
+USER_AGENT = 'ImpossibleTrinity-ImageCache/1.0'
+# A failed URL is retried after 5 minutes, doubling up to a day
+FAILURE_BACKOFF = 300
+MAX_FAILURE_BACKOFF = 24 * 3600
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+class BlockedAddress(ValueError):
+    """The image host resolves to an address the server must not fetch from"""
+
+
+def public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """``socket.create_connection`` restricted to globally routable addresses
+
+    The host is resolved here and the connection goes to the checked address,
+    so a DNS answer cannot change between the check and the connect.
+    """
+    host, port = address
+    error = None
+    for family, type_, proto, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        ip = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            error = BlockedAddress(f'{host} resolves to non-public address {ip}')
+            continue
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError(f'cannot resolve {host}')
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _RedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = 3
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urllib.parse.urlsplit(newurl).scheme not in ('http', 'https'):
+            raise BlockedAddress(f'redirect to {newurl}')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# Every hop (redirects included) connects through public_connection
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}),
+    _PublicHTTPHandler,
+    _PublicHTTPSHandler,
+    _RedirectHandler,
+)
+
+
+def http_fetch(url):
+    """Default fetcher: one GET of a public address, with a timeout and a size cap"""
+    req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with _opener.open(req, timeout=FETCH_TIMEOUT) as response:
+        data = response.read(MAX_SOURCE_BYTES + 1)
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ValueError(f'image larger than {MAX_SOURCE_BYTES} bytes')
+    return data
+
+
+def render_thumbnails(data):
+    """``{(width, format): bytes}`` for every width; never upscales"""
+    source = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+    source = source.convert('RGBA' if has_alpha else 'RGB')
+    formats = ['webp', 'jpg'] if features.check('webp') else ['jpg']
+
+    renders = {}
+    for width in WIDTHS:
+        image = source
+        if source.width > width:
+            height = max(1, round(source.height * width / source.width))
+            image = source.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            out = io.BytesIO()
+            if fmt == 'webp':
+                image.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+            else:
+                flat = image
+                if has_alpha:
+                    flat = Image.new('RGB', image.size, (255, 255, 255))
+                    flat.paste(image, mask=image.getchannel('A'))
+                flat.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            renders[(width, fmt)] = out.getvalue()
+    return renders
+
+
+class CachedImage(namedtuple('CachedImage', ['digest'])):
+    """A cached image as seen by templates"""
+
+    def src(self, width):
+        return url_for('image', digest=self.digest, width=width)
+
+    def srcset(self, widths, density=False):
+        """``srcset`` value: ``w`` descriptors, or ``1x/2x`` for fixed-size thumbnails"""
+        if density:
+            return ', '.join(f'{self.src(w)} {i + 1}x' for i, w in enumerate(widths))
+        return ', '.join(f'{self.src(w)} {w}w' for w in widths)
+
+
+class ImageStore:
+    def __init__(self, fetcher=None):
+        self.fetcher = fetcher or http_fetch
+        self.root = None
+        self.max_bytes = None
+        self.allowed_hosts = None
+        self._app = None
+        self._pool = ProcessPool('image')
+        self._pending = set()
+        # url -> (monotonic time of the next attempt, consecutive failures)
+        self._failures = LRUCache(maxsize=4096, ttl=2 * MAX_FAILURE_BACKOFF)
+        self._size = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_CACHE_DIR', os.path.join(app.instance_path, 'images'))
+        app.config.setdefault('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        app.config.setdefault('IMAGE_WORKERS', 2)
+        app.config.setdefault('IMAGE_FETCHER', None)
+        app.config.setdefault('IMAGE_ALLOWED_HOSTS', None)
+        if app.config['IMAGE_FETCHER'] is not None:
+            self.fetcher = app.config['IMAGE_FETCHER']
+        self.root = app.config['IMAGE_CACHE_DIR']
+        self.max_bytes = app.config['IMAGE_CACHE_MAX_BYTES']
+        self._pool.max_workers = app.config['IMAGE_WORKERS']
+        hosts = app.config['IMAGE_ALLOWED_HOSTS']
+        self.allowed_hosts = {h.lower() for h in hosts} if hosts else None
+        self._app = app
+
+    @property
+    def enabled(self):
+        return self._app is not None and Image is not None
+
+    def _ref_path(self, url):
+        return os.path.join(self.root, 'refs', url_key(url))
+
+    def _entry_dir(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def lookup(self, url):
+        """Content digest of a cached URL, or None"""
+        try:
+            with open(self._ref_path(url), encoding='ascii') as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return digest if os.path.isdir(self._entry_dir(digest)) else None
+
+    def cached_image(self, url, it_id=None):
+        """Template helper: a CachedImage, or None (and a queued fetch) on a miss"""
+        if not url or not self.enabled:
+            return None
+        digest = self.lookup(url)
+        if digest is None:
+            self.prefetch(it_id, [url])
+            return None
+        return CachedImage(digest)
+
+    def path(self, digest, width, fmt):
+        """File of one rendition, marking its entry as recently used; None if absent"""
+        if not _DIGEST_RE.match(digest) or width not in WIDTHS or fmt not in IMAGE_FORMATS:
+            return None
+        entry = self._entry_dir(digest)
+        path = os.path.join(entry, f'{width}.{fmt}')
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return path
+
+    def fetchable(self, url):
+        """An http(s) URL whose host passes ``IMAGE_ALLOWED_HOSTS``"""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False
+        return self.allowed_hosts is None or parts.hostname.lower() in self.allowed_hosts
+
+    def prefetch(self, it_id, urls):
+        """Fetch an IT's uncached images in the background, then refresh its page"""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.monotonic()
+            todo = [u for u in dict.fromkeys(urls)
+                    if u and self.fetchable(u) and u not in self._pending
+                    and self._failures.get(u, (0, 0))[0] <= now]
+            todo = [u for u in todo if self.lookup(u) is None]
+            self._pending.update(todo)
+        if todo:
+            self._pool.submit(self._fetch_all, it_id, todo)
+
+    def _fetch_all(self, it_id, urls):
+        stored = False
+        for url in urls:
+            try:
+                self.fetch(url)
+                stored = True
+                self._failures.delete(url)
+            except Exception as e:
+                failures = self._failures.get(url, (0, 0))[1] + 1
+                delay = min(FAILURE_BACKOFF * 2 ** (failures - 1), MAX_FAILURE_BACKOFF)
+                self._failures.set(url, (time.monotonic() + delay, failures))
+                self._app.logger.warning('Image fetch failed for %s (retry in %ds): %s', url, delay, e)
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
+        if stored and it_id is not None:
+            page_cache.invalidate(it_id)
+
+    def fetch(self, url):
+        """Fetch one URL, store its renditions and return the content digest"""
+        data = self.fetcher(url)
+        digest = hashlib.sha256(data).hexdigest()
+        entry = self._entry_dir(digest)
+        if not os.path.isdir(entry):
+            renders = render_thumbnails(data)
+            staging = f'{entry}.{os.getpid()}.{threading.get_ident()}.tmp'
+            os.makedirs(staging, exist_ok=True)
+            for (width, fmt), body in renders.items():
+                with open(os.path.join(staging, f'{width}.{fmt}'), 'wb') as f:
+                    f.write(body)
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # Another worker stored the same content first
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                self._added(sum(len(body) for body in renders.values()))
+
+        ref = self._ref_path(url)
+        os.makedirs(os.path.dirname(ref), exist_ok=True)
+        with open(ref + '.tmp', 'w', encoding='ascii') as f:
+            f.write(digest)
+        os.replace(ref + '.tmp', ref)
+        return digest
+
+    def _added(self, size):
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently served entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.root):
+            if shard.name == 'refs' or not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+                total += size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        with self._lock:
+            self._size = total
+
+
+image_store = ImageStore()
+
+
+def accepts_webp(accept_mimetypes):
+    """True only when the client names WebP; ``*/*`` alone is not enough"""
+    return any(value == 'image/webp' for value in accept_mimetypes.values())
+
+
+def image_urls(values):
+    """The image URL columns of an IT (object or row dict)"""
+    get = values.get if isinstance(values, dict) else lambda c: getattr(values, c)
+    return [get(c) for c in IMAGE_COLUMNS]
+
+
+# Fetch after commit, so a rolled back save never touches the network
+@event.listens_for(ImpossibleTrinity, 'after_insert')
+@event.listens_for(ImpossibleTrinity, 'after_update')
+def _images_changed(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[c].history.has_changes() for c in IMAGE_COLUMNS):
+        defer(target, 'image_fetch', (target.id, tuple(image_urls(target))))
+
+
+@on_commit('image_fetch')
+def _fetch_images(changes):
+    for it_id, urls in changes:
+        image_store.prefetch(it_id, urls)
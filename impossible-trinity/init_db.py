@@ -9,13 +9,14 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app, db
 from models import User, ImpossibleTrinity
+from schema import upgrade_schema
 from datetime import datetime
 
 def init_database():
     """Initialize database with sample data"""
     with app.app_context():
         # Create all tables
-        db.create_all()
+        upgrade_schema()
         print("Database tables created successfully!")
         
         # Check if admin user exists
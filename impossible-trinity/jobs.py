@@ -0,0 +1,177 @@
+"""
+Background jobs for long admin operations
+
+CSV imports and exports run on a small thread pool instead of inside the
+request. Each job is a row in the ``job`` table (status, progress, JSON
+result), so any worker process can report on it, and its files live under
+``JOB_DIR/<id>/`` on local disk. Nothing beyond SQLite and the filesystem is
+needed.
+
+A job's directory is deleted when the job ends, except for a finished
+export's file, which is kept for ``JOB_RETENTION_HOURS`` so it can be
+downloaded and then removed by ``sweep``.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from csvio import count_records, import_rows, iter_csv_bytes, iter_export_batches
+from hooks import ProcessPool
+from models import db, Job, ImpossibleTrinity
+from pagecache import page_cache
+from stats import forget_stats
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_import(job, path, creator_id, on_duplicate='skip', batch_size=1000):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        job.total = count_records(f)
+    db.session.commit()
+
+    def progress(report):
+        job.progress = report.processed
+        job.result = json.dumps(report.as_dict(), ensure_ascii=False)
+        db.session.commit()
+
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = import_rows(f, creator_id, on_duplicate=on_duplicate,
+                                 batch_size=batch_size, progress=progress)
+    finally:
+        page_cache.invalidate(structure=True)
+        forget_stats(creator_id)
+    job.progress = report.processed
+    job.total = report.processed
+    job.result = json.dumps(report.as_dict(), ensure_ascii=False)
+
+
+def run_export(job, compress=False):
+    job.total = db.session.query(ImpossibleTrinity).count()
+    filename = f'impossible_trinities_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    if compress:
+        filename += '.gz'
+    job.output_path = os.path.join(job_runner.job_dir(job.id), filename)
+    db.session.commit()
+
+    def counted(batches):
+        for batch in batches:
+            yield batch
+            job.progress += len(batch)
+            db.session.commit()
+
+    with open(job.output_path, 'wb') as f:
+        for chunk in iter_csv_bytes(counted(iter_export_batches()), compress=compress):
+            f.write(chunk)
+    job.result = json.dumps({'rows': job.progress, 'bytes': os.path.getsize(job.output_path)})
+
+
+HANDLERS = {
+    'import': run_import,
+    'export': run_export,
+}
+
+
+class JobRunner:
+    def __init__(self):
+        self._app = None
+        # Recover once per process, when it starts taking jobs
+        self._pool = ProcessPool('job', on_create=self.recover)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 2)
+        app.config.setdefault('JOB_DIR', os.path.join(app.instance_path, 'jobs'))
+        app.config.setdefault('JOB_RETENTION_HOURS', 24)
+        self._pool.max_workers = app.config['JOB_WORKERS']
+        self._app = app
+
+    def job_dir(self, job_id):
+        path = os.path.join(self._app.config['JOB_DIR'], str(job_id))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _discard_files(self, job):
+        shutil.rmtree(os.path.join(self._app.config['JOB_DIR'], str(job.id)), ignore_errors=True)
+        job.input_path = job.output_path = None
+
+    def recover(self):
+        """Fail jobs whose owning process died before finishing them"""
+        stale = Job.query.filter(Job.status.in_(['queued', 'running'])).all()
+        for job in stale:
+            if job.owner_pid is None or not _pid_alive(job.owner_pid):
+                job.status = 'failed'
+                job.error = '服务重启，任务中断'
+                job.finished_at = datetime.utcnow()
+                self._discard_files(job)
+        db.session.commit()
+
+    def sweep(self):
+        """Delete export files older than ``JOB_RETENTION_HOURS``"""
+        cutoff = datetime.utcnow() - timedelta(hours=self._app.config['JOB_RETENTION_HOURS'])
+        expired = Job.query.filter(Job.output_path.isnot(None), Job.finished_at < cutoff).all()
+        for job in expired:
+            self._discard_files(job)
+        db.session.commit()
+
+    def submit(self, kind, created_by, upload=None, **params):
+        """Record a job, store its upload on disk and queue it; returns the Job"""
+        pool = self._pool.executor()
+        self.sweep()
+        job = Job(kind=kind, created_by=created_by, owner_pid=os.getpid())
+        db.session.add(job)
+        db.session.commit()
+        if upload is not None:
+            job.input_path = os.path.join(self.job_dir(job.id), 'upload.csv')
+            upload.save(job.input_path)
+            params['path'] = job.input_path
+            db.session.commit()
+        pool.submit(self._run, job.id, params)
+        return job
+
+    def _run(self, job_id, params):
+        with self._app.app_context():
+            job = db.session.get(Job, job_id)
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+            try:
+                HANDLERS[job.kind](job, **params)
+                job.status = 'done'
+            except Exception as e:
+                db.session.rollback()
+                job = db.session.get(Job, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+            if job.status != 'done' or not job.output_path:
+                # Uploads are spent once imported; failed exports leave partial files
+                self._discard_files(job)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+
+job_runner = JobRunner()
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
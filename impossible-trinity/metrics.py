@@ -0,0 +1,235 @@
+"""
+Per-request instrumentation: latency, SQL and template timings, profiler
+
+``before_request``/``after_request`` hooks time every request, and
+SQLAlchemy cursor events plus Flask's template signals add up the time spent
+in the database and in Jinja while it runs. The results are:
+
+* a ``Server-Timing`` header on every response (``app``, ``db``, ``tpl``),
+  visible in the browser's network panel;
+* per-endpoint latency histograms, query counts, queries-per-request
+  histograms (an N+1 shows up as a fat tail) and SQL/template seconds,
+  served in Prometheus text format by ``/metrics``;
+* an on-demand sampling profiler: an admin adds ``?_profile=1`` to any URL
+  and gets back, instead of the page, the request's stacks in the folded
+  format (``frame;frame;frame count``) that flamegraph.pl and speedscope read.
+
+Metrics live in process memory, so with several workers each one reports its
+own counters.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; the usual Prometheus latency buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+PROFILE_INTERVAL = 0.001
+PROFILE_ARG = '_profile'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = Counter()
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+class Sampler:
+    """Samples one thread's stack on a timer and folds identical stacks"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.started = time.time()
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_done, app)
+
+    # Request hooks
+    def _before(self):
+        g.metrics = {'start': time.perf_counter(), 'queries': 0, 'sql': 0.0, 'tpl': 0.0, 'tpl_depth': 0}
+        if request.args.get(PROFILE_ARG) and current_user.is_authenticated and current_user.is_admin:
+            g.profiler = Sampler(threading.get_ident())
+            g.profiler.start()
+
+    def _after(self, response):
+        state = g.pop('metrics', None)
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state['start']
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            stats = self._endpoints.get((endpoint, request.method))
+            if stats is None:
+                stats = self._endpoints[(endpoint, request.method)] = EndpointStats()
+            stats.latency.observe(elapsed)
+            stats.queries.observe(state['queries'])
+            stats.statuses[response.status_code] += 1
+            stats.sql_seconds += state['sql']
+            stats.template_seconds += state['tpl']
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response = Response(profiler.stop(), mimetype='text/plain')
+            response.headers['Content-Disposition'] = f'inline; filename="{endpoint}.folded"'
+            response.headers['Cache-Control'] = 'no-store'
+        response.headers['Server-Timing'] = ', '.join([
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={state["sql"] * 1000:.1f};desc="{state["queries"]} queries"',
+            f'tpl;dur={state["tpl"] * 1000:.1f}',
+        ])
+        return response
+
+    def _teardown(self, exc):
+        # after_request is skipped when a view raises; don't leave a sampler running
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+    # Template signals; extends/include render inside the outer template,
+    # so only the outermost render is timed
+    def _template_started(self, sender, template, context, **extra):
+        state = g.get('metrics')
+        if state is not None:
+            if state['tpl_depth'] == 0:
+                state['tpl_start'] = time.perf_counter()
+            state['tpl_depth'] += 1
+
+    def _template_done(self, sender, template, context, **extra):
+        state = g.get('metrics')
+        if state is not None and state['tpl_depth']:
+            state['tpl_depth'] -= 1
+            if state['tpl_depth'] == 0:
+                state['tpl'] += time.perf_counter() - state['tpl_start']
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            items = sorted(self._endpoints.items())
+            lines = [
+                '# HELP it_request_duration_seconds Request latency by endpoint',
+                '# TYPE it_request_duration_seconds histogram',
+            ]
+            for (endpoint, method), stats in items:
+                lines.extend(stats.latency.lines(
+                    'it_request_duration_seconds', f'endpoint="{_label(endpoint)}",method="{method}"'))
+            lines += [
+                '# HELP it_requests_total Responses by endpoint and status',
+                '# TYPE it_requests_total counter',
+            ]
+            for (endpoint, method), stats in items:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'it_requests_total{{endpoint="{_label(endpoint)}",method="{method}",'
+                                 f'status="{status}"}} {count}')
+            lines += [
+                '# HELP it_sql_queries_per_request SQL statements executed per request',
+                '# TYPE it_sql_queries_per_request histogram',
+            ]
+            for (endpoint, method), stats in items:
+                lines.extend(stats.queries.lines(
+                    'it_sql_queries_per_request', f'endpoint="{_label(endpoint)}",method="{method}"'))
+            for name, attr, help_text in (
+                ('it_sql_seconds_total', 'sql_seconds', 'Time spent executing SQL'),
+                ('it_template_seconds_total', 'template_seconds', 'Time spent rendering templates'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (endpoint, method), stats in items:
+                    lines.append(f'{name}{{endpoint="{_label(endpoint)}",method="{method}"}} '
+                                 f'{getattr(stats, attr):.6f}')
+        lines += [
+            '# HELP it_process_start_time_seconds Start time of this worker process',
+            '# TYPE it_process_start_time_seconds gauge',
+            f'it_process_start_time_seconds {self.started:.0f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# Every engine; statements outside a request (jobs, flushers) are not counted
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_done(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        state = g.get('metrics')
+        if state is not None:
+            state['queries'] += 1
+            state['sql'] += time.perf_counter() - conn.info['query_start']
@@ -19,6 +19,27 @@ class User(UserMixin, db.Model):
 
 class ImpossibleTrinity(db.Model):
     """Impossible Trinity (IT) model"""
+    __table_args__ = (
+        # Serves the newest-first feed and its keyset pagination
+        db.Index('ix_impossible_trinity_created_at_id', 'created_at', 'id'),
+        # Natural key used to deduplicate CSV imports
+        db.Index('ix_impossible_trinity_name_field', 'name', 'field'),
+        # Field filter on the feed, already in feed order
+        db.Index('ix_impossible_trinity_field_created_at_id', 'field', 'created_at', 'id'),
+        # "My ITs" on the dashboard
+        db.Index('ix_impossible_trinity_creator_id_created_at', 'creator_id', 'created_at'),
+        # Admin grid sort orders (see grid.py)
+        db.Index('ix_impossible_trinity_name_created_at', 'name', 'created_at'),
+        db.Index('ix_impossible_trinity_agree_count_created_at', 'agree_count', 'created_at'),
+        db.Index('ix_impossible_trinity_comments_count_created_at', 'comments_count', 'created_at'),
+        # Hot and top feeds (see ranking.py), with and without the field filter
+        db.Index('ix_impossible_trinity_hot_score_id', 'hot_score', 'id'),
+        db.Index('ix_impossible_trinity_field_hot_score_id', 'field', 'hot_score', 'id'),
+        db.Index('ix_impossible_trinity_field_agree_count_created_at', 'field', 'agree_count', 'created_at'),
+        # Edits since a saved related model, re-read by each process (related.py)
+        db.Index('ix_impossible_trinity_updated_at', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     name_en = db.Column(db.String(200), default='Impossible Trinity')
@@ -29,6 +50,10 @@ class ImpossibleTrinity(db.Model):
     description = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     agree_count = db.Column(db.Integer, default=0)
+    # Denormalized COUNT of comments, maintained by counters.py
+    comments_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Time-decayed engagement for the hot feed, maintained by ranking.py
+    hot_score = db.Column(db.Float, default=0, server_default='0', nullable=False)
     hyperlink = db.Column(db.String(500))
     feature_image_url = db.Column(db.String(500))
     element1_image_url = db.Column(db.String(500))
@@ -52,6 +77,11 @@ class ImpossibleTrinity(db.Model):
 
 class Comment(db.Model):
     """Comment model for IT"""
+    __table_args__ = (
+        # Comments of one IT in posting order
+        db.Index('ix_comment_it_id_created_at', 'it_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -59,3 +89,52 @@ class Comment(db.Model):
     # Foreign keys
     it_id = db.Column(db.Integer, db.ForeignKey('impossible_trinity.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+class Agree(db.Model):
+    """One user's agree on one IT; the composite key makes agreeing idempotent"""
+    __table_args__ = (
+        # The primary key leads with user_id; this one serves per-IT deletes
+        db.Index('ix_agree_it_id', 'it_id'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    it_id = db.Column(db.Integer, db.ForeignKey('impossible_trinity.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Related(db.Model):
+    """One precomputed neighbour of an IT, ranked 0..k-1; maintained by related.py"""
+    __table_args__ = (
+        # Lists that mention an IT, rescored when it changes or goes away
+        db.Index('ix_related_related_id', 'related_id'),
+    )
+
+    it_id = db.Column(db.Integer, db.ForeignKey('impossible_trinity.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('impossible_trinity.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+class Field(db.Model):
+    """Field catalogue: one row per distinct ImpossibleTrinity.field, maintained by catalogue.py"""
+    name = db.Column(db.String(100), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    """Background admin job (CSV import/export), executed by jobs.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    # queued, running, done or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    # JSON report written by the handler
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    input_path = db.Column(db.String(500))
+    output_path = db.Column(db.String(500))
+    # Process that owns the job, used to detect jobs orphaned by a restart
+    owner_pid = db.Column(db.Integer)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
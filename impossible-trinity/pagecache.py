@@ -0,0 +1,162 @@
+"""
+Rendered page cache for the public pages
+
+``index()`` and ``detail()`` are cached as rendered HTML keyed on the route,
+its query arguments and the viewer (anonymous visitors share one entry, logged
+in users get their own). Invalidation is generation based: every key embeds
+the current value of a few counters and write paths bump exactly the counters
+they affect, which orphans the stale entries at once without scanning.
+
+* ``list``        -- anything shown on index cards
+* ``structure``   -- the set/order/titles of ITs (prev/next links on detail)
+* ``item:<id>``   -- one IT's detail page
+
+Each entry carries an ETag, so a revalidating browser gets ``304 Not Modified``
+without the view running at all.
+
+The default backend is an in-process LRU. Setting ``PAGE_CACHE_URL`` to a
+``redis://`` URL (requires the ``redis`` package) shares entries and
+generations between worker processes. The in-process backend is only correct
+with a single process: a write handled by one worker would not invalidate the
+others' copies, so ``require_shared`` turns it off when several serve the app.
+"""
+
+import hashlib
+import threading
+from functools import wraps
+
+from flask import request, session, make_response
+from flask_login import current_user
+
+from cache import LRUCache
+
+
+class MemoryBackend:
+    """Per-process backend: LRU entries plus unbounded generation counters"""
+
+    def __init__(self, maxsize, ttl):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def generation(self, name):
+        return self.generations.get(name, 0)
+
+    def bump(self, name):
+        with self._lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+
+class RedisBackend:
+    """Shared backend for multi-process deployments"""
+
+    def __init__(self, url, ttl):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.hgetall('page:' + key)
+        if not raw:
+            return None
+        return raw[b'etag'].decode('ascii'), raw[b'body'].decode('utf-8')
+
+    def set(self, key, value):
+        etag, body = value
+        pipe = self.client.pipeline()
+        pipe.hset('page:' + key, mapping={'etag': etag, 'body': body})
+        pipe.expire('page:' + key, self.ttl)
+        pipe.execute()
+
+    def generation(self, name):
+        return int(self.client.get('gen:' + name) or 0)
+
+    def bump(self, name):
+        self.client.incr('gen:' + name)
+
+
+class PageCache:
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_TTL', 60)
+        app.config.setdefault('PAGE_CACHE_SIZE', 1024)
+        app.config.setdefault('PAGE_CACHE_URL', None)
+        ttl = app.config['PAGE_CACHE_TTL']
+        if not ttl:
+            self.backend = None
+        elif app.config['PAGE_CACHE_URL']:
+            self.backend = RedisBackend(app.config['PAGE_CACHE_URL'], ttl)
+        else:
+            self.backend = MemoryBackend(app.config['PAGE_CACHE_SIZE'], ttl)
+
+    def require_shared(self, workers, logger):
+        """Turn off an in-process cache when ``workers`` processes serve the app"""
+        if workers > 1 and isinstance(self.backend, MemoryBackend):
+            logger.warning('Page cache disabled: %d workers need a shared PAGE_CACHE_URL', workers)
+            self.backend = None
+
+    def invalidate(self, it_id=None, structure=False):
+        """Called by write paths: always stales index pages, plus the given scopes"""
+        if self.backend is None:
+            return
+        self.backend.bump('list')
+        if structure:
+            self.backend.bump('structure')
+        if it_id is not None:
+            self.backend.bump(f'item:{it_id}')
+
+    def cached(self, scopes, args=()):
+        """Cache a GET view's rendered HTML
+
+        ``scopes(view_args)`` returns the generation names the page depends
+        on; ``args`` lists the query arguments that select different content.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**view_args):
+                # Pages carrying flash messages are one-off renders
+                if self.backend is None or session.get('_flashes'):
+                    return view(**view_args)
+
+                viewer = f'u{current_user.id}' if current_user.is_authenticated else 'anon'
+                generations = ','.join(
+                    f'{name}={self.backend.generation(name)}' for name in scopes(view_args)
+                )
+                key = '|'.join([
+                    request.endpoint,
+                    repr(sorted(view_args.items())),
+                    repr([request.args.get(a, '') for a in args]),
+                    viewer,
+                    generations,
+                ])
+
+                entry = self.backend.get(key)
+                if entry is None:
+                    body = view(**view_args)
+                    if not isinstance(body, str):
+                        return body
+                    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+                    entry = (etag, body)
+                    self.backend.set(key, entry)
+
+                etag, body = entry
+                response = make_response(body)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = (
+                    'private, no-cache' if viewer != 'anon' else 'public, no-cache'
+                )
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+page_cache = PageCache()
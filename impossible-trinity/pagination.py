@@ -0,0 +1,109 @@
+"""
+Keyset (cursor) pagination helpers
+
+Instead of OFFSET, a page is fetched with ``WHERE (col, id) < (:col, :id)``
+against an index on the ordering columns, so page 1000 costs the same as page 1.
+The cursor handed to clients is an opaque url-safe token of the last row's
+ordering values, tagged with the ordering it came from: a cursor is only
+accepted by the same columns in the same direction, and each value must have
+its column's type.
+"""
+
+import base64
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+
+
+def _order_tag(columns, descending):
+    """Short tag identifying an ordering (column names and direction)"""
+    name = ('-' if descending else '+') + ','.join(c.key for c in columns)
+    return format(zlib.crc32(name.encode('utf-8')), '08x')
+
+
+def _cursor_value(column, value):
+    if value is None:
+        return None
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return value
+    if expected is datetime:
+        if not isinstance(value, str):
+            raise ValueError('invalid cursor')
+        return datetime.fromisoformat(value)
+    if isinstance(value, bool):
+        raise ValueError('invalid cursor')
+    if expected is float:
+        expected = (int, float)
+    if not isinstance(value, expected):
+        raise ValueError('invalid cursor')
+    return value
+
+
+def encode_cursor(values, columns, descending=True):
+    """Pack the ordering values of ``columns`` into an opaque url-safe token"""
+    payload = [_order_tag(columns, descending)]
+    payload += [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor, columns, descending=True):
+    """Unpack a cursor for the given ordering, raising ValueError if malformed
+
+    A cursor issued for another ordering, or holding a value of the wrong
+    type, is malformed too.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+    if (not isinstance(payload, list) or len(payload) != len(columns) + 1
+            or payload[0] != _order_tag(columns, descending)):
+        raise ValueError('invalid cursor')
+    return [_cursor_value(column, value) for column, value in zip(columns, payload[1:])]
+
+
+def keyset_page(query, columns, cursor=None, per_page=12, descending=True):
+    """Fetch one page of ``query`` ordered by ``columns`` after ``cursor``
+
+    ``columns`` must end with a unique column (normally the primary key) so the
+    ordering is total. Returns ``(items, next_cursor)``; ``next_cursor`` is None
+    on the last page. Only ``per_page + 1`` rows are read and no COUNT is run.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns, descending)
+        if descending:
+            query = query.filter(tuple_(*columns) < tuple_(*values))
+        else:
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns], columns, descending)
+    return rows, next_cursor
+
+
+def neighbours(session, columns, values):
+    """Primary keys of the rows either side of ``values`` in ``columns`` order
+
+    Returns ``(before, after)``: the nearest row with a greater key and the
+    nearest with a smaller one, i.e. the previous and next rows of a
+    descending listing. Both are index seeks issued as a single statement.
+    """
+    key, at, pk = tuple_(*columns), tuple_(*values), columns[-1]
+    before = (
+        select(pk).where(key > at).order_by(*[c.asc() for c in columns]).limit(1).scalar_subquery()
+    )
+    after = (
+        select(pk).where(key < at).order_by(*[c.desc() for c in columns]).limit(1).scalar_subquery()
+    )
+    return tuple(session.execute(select(before, after)).one())
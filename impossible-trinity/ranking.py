@@ -0,0 +1,81 @@
+"""
+Hot ranking: a stored, indexed ``hot_score`` per IT
+
+    hot_score = log2(1 + agrees + COMMENT_WEIGHT * comments)
+                + hours from EPOCH to created_at / HALF_LIFE_HOURS
+
+Age enters through the creation time rather than ``now - created_at``, so a
+score never has to decay: at any moment, ordering by it is the same as
+ordering by ``engagement * 2 ** (-age / HALF_LIFE_HOURS)``, the usual
+exponential time decay (twice the engagement buys an IT one half-life of
+age). A score therefore only changes when its counters do, and the UPDATEs
+that bump ``agree_count`` and ``comments_count`` (counters.py) set it in the
+same statement through the ``it_hot_score`` SQL function registered below.
+The ``(hot_score, id)`` index then pages the hot feed exactly like
+``(created_at, id)`` pages the newest-first one.
+
+``refresh_hot_scores`` recomputes every score from the counters in one
+statement and rewrites only rows that drifted: rows written around the
+counters (bulk loads, ``repair-counters``) or scored by an older formula.
+Scores never decay, so only that drift needs a periodic pass: run
+``flask refresh-hot`` from cron, once for the whole database, rather than
+from every web process.
+"""
+
+import math
+from datetime import datetime
+
+from sqlalchemy import event, func, update
+from sqlalchemy.engine import Engine
+
+from models import ImpossibleTrinity
+
+EPOCH = datetime(2020, 1, 1)
+HALF_LIFE_HOURS = 24
+# A comment takes more effort than an agree click
+COMMENT_WEIGHT = 2
+
+
+def hot_score(agrees, comments, created_at):
+    """Score of an IT with these counters, created at ``created_at`` (datetime or SQLite text)"""
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    hours = (created_at - EPOCH).total_seconds() / 3600 if created_at else 0.0
+    engagement = max(0, (agrees or 0) + COMMENT_WEIGHT * (comments or 0))
+    return math.log2(1 + engagement) + hours / HALF_LIFE_HOURS
+
+
+@event.listens_for(Engine, 'connect')
+def _register_function(dbapi_connection, connection_record):
+    # sqlite3 only; the same Python function scores rows inside UPDATEs
+    if hasattr(dbapi_connection, 'create_function'):
+        dbapi_connection.create_function('it_hot_score', 3, hot_score, deterministic=True)
+
+
+def hot_score_expr(table, agrees=None, comments=None):
+    """SQL for a row's score; pass the new counter values when they change in the same UPDATE"""
+    return func.it_hot_score(
+        func.coalesce(table.c.agree_count, 0) if agrees is None else agrees,
+        table.c.comments_count if comments is None else comments,
+        table.c.created_at,
+    )
+
+
+@event.listens_for(ImpossibleTrinity, 'before_insert')
+def _score_new(mapper, connection, target):
+    if target.created_at is None:
+        target.created_at = datetime.utcnow()
+    target.hot_score = hot_score(target.agree_count, target.comments_count, target.created_at)
+
+
+def refresh_hot_scores(connection):
+    """Recompute every IT's score from its counters; returns the number of rows changed"""
+    trinities = ImpossibleTrinity.__table__
+    score = hot_score_expr(trinities)
+    return connection.execute(
+        update(trinities)
+        .where(trinities.c.hot_score.is_distinct_from(score))
+        # A rescore is not an edit: keep updated_at's onupdate out of it
+        .values(hot_score=score, updated_at=trinities.c.updated_at)
+    ).rowcount
+
@@ -0,0 +1,578 @@
+"""
+Related trinities for the detail page
+
+Every IT is a TF-IDF vector over the tokens ``search.tokenize`` produces (CJK
+bigrams plus each run's last character, lowercased words). Name and elements
+weigh more than field and description, so "CAP" and "project triangle" meet on
+what they trade off rather than on shared filler. Cosine similarity ranks the
+neighbours, and the top ``RELATED_K`` of each IT are stored in the ``related``
+table. ``detail()`` then reads them with one primary-key range scan.
+
+Candidates are pruned, so no IT is ever scored against every other one. Only
+tokens that appear in at most ``MAX_DF`` ITs propose candidates: one sparse
+product over those columns, a block of rows at a time. Each candidate pair is
+then scored exactly, common tokens included. Pairs that share nothing but
+common tokens are never scored. Their IDF weight is low anyway, so they rarely
+make a top list. The cost grows with the number of candidate pairs, not with
+the square of the IT count.
+
+``flask rebuild-related`` is the only full rebuild. It fits the model, rewrites
+the table and saves the model to ``RELATED_MODEL_PATH`` (by default beside
+the SQLite file). Web processes never
+rebuild. Each one loads the saved model on its first change and keeps it
+current from a single background thread:
+
+* rows edited since the model was saved, by any process, are re-read
+  (``updated_at`` tells which);
+* the changed ITs' rows go to a small side matrix, folded into the base
+  matrix every ``MERGE_ROWS`` changes;
+* only the lists the changes enter or drop out of are recomputed, and ITs
+  they name that another process deleted are dropped from the model.
+
+A web process keeps its dense copy of the common-token columns under
+``DENSE_COMMON_BYTES`` and scores the rest sparsely.
+
+Until the first rebuild, changes are ignored and detail pages show nothing.
+IDF weights and the vocabulary stay as last fitted, so new words count only
+after the next rebuild. Run one after large imports.
+
+NumPy and SciPy are listed in requirements.txt. Without them the table is
+neither built nor updated, and detail pages show no related items.
+"""
+
+import math
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, inspect, insert, or_, select
+from sqlalchemy.engine import make_url
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+
+from hooks import ProcessPool, defer, on_commit
+from models import db, ImpossibleTrinity, Related
+from pagecache import page_cache
+from search import tokenize
+
+RELATED_K = 6
+MIN_SCORE = 0.05
+# Token weight per column
+TEXT_WEIGHTS = {
+    'name': 3.0,
+    'element1': 3.0,
+    'element2': 3.0,
+    'element3': 3.0,
+    'field': 2.0,
+    'description': 1.0,
+}
+# Tokens in more ITs than this only add to scores, they do not propose candidates
+MAX_DF = 1000
+# Rows per block of candidate generation
+BLOCK_ROWS = 256
+# Common-token columns are scored from a dense float32 copy when it fits in
+# this: a small cap for the model each web process keeps, a larger one for the
+# short-lived model of a full rebuild
+DENSE_COMMON_BYTES = 16 * 1024 * 1024
+REBUILD_DENSE_BYTES = 256 * 1024 * 1024
+# Changed rows kept beside the base matrix before it is rebuilt with them
+MERGE_ROWS = 2000
+# Lists queried per IN (...) when checking which lists a change enters
+QUERY_CHUNK = 5000
+# Edits committed this close to a sync may not have been visible to it
+SYNC_MARGIN = timedelta(seconds=30)
+
+
+def term_counts(row):
+    """Weighted token counts of one IT row (a mapping with the TEXT_WEIGHTS columns)"""
+    counts = Counter()
+    for column, weight in TEXT_WEIGHTS.items():
+        for token in tokenize(row[column]):
+            counts[token] += weight
+    return counts
+
+
+def _documents(connection, ids=None, updated_since=None):
+    trinities = ImpossibleTrinity.__table__
+    stmt = select(trinities.c.id, *(trinities.c[c] for c in TEXT_WEIGHTS)).order_by(trinities.c.id)
+    if ids is not None:
+        stmt = stmt.where(trinities.c.id.in_(list(ids)))
+    if updated_since is not None:
+        stmt = stmt.where(trinities.c.updated_at > updated_since)
+    return connection.execute(stmt).mappings().all()
+
+
+def _missing(connection, it_ids):
+    """The ids among ``it_ids`` that no longer exist"""
+    trinities = ImpossibleTrinity.__table__
+    it_ids = list(it_ids)
+    existing = set()
+    for start in range(0, len(it_ids), QUERY_CHUNK):
+        existing.update(connection.execute(
+            select(trinities.c.id).where(trinities.c.id.in_(it_ids[start:start + QUERY_CHUNK]))
+        ).scalars())
+    return set(it_ids) - existing
+
+
+def _store(connection, lists):
+    """Replace the stored lists of the given ITs"""
+    table = Related.__table__
+    if not lists:
+        return
+    connection.execute(delete(table).where(table.c.it_id.in_(list(lists))))
+    rows = [
+        {'it_id': it_id, 'rank': rank, 'related_id': related_id, 'score': score}
+        for it_id, neighbours in lists.items()
+        for rank, (related_id, score) in enumerate(neighbours)
+    ]
+    if rows:
+        connection.execute(insert(table), rows)
+
+
+def _row_dots(query, local, right, rows):
+    """Dot products of ``query[local]`` with ``right[rows]``, pair by pair"""
+    if isinstance(right, np.ndarray):
+        return np.einsum('ij,ij->i', query.toarray().astype(np.float32)[local], right[rows])
+    return np.asarray(query[local].multiply(right[rows]).sum(axis=1)).ravel()
+
+
+class RelatedModel:
+    """L2-normalised TF-IDF rows of every IT, plus the fitted vocabulary
+
+    ``synced_at`` is the ``updated_at`` up to which the rows are current.
+    Rows live in the base ``matrix`` as fitted or last merged, except rows
+    changed since, which live in the small ``side`` matrix; ``live`` masks the
+    base rows they superseded. An edit thus costs the size of the side
+    matrix, not of the model. ``dense_bytes`` caps the dense copy of the
+    common-token columns.
+    """
+
+    def __init__(self, vocab, idf, df, ids, matrix, synced_at, dense_bytes=DENSE_COMMON_BYTES):
+        self.vocab = vocab
+        self.idf = idf
+        self.common = df > MAX_DF
+        self.df = df
+        self.ids = ids
+        self.pos = {it_id: i for i, it_id in enumerate(ids) if it_id is not None}
+        self.matrix = matrix
+        self.live = np.array([i is not None for i in ids], dtype=bool)
+        self.side = sparse.csr_matrix((0, len(vocab)))
+        self.side_pos = np.zeros(0, dtype=np.int64)
+        # position -> row of the side matrix
+        self.side_row = {}
+        self.synced_at = synced_at
+        self.dense_bytes = dense_bytes
+        self._split = None
+        self._side_split = None
+
+    @classmethod
+    def fit(cls, rows, synced_at, dense_bytes=DENSE_COMMON_BYTES):
+        counts = [term_counts(row) for row in rows]
+        df = Counter(token for c in counts for token in c)
+        n = len(rows)
+        vocab = {token: i for i, token in enumerate(df)}
+        model = cls(
+            vocab,
+            np.array([math.log((1 + n) / (1 + df[t])) + 1 for t in vocab]),
+            np.array([df[t] for t in vocab], dtype=np.int64),
+            [row['id'] for row in rows],
+            None,
+            synced_at,
+            dense_bytes,
+        )
+        model.matrix = model._vectors(counts)
+        return model
+
+    def save(self, path):
+        """Write the model to ``path`` (.npz), atomically"""
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        if self.side.shape[0]:
+            self.merge()
+        m = self.matrix.tocsr()
+        np.savez(
+            tmp, data=m.data, indices=m.indices, indptr=m.indptr, shape=np.array(m.shape),
+            vocab=np.array(list(self.vocab), dtype=str), idf=self.idf, df=self.df,
+            ids=np.array([-1 if i is None else i for i in self.ids], dtype=np.int64),
+            synced_at=np.array(self.synced_at.isoformat()),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            matrix = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+            return cls(
+                {token: i for i, token in enumerate(f['vocab'].tolist())},
+                f['idf'],
+                f['df'],
+                [None if i < 0 else i for i in f['ids'].tolist()],
+                matrix,
+                datetime.fromisoformat(str(f['synced_at'])),
+            )
+
+    def _vectors(self, counts_list):
+        indptr, indices, data = [0], [], []
+        for counts in counts_list:
+            for token, count in counts.items():
+                column = self.vocab.get(token)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+            indptr.append(len(indices))
+        indices = np.array(indices, dtype=np.int32)
+        data = (1 + np.log(np.array(data, dtype=float))) * self.idf[indices]
+        matrix = sparse.csr_matrix((data, indices, np.array(indptr)), shape=(len(counts_list), len(self.vocab)))
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        norms[norms == 0] = 1
+        return (sparse.diags(1 / norms) @ matrix).tocsr()
+
+    def replace(self, rows):
+        """Set (or append) the vectors of ``(it_id, counts)`` pairs
+
+        The vectors go to the side matrix; the base rows they supersede are
+        only masked. The base is rebuilt once the side holds ``MERGE_ROWS``.
+        """
+        if not rows:
+            return
+        vectors = self._vectors([counts for _, counts in rows])
+        positions = []
+        for it_id, _ in rows:
+            p = self.pos.get(it_id)
+            if p is None:
+                p = self.pos[it_id] = len(self.ids)
+                self.ids.append(it_id)
+            self._drop(p)
+            positions.append(p)
+        first = self.side.shape[0]
+        self.side = sparse.vstack([self.side, vectors], format='csr')
+        self.side_pos = np.concatenate([self.side_pos, positions])
+        for i, p in enumerate(positions):
+            self.side_row[p] = first + i
+        if self.side.shape[0] >= MERGE_ROWS:
+            self.merge()
+
+    def remove(self, it_ids):
+        """Drop the rows of deleted ITs (positions stay stable)"""
+        for it_id in it_ids:
+            p = self.pos.pop(it_id, None)
+            if p is not None:
+                self.ids[p] = None
+                self._drop(p)
+
+    def _drop(self, p):
+        if p < len(self.live):
+            self.live[p] = False
+        row = self.side_row.pop(p, None)
+        if row is not None:
+            self.side_pos[row] = -1
+
+    def merge(self):
+        """Fold the side matrix into a new base matrix (cost: the whole model)"""
+        n = len(self.ids)
+        base = sparse.diags(self.live.astype(float)) @ self.matrix
+        base = sparse.vstack([base, sparse.csr_matrix((n - base.shape[0], base.shape[1]))], format='csr')
+        rows = np.flatnonzero(self.side_pos >= 0)
+        scatter = sparse.csr_matrix(
+            (np.ones(len(rows)), (self.side_pos[rows], rows)), shape=(n, self.side.shape[0])
+        )
+        self.matrix = (base + scatter @ self.side).tocsr()
+        self.matrix.eliminate_zeros()
+        self.live = np.array([i is not None for i in self.ids])
+        self.side = sparse.csr_matrix((0, len(self.vocab)))
+        self.side_pos = np.zeros(0, dtype=np.int64)
+        self.side_row = {}
+        self._split = None
+
+    def _rows(self, positions):
+        """Current vectors of the given positions, in order"""
+        base = [i for i, p in enumerate(positions) if p not in self.side_row]
+        side = [i for i, p in enumerate(positions) if p in self.side_row]
+        if not side:
+            return self.matrix[positions]
+        stacked = sparse.vstack([
+            self.matrix[[positions[i] for i in base]],
+            self.side[[self.side_row[positions[i]] for i in side]],
+        ], format='csr')
+        order = np.empty(len(positions), dtype=np.int64)
+        order[base + side] = np.arange(len(positions))
+        return stacked[order]
+
+    def _split_columns(self, matrix, dense_bytes):
+        """``(rare, rare transposed, common)`` parts of ``matrix``
+
+        ``common`` is dense when it fits in ``dense_bytes``: few tokens are
+        common, but they hold most of the non-zeros, and dense rows multiply
+        much faster.
+        """
+        rare = matrix[:, np.flatnonzero(~self.common)].tocsr()
+        common = matrix[:, np.flatnonzero(self.common)].tocsr()
+        if common.shape[0] * common.shape[1] * 4 <= dense_bytes:
+            common = common.toarray().astype(np.float32)
+        return rare, rare.T.tocsr(), common
+
+    def _parts(self):
+        """Split base and side matrices, each cached until it changes"""
+        if self._split is None or self._split[0] is not self.matrix:
+            self._split = (self.matrix, self._split_columns(self.matrix, self.dense_bytes))
+        if self._side_split is None or self._side_split[0] is not self.side:
+            self._side_split = (self.side, self._split_columns(self.side, 0))
+        return self._split[1], self._side_split[1]
+
+    def candidates(self, positions):
+        """Candidate pairs of the given rows: ``(csr block x ITs, exact scores)`` per block
+
+        The block's ``indices``/``indptr`` give each row's candidates, and the
+        scores align with ``indices``. A row is never its own candidate.
+        """
+        (rare, rare_t, common), (side_rare, side_rare_t, side_common) = self._parts()
+        rare_columns = np.flatnonzero(~self.common)
+        common_columns = np.flatnonzero(self.common)
+        side_of = np.full(len(self.ids), -1, dtype=np.int64)
+        live_side = np.flatnonzero(self.side_pos >= 0)
+        side_of[self.side_pos[live_side]] = live_side
+        positions = np.asarray(list(positions), dtype=np.int64)
+        for start in range(0, len(positions), BLOCK_ROWS):
+            block = positions[start:start + BLOCK_ROWS]
+            query = self._rows(block.tolist())
+            query_rare = query[:, rare_columns].tocsr()
+            # Rare-token products against live base rows and live side rows
+            base = (query_rare @ rare_t).tocoo()
+            keep = self.live[base.col]
+            side = (query_rare @ side_rare_t).tocoo()
+            side_cols = self.side_pos[side.col]
+            side_keep = side_cols >= 0
+            pairs = sparse.csr_matrix((
+                np.concatenate([base.data[keep], side.data[side_keep]]),
+                (np.concatenate([base.row[keep], side.row[side_keep]]),
+                 np.concatenate([base.col[keep], side_cols[side_keep]])),
+            ), shape=(len(block), len(self.ids)))
+            pairs.sort_indices()
+            local = np.repeat(np.arange(len(block)), np.diff(pairs.indptr))
+            rows = block[local]
+            scores = pairs.data.copy()
+            if common_columns.size and len(rows):
+                query_common = query[:, common_columns].tocsr()
+                in_side = side_of[pairs.indices]
+                base_pairs = in_side < 0
+                if base_pairs.any():
+                    scores[base_pairs] += _row_dots(
+                        query_common, local[base_pairs], common, pairs.indices[base_pairs])
+                if not base_pairs.all():
+                    scores[~base_pairs] += _row_dots(
+                        query_common, local[~base_pairs], side_common, in_side[~base_pairs])
+            scores[pairs.indices == rows] = 0
+            yield block, pairs, scores
+
+    def top(self, positions):
+        """``{it_id: [(related_id, score), ...]}`` for the given row positions"""
+        lists = {}
+        for block, pairs, scores in self.candidates(positions):
+            for i, p in enumerate(block):
+                lo, hi = pairs.indptr[i], pairs.indptr[i + 1]
+                cols, row = pairs.indices[lo:hi], scores[lo:hi]
+                keep = row >= MIN_SCORE
+                cols, row = cols[keep], row[keep]
+                best = np.argpartition(-row, RELATED_K)[:RELATED_K] if len(row) > RELATED_K else np.arange(len(row))
+                best = best[np.argsort(-row[best], kind='stable')]
+                lists[self.ids[p]] = [
+                    (self.ids[cols[j]], round(float(row[j]), 6)) for j in best
+                    if self.ids[cols[j]] is not None
+                ]
+        return lists
+
+
+def _default_model_path(app):
+    """Beside the SQLite file (``<db>.related.npz``), so a model never meets another database"""
+    url = make_url(app.config.get('SQLALCHEMY_DATABASE_URI') or 'sqlite://')
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        return os.path.join(app.instance_path, url.database) + '.related.npz'
+    return os.path.join(app.instance_path, 'related_model.npz')
+
+
+class RelatedIndex:
+    """Keeps the ``related`` table current from a single background thread"""
+
+    def __init__(self):
+        self.model = None
+        self.model_path = None
+        self._app = None
+        self._pool = ProcessPool('related', on_create=self._reset_queue)
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._deleted = set()
+        self._queued = False
+
+    def init_app(self, app):
+        app.config.setdefault('RELATED_MODEL_PATH', _default_model_path(app))
+        self.model_path = app.config['RELATED_MODEL_PATH']
+        self._app = app
+
+    @property
+    def enabled(self):
+        return self._app is not None and np is not None
+
+    def _reset_queue(self):
+        # A forked child inherits the flag, but not the thread that would clear it
+        self._queued = False
+
+    def schedule(self, changed=(), deleted=()):
+        """Queue ITs whose text changed or that were deleted; updates are coalesced"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._changed.update(changed)
+            self._deleted.update(deleted)
+            pool = self._pool.executor()
+            if self._queued:
+                return
+            self._queued = True
+        pool.submit(self._drain)
+
+    def _drain(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            deleted, self._deleted = self._deleted, set()
+            self._queued = False
+        with self._app.app_context():
+            try:
+                connection = db.session.connection()
+                if self._load(connection):
+                    self.update(connection, changed - deleted, deleted)
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.model = None
+                self._app.logger.exception('Updating related ITs failed')
+
+    def _load(self, connection):
+        """Load the saved model if needed and catch up with other processes' edits
+
+        Returns False until ``flask rebuild-related`` has saved a model.
+        """
+        if self.model is None:
+            if not os.path.exists(self.model_path):
+                return False
+            self.model = RelatedModel.load(self.model_path)
+        model = self.model
+        now = datetime.utcnow()
+        rows = _documents(connection, updated_since=model.synced_at - SYNC_MARGIN)
+        model.replace([(row['id'], term_counts(row)) for row in rows])
+        model.synced_at = now
+        return True
+
+    def rebuild(self, connection):
+        """Fit the model on every IT, rewrite the whole table and save the model
+
+        Batch work for ``flask rebuild-related``; returns the IT count.
+        """
+        synced_at = datetime.utcnow()
+        model = RelatedModel.fit(_documents(connection), synced_at, REBUILD_DENSE_BYTES)
+        connection.execute(delete(Related.__table__))
+        for start in range(0, len(model.ids), BLOCK_ROWS):
+            _store(connection, model.top(range(start, min(start + BLOCK_ROWS, len(model.ids)))))
+        os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+        model.save(self.model_path)
+        self.model = model
+        page_cache.invalidate(structure=True)
+        return len(model.ids)
+
+    def update(self, connection, changed, deleted):
+        """Apply changed/deleted ITs to the model and the affected lists"""
+        model = self.model
+        table = Related.__table__
+        touched = list(set(changed) | set(deleted))
+        # Lists that currently show a touched IT may need a replacement
+        affected = set()
+        for start in range(0, len(touched), QUERY_CHUNK):
+            affected.update(connection.execute(
+                select(table.c.it_id).where(table.c.related_id.in_(touched[start:start + QUERY_CHUNK]))
+            ).scalars())
+
+        model.remove(deleted)
+        model.replace([(row['id'], term_counts(row)) for row in _documents(connection, changed)])
+        changed = [i for i in changed if i in model.pos]
+        affected.update(changed)
+
+        # Lists the changed ITs now enter: similarity is symmetric, so these are
+        # the candidates of the changed rows that would make the cut
+        entering = {}
+        for block, pairs, scores in model.candidates(model.pos[i] for i in changed):
+            for p, score in zip(pairs.indices[scores >= MIN_SCORE], scores[scores >= MIN_SCORE]):
+                if model.ids[p] is not None:
+                    entering[model.ids[p]] = max(score, entering.get(model.ids[p], 0))
+        candidates = [i for i in entering if i not in affected]
+        for start in range(0, len(candidates), QUERY_CHUNK):
+            chunk = candidates[start:start + QUERY_CHUNK]
+            weakest = {
+                it_id: (low, count) for it_id, low, count in connection.execute(
+                    select(table.c.it_id, func.min(table.c.score), func.count())
+                    .where(table.c.it_id.in_(chunk)).group_by(table.c.it_id)
+                )
+            }
+            for it_id in chunk:
+                low, count = weakest.get(it_id, (0.0, 0))
+                if count < RELATED_K or entering[it_id] > low:
+                    affected.add(it_id)
+
+        affected = [i for i in affected if i in model.pos]
+        if deleted:
+            connection.execute(delete(table).where(
+                or_(table.c.it_id.in_(list(deleted)), table.c.related_id.in_(list(deleted)))
+            ))
+        lists = model.top(model.pos[i] for i in affected)
+        # ITs deleted by another process are still in this model: drop the
+        # ones these lists name (that process updated the lists showing them)
+        gone = _missing(connection, set(lists) | {r for n in lists.values() for r, _ in n})
+        if gone:
+            model.remove(gone)
+            lists = model.top(model.pos[i] for i in affected if i not in gone)
+        _store(connection, lists)
+        for it_id in affected:
+            page_cache.invalidate(it_id)
+
+
+related_index = RelatedIndex()
+
+
+def related_items(it_id):
+    """Stored neighbours of an IT, best first: rows of (id, name, field, score)"""
+    return db.session.execute(
+        select(ImpossibleTrinity.id, ImpossibleTrinity.name, ImpossibleTrinity.field, Related.score)
+        .join(Related, Related.related_id == ImpossibleTrinity.id)
+        .where(Related.it_id == it_id)
+        .order_by(Related.rank)
+    ).all()
+
+
+# Queue ORM changes after commit; deletes also drop their own list right away
+@event.listens_for(ImpossibleTrinity, 'after_insert')
+def _related_added(mapper, connection, target):
+    defer(target, 'related', ('changed', target.id))
+
+
+@event.listens_for(ImpossibleTrinity, 'after_update')
+def _related_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[c].history.has_changes() for c in TEXT_WEIGHTS):
+        _related_added(mapper, connection, target)
+
+
+@event.listens_for(ImpossibleTrinity, 'after_delete')
+def _related_removed(mapper, connection, target):
+    # Lists that show the deleted IT keep their row until the update refills
+    # them; related_items() joins it away meanwhile
+    table = Related.__table__
+    connection.execute(delete(table).where(table.c.it_id == target.id))
+    defer(target, 'related', ('deleted', target.id))
+
+
+@on_commit('related')
+def _schedule_related(changes):
+    changed = {it_id for kind, it_id in changes if kind == 'changed'}
+    deleted = {it_id for kind, it_id in changes if kind == 'deleted'}
+    related_index.schedule(changed, deleted)
@@ -0,0 +1,174 @@
+"""
+Versioned schema migrations
+
+The schema version is stored in SQLite's ``PRAGMA user_version``. A brand-new
+database is created straight from the models and stamped with the latest
+version. An existing one runs, in order, every migration above its recorded
+version, and the version is bumped after each step. Migrations are written to
+be idempotent (the helpers check before they add), so an upgrade interrupted
+half way can simply be run again.
+
+Databases created before versioning existed report version 0; migration 1
+brings them to the baseline by adding the tables and columns that
+``db.create_all()`` never adds to an existing file.
+
+To change the schema, edit the model and append a migration that performs the
+same change with ``add_column``/``create_index``.
+"""
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from models import db, ImpossibleTrinity, Comment, Agree, Related
+from counters import repair_comment_counts
+from catalogue import rebuild_catalogue
+from ranking import refresh_hot_scores
+
+MIGRATIONS = []
+
+
+def migration(version):
+    """Register ``fn(connection)`` as the step that brings the schema to ``version``"""
+    def decorator(fn):
+        assert not MIGRATIONS or MIGRATIONS[-1][0] == version - 1, 'migrations must be sequential'
+        MIGRATIONS.append((version, fn))
+        return fn
+    return decorator
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def schema_version(connection):
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def check_schema():
+    """Fail fast, without writing, unless the database is at the latest version"""
+    with db.engine.connect() as connection:
+        version = schema_version(connection)
+    if version != latest_version():
+        raise RuntimeError(
+            f'Database schema is at version {version}, expected {latest_version()}; '
+            'run `flask --app app upgrade-db` first'
+        )
+
+
+def _stamp(connection, version):
+    connection.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+
+
+# Helpers for migrations
+
+def add_column(connection, column):
+    """Add a model column to its table unless it is already there; returns True if added"""
+    table = column.table
+    present = {c['name'] for c in inspect(connection).get_columns(table.name)}
+    if column.name in present:
+        return False
+    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+    return True
+
+
+def create_index(connection, index):
+    index.create(connection, checkfirst=True)
+
+
+def _model_index(model, name):
+    return next(i for i in model.__table__.indexes if i.name == name)
+
+
+# Migrations
+
+@migration(1)
+def baseline(connection):
+    """Tables, columns and indexes added before migrations were versioned"""
+    old_tables = set(inspect(connection).get_table_names())
+    db.metadata.create_all(connection)
+
+    if add_column(connection, ImpossibleTrinity.__table__.c.comments_count):
+        repair_comment_counts(connection)
+    if 'field' not in old_tables:
+        rebuild_catalogue(connection)
+
+    for name in ('ix_impossible_trinity_created_at_id', 'ix_impossible_trinity_name_field'):
+        create_index(connection, _model_index(ImpossibleTrinity, name))
+
+
+@migration(2)
+def storage_indexes(connection):
+    """Indexes behind the field filter, the dashboard, comments and agrees"""
+    for model, name in [
+        (ImpossibleTrinity, 'ix_impossible_trinity_field_created_at_id'),
+        (ImpossibleTrinity, 'ix_impossible_trinity_creator_id_created_at'),
+        (Comment, 'ix_comment_it_id_created_at'),
+        (Agree, 'ix_agree_it_id'),
+    ]:
+        create_index(connection, _model_index(model, name))
+    connection.exec_driver_sql('ANALYZE')
+
+
+@migration(3)
+def grid_sort_indexes(connection):
+    """Indexes behind the admin grid's sort orders"""
+    # Keyset comparisons never match NULL, so the sorted counter must not hold one
+    connection.exec_driver_sql(
+        'UPDATE impossible_trinity SET agree_count = 0 WHERE agree_count IS NULL'
+    )
+    for name in (
+        'ix_impossible_trinity_name_created_at',
+        'ix_impossible_trinity_agree_count_created_at',
+        'ix_impossible_trinity_comments_count_created_at',
+    ):
+        create_index(connection, _model_index(ImpossibleTrinity, name))
+    connection.exec_driver_sql('ANALYZE')
+
+
+@migration(4)
+def related_table(connection):
+    """Precomputed related ITs; filled by `flask rebuild-related`"""
+    Related.__table__.create(connection, checkfirst=True)
+    create_index(connection, _model_index(Related, 'ix_related_related_id'))
+
+
+@migration(5)
+def hot_score(connection):
+    """Stored hot score and the indexes behind the hot and top feeds"""
+    add_column(connection, ImpossibleTrinity.__table__.c.hot_score)
+    refresh_hot_scores(connection)
+    for name in (
+        'ix_impossible_trinity_hot_score_id',
+        'ix_impossible_trinity_field_hot_score_id',
+        'ix_impossible_trinity_field_agree_count_created_at',
+    ):
+        create_index(connection, _model_index(ImpossibleTrinity, name))
+    connection.exec_driver_sql('ANALYZE')
+
+
+@migration(6)
+def updated_at_index(connection):
+    """Index behind the related model's catch-up on edits from other processes"""
+    create_index(connection, _model_index(ImpossibleTrinity, 'ix_impossible_trinity_updated_at'))
+
+
+def upgrade_schema():
+    """Bring the database to the latest schema version; returns the versions applied"""
+    engine = db.engine
+    with engine.begin() as connection:
+        fresh = not inspect(connection).get_table_names()
+        if fresh:
+            db.metadata.create_all(connection)
+            _stamp(connection, latest_version())
+            return []
+
+    applied = []
+    for version, step in MIGRATIONS:
+        with engine.begin() as connection:
+            if schema_version(connection) >= version:
+                continue
+            step(connection)
+            _stamp(connection, version)
+        applied.append(version)
+    return applied
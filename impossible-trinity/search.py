@@ -0,0 +1,211 @@
+"""
+Full-text search for Impossible Trinities
+
+Backed by an SQLite FTS5 virtual table (``it_search``) whose rowid is the
+ImpossibleTrinity id. Text is pre-tokenized in Python so that Chinese is
+searchable: every CJK run is indexed as overlapping bigrams plus its final
+character, Latin words are lowercased and matched by prefix. The index is kept
+in sync with mapper events, so every ORM write path (add, edit, delete, CSV
+import, setup scripts) updates it inside the same transaction.
+"""
+
+import re
+
+from sqlalchemy import event, inspect, text, Integer, Float
+
+from models import db, ImpossibleTrinity
+
+# Indexed columns, in FTS column order
+SEARCH_COLUMNS = (
+    'name', 'name_en', 'field',
+    'element1', 'element2', 'element3',
+    'description',
+)
+
+# bm25 column weights, same order as SEARCH_COLUMNS
+SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 4.0, 4.0, 4.0, 1.0)
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(r'([%s]+)|([^\W%s]+)' % (_CJK, _CJK))
+
+_fts_available = None
+_index_ready = False
+
+
+def tokenize(value):
+    """Split text into index tokens: CJK bigrams (+ last char), lowercased words"""
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(value or ''):
+        if cjk:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def build_match(query):
+    """Turn a user query into an FTS5 MATCH expression, or None if it has no terms"""
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(query or ''):
+        if cjk and len(cjk) == 1:
+            # A single character is the first half of a bigram or a run's last char
+            terms.append('"%s"*' % cjk)
+        elif cjk:
+            bigrams = [cjk[i:i + 2] for i in range(len(cjk) - 1)]
+            terms.append('"%s"' % ' '.join(bigrams))
+        else:
+            terms.append('"%s"*' % word.lower())
+    return ' AND '.join(terms) or None
+
+
+def fts_available(connection):
+    """Whether this SQLite build ships the FTS5 extension"""
+    global _fts_available
+    if _fts_available is None:
+        try:
+            options = connection.exec_driver_sql('PRAGMA compile_options').scalars().all()
+            _fts_available = 'ENABLE_FTS5' in options
+        except Exception:
+            _fts_available = False
+    return _fts_available
+
+
+def _document(values):
+    return [' '.join(tokenize(values.get(column))) for column in SEARCH_COLUMNS]
+
+
+def index_rows(connection, rows):
+    """Insert or replace index entries for an iterable of dict-like rows with an ``id``"""
+    params = []
+    for row in rows:
+        doc = _document(row)
+        params.append(dict(zip(SEARCH_COLUMNS, doc), rowid=row['id']))
+    if not params:
+        return
+    connection.execute(
+        text('DELETE FROM it_search WHERE rowid = :rowid'),
+        [{'rowid': p['rowid']} for p in params]
+    )
+    connection.execute(
+        text('INSERT INTO it_search (rowid, %s) VALUES (:rowid, %s)' % (
+            ', '.join(SEARCH_COLUMNS),
+            ', '.join(':' + c for c in SEARCH_COLUMNS)
+        )),
+        params
+    )
+
+
+def remove_rows(connection, ids):
+    """Drop index entries for the given ImpossibleTrinity ids"""
+    ids = list(ids)
+    if ids:
+        connection.execute(
+            text('DELETE FROM it_search WHERE rowid = :rowid'),
+            [{'rowid': i} for i in ids]
+        )
+
+
+def rebuild_index(connection, batch_size=1000):
+    """Rebuild the whole index from the impossible_trinity table"""
+    connection.execute(text('DELETE FROM it_search'))
+    result = connection.execute(
+        text('SELECT id, %s FROM impossible_trinity' % ', '.join(SEARCH_COLUMNS))
+    )
+    while True:
+        batch = result.mappings().fetchmany(batch_size)
+        if not batch:
+            break
+        index_rows(connection, batch)
+
+
+def ensure_index(connection):
+    """Create the FTS table if missing and fill it from existing data
+
+    Returns False when FTS5 is not available, in which case callers fall back
+    to plain ILIKE matching. The caller owns the transaction.
+    """
+    if _index_ready:
+        return True
+    if not fts_available(connection):
+        return False
+
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'it_search'")
+    ).first()
+    if not exists:
+        connection.execute(text(
+            'CREATE VIRTUAL TABLE it_search USING fts5(%s, tokenize = \'unicode61\')'
+            % ', '.join(SEARCH_COLUMNS)
+        ))
+        rebuild_index(connection)
+    return True
+
+
+def search_condition(search_query):
+    """Substring match over the searchable columns (fallback without FTS5)"""
+    search_pattern = f'%{search_query}%'
+    return db.or_(
+        ImpossibleTrinity.name.ilike(search_pattern),
+        ImpossibleTrinity.name_en.ilike(search_pattern),
+        ImpossibleTrinity.field.ilike(search_pattern),
+        ImpossibleTrinity.element1.ilike(search_pattern),
+        ImpossibleTrinity.element2.ilike(search_pattern),
+        ImpossibleTrinity.element3.ilike(search_pattern),
+        ImpossibleTrinity.description.ilike(search_pattern)
+    )
+
+
+def prepare_index():
+    """Create/fill the index once per process; False when FTS5 is unavailable"""
+    global _index_ready
+    if not _index_ready and ensure_index(db.session.connection()):
+        db.session.commit()
+        _index_ready = True
+    return _index_ready
+
+
+def search_hits(search_query):
+    """Ranked FTS hits as a ``(it_id, rank)`` subquery, lower rank first
+
+    Returns None when the full-text index cannot answer (no FTS5, or nothing
+    tokenizable in the query); callers then filter with ``search_condition``.
+    """
+    match = build_match(search_query)
+    if match is None or not prepare_index():
+        return None
+
+    return text(
+        'SELECT rowid AS it_id, bm25(it_search, %s) AS rank '
+        'FROM it_search WHERE it_search MATCH :match'
+        % ', '.join(str(w) for w in SEARCH_WEIGHTS)
+    ).bindparams(match=match).columns(it_id=Integer, rank=Float).subquery('search_hits')
+
+
+# Keep the index in sync with every ORM write
+def _values(target):
+    values = {column: getattr(target, column) for column in SEARCH_COLUMNS}
+    values['id'] = target.id
+    return values
+
+
+@event.listens_for(ImpossibleTrinity, 'after_insert')
+def _index_after_insert(mapper, connection, target):
+    if ensure_index(connection):
+        index_rows(connection, [_values(target)])
+
+
+@event.listens_for(ImpossibleTrinity, 'after_update')
+def _index_after_update(mapper, connection, target):
+    # Counter bumps (agree_count etc.) don't touch the indexed text
+    state = inspect(target)
+    if not any(state.attrs[column].history.has_changes() for column in SEARCH_COLUMNS):
+        return
+    if ensure_index(connection):
+        index_rows(connection, [_values(target)])
+
+
+@event.listens_for(ImpossibleTrinity, 'after_delete')
+def _index_after_delete(mapper, connection, target):
+    if ensure_index(connection):
+        remove_rows(connection, [target.id])
@@ -6,13 +6,14 @@ Creates database, admin account, and sample data
 
 from app import app, db
 from models import User, ImpossibleTrinity, Comment
+from schema import upgrade_schema
 import bcrypt
 from datetime import datetime
 
 def create_database():
     """Create all database tables"""
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
         print("✓ Database tables created successfully")
 
 def create_admin_user():
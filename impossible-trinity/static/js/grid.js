@@ -0,0 +1,225 @@
+// Virtualized admin grid
+// Rows are fetched from /admin/grid in keyset pages as the user scrolls, and
+// only the rows inside the viewport (plus a small overscan) exist in the DOM,
+// so the page stays light however many ITs there are.
+(function() {
+    const ROW_HEIGHT = 40;
+    const OVERSCAN = 8;
+    const PAGE_SIZE = 200;
+    const COLUMNS = [
+        { key: 'id', label: 'ID', width: '70px', sortable: true },
+        { key: 'name', label: '名称', width: 'minmax(180px, 2fr)', sortable: true },
+        { key: 'creator', label: '创建者', width: '110px', sortable: true },
+        { key: 'field', label: '领域', width: '120px', sortable: true },
+        { key: 'element1', label: '元素1', width: 'minmax(90px, 1fr)' },
+        { key: 'element2', label: '元素2', width: 'minmax(90px, 1fr)' },
+        { key: 'element3', label: '元素3', width: 'minmax(90px, 1fr)' },
+        { key: 'agree_count', label: '赞同', width: '70px', sortable: true },
+        { key: 'comments_count', label: '评论', width: '70px', sortable: true },
+        { key: 'created_at', label: '创建时间', width: '110px', sortable: true },
+        { key: 'actions', label: '操作', width: '150px' },
+    ];
+    const DATA_COLUMNS = COLUMNS.filter(c => c.key !== 'actions').map(c => c.key);
+
+    const grid = document.getElementById('admin-grid');
+    if (!grid) {
+        return;
+    }
+    const header = document.getElementById('grid-header');
+    const viewport = document.getElementById('grid-viewport');
+    const spacer = document.getElementById('grid-spacer');
+    const rowsEl = document.getElementById('grid-rows');
+    const statusEl = document.getElementById('grid-status');
+    const totalEl = document.getElementById('grid-total');
+    const fieldSelect = document.getElementById('grid-field');
+    const searchInput = document.getElementById('grid-q');
+    const template = COLUMNS.map(c => c.width).join(' ');
+    header.style.gridTemplateColumns = template;
+
+    const state = {
+        sort: 'created_at',
+        order: 'desc',
+        rows: [],
+        index: {},
+        cursor: null,
+        done: false,
+        loading: false,
+        generation: 0,
+    };
+
+    function renderHeader() {
+        header.innerHTML = '';
+        COLUMNS.forEach(function(column) {
+            const cell = document.createElement('div');
+            cell.className = 'grid-cell grid-head';
+            cell.textContent = column.label;
+            if (column.sortable) {
+                cell.classList.add('sortable');
+                if (state.sort === column.key) {
+                    cell.classList.add(state.order === 'desc' ? 'sorted-desc' : 'sorted-asc');
+                }
+                cell.addEventListener('click', function() {
+                    if (state.sort === column.key) {
+                        state.order = state.order === 'desc' ? 'asc' : 'desc';
+                    } else {
+                        state.sort = column.key;
+                        state.order = column.key === 'name' || column.key === 'field' ? 'asc' : 'desc';
+                    }
+                    reset();
+                });
+            }
+            header.appendChild(cell);
+        });
+    }
+
+    function formatCell(key, value) {
+        if (key === 'created_at' && value) {
+            return value.slice(0, 10);
+        }
+        return value === null || value === undefined ? '' : String(value);
+    }
+
+    function buildRow(row) {
+        const id = row[state.index.id];
+        const el = document.createElement('div');
+        el.className = 'grid-row';
+        el.style.gridTemplateColumns = template;
+        COLUMNS.forEach(function(column) {
+            const cell = document.createElement('div');
+            cell.className = 'grid-cell';
+            if (column.key === 'name') {
+                const link = document.createElement('a');
+                link.href = '/detail/' + id;
+                link.className = 'table-link';
+                link.textContent = row[state.index.name];
+                cell.appendChild(link);
+            } else if (column.key === 'actions') {
+                const edit = document.createElement('a');
+                edit.href = '/edit/' + id;
+                edit.className = 'btn-small btn-edit';
+                edit.textContent = '编辑';
+                const form = document.createElement('form');
+                form.action = '/delete/' + id;
+                form.method = 'POST';
+                form.className = 'inline-form';
+                const button = document.createElement('button');
+                button.type = 'submit';
+                button.className = 'btn-small btn-delete';
+                button.textContent = '删除';
+                button.onclick = function() { return confirm('确定删除？'); };
+                form.appendChild(button);
+                cell.appendChild(edit);
+                cell.appendChild(form);
+            } else {
+                cell.textContent = formatCell(column.key, row[state.index[column.key]]);
+                cell.title = cell.textContent;
+            }
+            el.appendChild(cell);
+        });
+        return el;
+    }
+
+    function render() {
+        spacer.style.height = (state.rows.length * ROW_HEIGHT) + 'px';
+        const first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+        const visible = Math.ceil(viewport.clientHeight / ROW_HEIGHT) + OVERSCAN * 2;
+        const last = Math.min(state.rows.length, first + visible);
+
+        const fragment = document.createDocumentFragment();
+        for (let i = first; i < last; i++) {
+            fragment.appendChild(buildRow(state.rows[i]));
+        }
+        rowsEl.style.transform = 'translateY(' + (first * ROW_HEIGHT) + 'px)';
+        rowsEl.replaceChildren(fragment);
+
+        // Prefetch the next page before the user reaches the end
+        if (!state.done && last + OVERSCAN * 2 >= state.rows.length) {
+            loadPage();
+        }
+    }
+
+    async function loadPage() {
+        if (state.loading || state.done) {
+            return;
+        }
+        state.loading = true;
+        const generation = state.generation;
+        const params = new URLSearchParams({
+            columns: DATA_COLUMNS.join(','),
+            sort: state.sort,
+            order: state.order,
+            per_page: PAGE_SIZE,
+        });
+        if (state.cursor) {
+            params.set('cursor', state.cursor);
+        }
+        if (fieldSelect.value) {
+            params.set('field', fieldSelect.value);
+        }
+        if (searchInput.value.trim()) {
+            params.set('q', searchInput.value.trim());
+        }
+        statusEl.textContent = '加载中...';
+
+        try {
+            const response = await fetch(grid.dataset.url + '?' + params.toString());
+            const data = await response.json();
+            if (generation !== state.generation) {
+                return;
+            }
+            if (!response.ok) {
+                statusEl.textContent = data.error || '加载失败';
+                state.done = true;
+                return;
+            }
+            data.columns.forEach(function(key, i) { state.index[key] = i; });
+            state.rows = state.rows.concat(data.rows);
+            state.cursor = data.next_cursor;
+            state.done = !data.next_cursor;
+            totalEl.textContent = data.total !== null
+                ? `共 ${data.total} 条记录`
+                : `已加载 ${state.rows.length} 条${state.done ? '' : '+'}`;
+            statusEl.textContent = state.done && !state.rows.length ? '没有匹配的记录' : '';
+        } catch (error) {
+            console.error('Error loading grid rows:', error);
+            statusEl.textContent = '加载失败';
+        } finally {
+            if (generation === state.generation) {
+                state.loading = false;
+                render();
+            }
+        }
+    }
+
+    function reset() {
+        state.generation += 1;
+        state.rows = [];
+        state.cursor = null;
+        state.done = false;
+        state.loading = false;
+        viewport.scrollTop = 0;
+        renderHeader();
+        render();
+    }
+
+    let ticking = false;
+    viewport.addEventListener('scroll', function() {
+        if (!ticking) {
+            ticking = true;
+            requestAnimationFrame(function() {
+                ticking = false;
+                render();
+            });
+        }
+    });
+
+    let searchTimer = null;
+    searchInput.addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(reset, 300);
+    });
+    fieldSelect.addEventListener('change', reset);
+    window.addEventListener('resize', render);
+
+    reset();
+})();
@@ -38,6 +38,17 @@ function filterByField(field, event) {
     window.location.href = url.toString();
 }
 
+// Attributes each infinite-scroll loader renders (sent as fields=)
+const CARD_FIELDS = [
+    'id', 'name', 'field', 'element1', 'element2', 'element3',
+    'element1_sacrifice_explanation', 'element2_sacrifice_explanation', 'element3_sacrifice_explanation',
+    'description_preview', 'agree_count', 'agreed', 'comments_count',
+].join(',');
+const TABLE_FIELDS = [
+    'id', 'name', 'field', 'element1', 'element2', 'element3',
+    'agree_count', 'comments_count', 'created_at',
+].join(',');
+
 // Table row creation helper
 function createTableRow(item) {
     const tr = document.createElement('tr');
@@ -134,12 +145,24 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 100);
     }
 
+    // Filters the server rendered the first page with, so later pages match it
+    const feedFilters = (container) => {
+        const params = new URLSearchParams();
+        ['field', 'q', 'sort'].forEach(name => {
+            if (container.dataset[name]) {
+                params.set(name, container.dataset[name]);
+            }
+        });
+        const query = params.toString();
+        return query ? `&${query}` : '';
+    };
+
     const cardGrid = document.getElementById('card-grid');
     if (cardGrid) {
         const sentinel = document.getElementById('card-sentinel');
         const loader = document.getElementById('card-loader');
-        let page = Number(cardGrid.dataset.page || '1');
-        let hasMore = cardGrid.dataset.hasMore === 'true';
+        let cursor = cardGrid.dataset.cursor || '';
+        let hasMore = cursor !== '';
         const perPage = Number(cardGrid.dataset.perPage || '12');
         let isLoading = false;
 
@@ -210,14 +233,14 @@ document.addEventListener('DOMContentLoaded', function() {
 
             const preview = document.createElement('p');
             preview.className = 'card-preview';
-            const trimmed = item.description && item.description.length > 150;
-            preview.textContent = trimmed ? `${item.description.slice(0, 150)}...` : (item.description || '');
+            const description = item.description_preview || '';
+            preview.textContent = description.length > 150 ? `${description.slice(0, 150)}...` : description;
 
             const meta = document.createElement('div');
             meta.className = 'card-meta';
 
             const agree = document.createElement('span');
-            agree.className = 'agree-count';
+            agree.className = item.agreed ? 'agree-count agreed' : 'agree-count';
             const agreeIcon = document.createElement('span');
             agreeIcon.className = 'meta-icon';
             agreeIcon.textContent = '赞';
@@ -258,9 +281,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 loader.classList.add('active');
             }
 
-            const nextPage = page + 1;
             try {
-                const response = await fetch(`/api/its?page=${nextPage}&per_page=${perPage}`);
+                const response = await fetch(`/api/its?cursor=${encodeURIComponent(cursor)}&per_page=${perPage}&fields=${CARD_FIELDS}${feedFilters(cardGrid)}`);
                 if (!response.ok) {
                     throw new Error('Failed to load cards');
                 }
@@ -268,10 +290,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 data.items.forEach(item => {
                     cardGrid.appendChild(createCard(item));
                 });
-                page = nextPage;
-                hasMore = data.has_more;
-                cardGrid.dataset.page = String(page);
-                cardGrid.dataset.hasMore = hasMore ? 'true' : 'false';
+                cursor = data.next_cursor || '';
+                hasMore = cursor !== '';
+                cardGrid.dataset.cursor = cursor;
                 if (!hasMore && sentinel) {
                     sentinel.style.display = 'none';
                 }
@@ -301,8 +322,8 @@ document.addEventListener('DOMContentLoaded', function() {
         const tableBody = document.getElementById('table-body');
         const tableSentinel = document.getElementById('table-sentinel');
         const tableLoader = document.getElementById('table-loader');
-        let tablePage = Number(tableContainer.dataset.page || '1');
-        let tableHasMore = tableContainer.dataset.hasMore === 'true';
+        let tableCursor = tableContainer.dataset.cursor || '';
+        let tableHasMore = tableCursor !== '';
         const tablePerPage = Number(tableContainer.dataset.perPage || '20');
         let tableIsLoading = false;
 
@@ -315,9 +336,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 tableLoader.classList.add('active');
             }
 
-            const nextPage = tablePage + 1;
             try {
-                const response = await fetch(`/api/its?page=${nextPage}&per_page=${tablePerPage}`);
+                const response = await fetch(`/api/its?cursor=${encodeURIComponent(tableCursor)}&per_page=${tablePerPage}&fields=${TABLE_FIELDS}${feedFilters(tableContainer)}`);
                 if (!response.ok) {
                     throw new Error('Failed to load table rows');
                 }
@@ -325,10 +345,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 data.items.forEach(item => {
                     tableBody.appendChild(createTableRow(item));
                 });
-                tablePage = nextPage;
-                tableHasMore = data.has_more;
-                tableContainer.dataset.page = String(tablePage);
-                tableContainer.dataset.hasMore = tableHasMore ? 'true' : 'false';
+                tableCursor = data.next_cursor || '';
+                tableHasMore = tableCursor !== '';
+                tableContainer.dataset.cursor = tableCursor;
                 if (!tableHasMore && tableSentinel) {
                     tableSentinel.style.display = 'none';
                 }
@@ -0,0 +1,84 @@
+"""
+Per-user contribution statistics for the dashboard
+
+``user_stats`` answers with one ``GROUP BY field`` query over the creator's
+ITs (located through ``ix_impossible_trinity_creator_id_created_at``) and
+derives the totals from the grouped rows. The result is memoized per user, so
+a warm dashboard runs no aggregate at all. The creator's own inserts, deletes
+and field changes drop the memo after commit; agrees and comments from other
+users show up within the TTL.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import event, func, inspect, select
+from cache import LRUCache
+from hooks import defer, on_commit
+from models import db, ImpossibleTrinity
+
+UserStats = namedtuple('UserStats', ['it_count', 'agree_count', 'comments_count', 'top_fields'])
+FieldActivity = namedtuple('FieldActivity', ['name', 'it_count'])
+
+TOP_FIELDS = 5
+
+# user_id -> UserStats
+_stats = LRUCache(maxsize=10000, ttl=60)
+
+
+def user_stats(user_id):
+    """Totals and most active fields of the ITs a user created"""
+    stats = _stats.get(user_id)
+    if stats is None:
+        rows = db.session.execute(
+            select(
+                ImpossibleTrinity.field,
+                func.count(),
+                func.coalesce(func.sum(ImpossibleTrinity.agree_count), 0),
+                func.coalesce(func.sum(ImpossibleTrinity.comments_count), 0),
+            )
+            .where(ImpossibleTrinity.creator_id == user_id)
+            .group_by(ImpossibleTrinity.field)
+        ).all()
+        top = sorted(rows, key=lambda row: (-row[1], row[0]))[:TOP_FIELDS]
+        stats = UserStats(
+            it_count=sum(row[1] for row in rows),
+            agree_count=sum(row[2] for row in rows),
+            comments_count=sum(row[3] for row in rows),
+            top_fields=tuple(FieldActivity(row[0], row[1]) for row in top),
+        )
+        _stats.set(user_id, stats)
+    return stats
+
+
+def forget_stats(user_id=None):
+    """Drop one user's memoized stats, or everyone's after bulk writes"""
+    if user_id is None:
+        _stats.clear()
+    else:
+        _stats.delete(user_id)
+
+
+def _changed(target):
+    defer(target, 'stats', target.creator_id)
+
+
+@event.listens_for(ImpossibleTrinity, 'after_insert')
+def _stats_added(mapper, connection, target):
+    _changed(target)
+
+
+@event.listens_for(ImpossibleTrinity, 'after_update')
+def _stats_updated(mapper, connection, target):
+    if inspect(target).attrs.field.history.has_changes():
+        _changed(target)
+
+
+@event.listens_for(ImpossibleTrinity, 'after_delete')
+def _stats_removed(mapper, connection, target):
+    _changed(target)
+
+
+@on_commit('stats')
+def _drop_stats(user_ids):
+    for user_id in user_ids:
+        forget_stats(user_id)
@@ -0,0 +1,64 @@
+"""
+SQLite connection profile
+
+Every new DBAPI connection gets the pragmas below. WAL lets readers keep
+going while a writer holds the lock (the default rollback journal blocks
+them), ``synchronous=NORMAL`` is the durable-enough setting for WAL, and
+``busy_timeout`` makes a second writer wait for the lock rather than fail
+with "database is locked" (set here instead of relying on the driver's
+default). Cache and mmap sizes keep the hot part of the file in memory.
+
+Override individual values with the ``SQLITE_PRAGMAS`` config dict; ``None``
+skips a pragma.
+"""
+
+from sqlalchemy import event
+
+from models import db
+
+DEFAULT_PRAGMAS = {
+    # First, so the pragmas below wait for a lock too
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Negative cache_size is in KiB: 32 MiB of page cache per connection
+    'cache_size': -32000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class SQLiteStorage:
+    def __init__(self, pragmas=None):
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+
+    def init_app(self, app):
+        """Install the connect hook on the app's engine; call after ``db.init_app``"""
+        self.pragmas = {**DEFAULT_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {})}
+        with app.app_context():
+            self.install(db.engine)
+
+    def install(self, engine):
+        """Apply the pragmas to every new connection of ``engine`` (SQLite only)"""
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', self._on_connect)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                if value is not None:
+                    cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+sqlite_storage = SQLiteStorage()
+
+
+def pragma_values(connection, names=None):
+    """Current values of the given pragmas on a SQLAlchemy connection"""
+    return {
+        name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+        for name in (names or DEFAULT_PRAGMAS)
+    }
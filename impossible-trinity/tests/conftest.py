@@ -0,0 +1,93 @@
+"""
+Shared test setup
+
+Every test module runs against one temporary SQLite database, with job files
+and cached images kept out of ``instance/``. The environment is set before
+``app`` is first imported, since it reads its configuration at import.
+"""
+
+import os
+import sys
+import tempfile
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'test.db')
+# Exercise the views, not page cache hits
+os.environ['PAGE_CACHE_TTL'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    from images import image_store
+    from schema import upgrade_schema
+
+    app.config['JOB_DIR'] = os.path.join(_tmp_dir, 'jobs')
+    app.config['IMAGE_CACHE_DIR'] = image_store.root = os.path.join(_tmp_dir, 'images')
+    with app.app_context():
+        upgrade_schema()
+    return app
+
+
+def _create_user(app, is_admin=False):
+    from models import db, User
+
+    with app.app_context():
+        user = User(username=f'tester{os.urandom(4).hex()}', password_hash='x', is_admin=is_admin)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def user(app):
+    """Id of a fresh user"""
+    return _create_user(app)
+
+
+@pytest.fixture
+def admin(app):
+    """Id of a fresh administrator"""
+    return _create_user(app, is_admin=True)
+
+
+@pytest.fixture
+def login():
+    """``login(client, user_id)`` signs a test client in as that user"""
+    def login(client, user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return login
+
+
+@pytest.fixture
+def make_it():
+    """Build an unsaved IT with every required column filled in"""
+    from models import ImpossibleTrinity
+
+    def make(creator_id, **values):
+        defaults = dict(
+            name='三角', field='测试', element1='甲', element2='乙', element3='丙',
+            element1_sacrifice_explanation='一', element2_sacrifice_explanation='二',
+            element3_sacrifice_explanation='三', description='描述',
+        )
+        return ImpossibleTrinity(creator_id=creator_id, **{**defaults, **values})
+    return make
+
+
+@pytest.fixture
+def add_it(app, make_it):
+    """``add_it(creator_id, **values)`` commits a new IT and returns its id"""
+    from models import db
+
+    def add(creator_id, **values):
+        with app.app_context():
+            it = make_it(creator_id, **values)
+            db.session.add(it)
+            db.session.commit()
+            return it.id
+    return add
@@ -0,0 +1,80 @@
+"""Agrees of deleted ITs: cached sets and buffered clicks"""
+
+import threading
+
+import pytest
+from sqlalchemy import delete, event, select
+
+import agrees
+from agrees import agreed_ids, forget_item, record_agree
+from counters import agree_buffer
+from models import db, Agree, ImpossibleTrinity
+
+
+def add_its(make_it, user_id, count):
+    its = [make_it(user_id, name=f'赞同 {i}') for i in range(count)]
+    db.session.add_all(its)
+    db.session.commit()
+    return [it.id for it in its]
+
+
+def delete_it(it_id):
+    forget_item(it_id)
+    db.session.delete(db.session.get(ImpossibleTrinity, it_id))
+    db.session.commit()
+
+
+@pytest.fixture
+def buffered(monkeypatch):
+    monkeypatch.setattr(agree_buffer, 'interval', 60)
+    monkeypatch.setattr(agree_buffer, '_thread', threading.current_thread())
+    return agree_buffer
+
+
+def test_delete_evicts_only_sets_that_contain_the_it(app, user, admin, make_it):
+    with app.app_context():
+        gone, kept = add_its(make_it, user, 2)
+        record_agree(user, gone)
+        record_agree(admin, kept)
+        assert gone in agreed_ids(user) and kept in agreed_ids(admin)
+
+        delete_it(gone)
+        assert agrees._agreed.get(user) is None
+        assert agrees._agreed.get(admin) == {kept}
+
+
+def test_delete_discards_pending_buffered_agrees(app, user, make_it, buffered):
+    with app.app_context():
+        it_id, = add_its(make_it, user, 1)
+        assert record_agree(user, it_id) == (True, 1)
+        delete_it(it_id)
+        assert buffered.pending(it_id) == 0
+        buffered.flush()
+        assert db.session.scalar(select(Agree).where(Agree.it_id == it_id)) is None
+
+
+def test_flush_racing_a_delete_leaves_no_orphan(app, user, make_it, buffered):
+    with app.app_context():
+        it_id, = add_its(make_it, user, 1)
+        record_agree(user, it_id)
+        trinities = ImpossibleTrinity.__table__
+
+        raced = []
+
+        def delete_first(conn, cursor, statement, parameters, context, executemany):
+            # Another request deletes the IT after the flush took its batch
+            if statement.startswith('INSERT INTO agree') and not raced:
+                raced.append(statement)
+                with db.engine.connect() as other:
+                    other.execute(delete(trinities).where(trinities.c.id == it_id))
+                    other.commit()
+                buffered.discard(it_id)
+
+        event.listen(db.engine, 'before_cursor_execute', delete_first)
+        try:
+            assert buffered.flush() == 1
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', delete_first)
+        assert raced
+        assert buffered.pending(it_id) == 0
+        assert db.session.scalar(select(Agree).where(Agree.it_id == it_id)) is None
@@ -0,0 +1,39 @@
+"""Hashed static assets: precompressed variants follow Accept-Encoding"""
+
+import gzip
+import os
+
+from flask import Flask, url_for
+
+from assets import AssetPipeline, build_assets
+
+CSS = b'body { color: #333; }\n' * 50
+
+
+def make_app(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'site.css').write_bytes(CSS)
+    build_assets(str(static))
+    app = Flask(__name__, static_folder=str(static))
+    AssetPipeline(app)
+    with app.test_request_context():
+        url = url_for('static', filename='css/site.css')
+    return app.test_client(), url, static / url.removeprefix('/static/')
+
+
+def test_falls_back_to_the_next_accepted_variant(tmp_path):
+    client, url, hashed = make_app(tmp_path)
+    assert url != '/static/css/site.css'
+    if os.path.exists(f'{hashed}.br'):
+        os.remove(f'{hashed}.br')
+
+    response = client.get(url, headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == CSS
+    assert 'immutable' in response.headers['Cache-Control']
+
+    os.remove(f'{hashed}.gz')
+    response = client.get(url, headers={'Accept-Encoding': 'br, gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data() == CSS
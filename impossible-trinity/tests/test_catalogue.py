@@ -0,0 +1,45 @@
+"""Field catalogue: counts maintained by writes, memo dropped on commit only"""
+
+from sqlalchemy import update
+
+from catalogue import field_catalogue, rebuild_catalogue
+from models import db, ImpossibleTrinity, Field
+
+
+def counts(client):
+    return {f['name']: f['item_count'] for f in client.get('/api/fields').get_json()['fields']}
+
+
+def test_counts_follow_inserts_moves_and_deletes(app, user, add_it):
+    client = app.test_client()
+    first = add_it(user, field='目录甲')
+    add_it(user, field='目录甲')
+    assert counts(client)['目录甲'] == 2
+
+    with app.app_context():
+        db.session.get(ImpossibleTrinity, first).field = '目录乙'
+        db.session.commit()
+    assert (counts(client)['目录甲'], counts(client)['目录乙']) == (1, 1)
+
+    with app.app_context():
+        db.session.delete(db.session.get(ImpossibleTrinity, first))
+        db.session.commit()
+    assert '目录乙' not in counts(client)
+
+
+def test_rollback_keeps_the_memo_and_rebuild_repairs_drift(app, user, add_it, make_it):
+    add_it(user, field='目录丙')
+    with app.app_context():
+        before = field_catalogue()
+        db.session.add(make_it(user, field='目录丁'))
+        db.session.flush()
+        db.session.rollback()
+        assert field_catalogue() is before
+        assert '目录丁' not in {f.name for f in field_catalogue()}
+
+        table = Field.__table__
+        db.session.execute(update(table).where(table.c.name == '目录丙').values(item_count=7))
+        db.session.commit()
+        rebuild_catalogue(db.session.connection())
+        db.session.commit()
+        assert {f.name: f.item_count for f in field_catalogue()}['目录丙'] == 1
@@ -0,0 +1,31 @@
+"""Comment JSON API used by the detail page's scripts"""
+
+from models import db
+
+
+def test_post_list_and_delete_comment(app, user, admin, make_it, login):
+    with app.app_context():
+        it = make_it(user)
+        db.session.add(it)
+        db.session.commit()
+        it_id = it.id
+    client = app.test_client()
+
+    assert client.post(f'/api/its/{it_id}/comments', json={'content': '匿名'}).status_code != 201
+
+    login(client, user)
+    assert client.post(f'/api/its/{it_id}/comments', json={'content': '  '}).get_json() == {
+        'error': '评论内容不能为空'}
+    created = client.post(f'/api/its/{it_id}/comments', json={'content': '第一条'})
+    assert created.status_code == 201
+    body = created.get_json()
+    assert body['comments_count'] == 1 and '第一条' in body['html']
+
+    page = client.get(f'/api/its/{it_id}/comments').get_json()
+    assert page['total'] == 1 and [c['content'] for c in page['items']] == ['第一条']
+
+    comment_id = body['comment']['id']
+    assert client.delete(f'/api/comments/{comment_id}').status_code == 403
+    login(client, admin)
+    deleted = client.delete(f'/api/comments/{comment_id}')
+    assert deleted.get_json() == {'deleted': comment_id, 'comments_count': 0}
@@ -0,0 +1,93 @@
+"""Denormalized counters: comment counts and the agree write-behind buffer"""
+
+import threading
+
+import pytest
+from sqlalchemy import event, select, update
+
+from counters import agree_buffer
+from models import db, Agree, Comment, ImpossibleTrinity
+
+
+def comments_count(it_id):
+    db.session.expire_all()
+    return db.session.get(ImpossibleTrinity, it_id).comments_count
+
+
+def test_comment_writes_keep_the_count_and_repair_restores_it(app, user, add_it):
+    it_id = add_it(user)
+    with app.app_context():
+        comments = [Comment(content=f'评论 {i}', it_id=it_id, user_id=user) for i in range(3)]
+        db.session.add_all(comments)
+        db.session.commit()
+        db.session.delete(comments[0])
+        db.session.commit()
+        assert comments_count(it_id) == 2
+
+        # A bulk write around the mapper events leaves the count wrong
+        table = ImpossibleTrinity.__table__
+        db.session.execute(update(table).where(table.c.id == it_id).values(comments_count=40))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['repair-counters'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert comments_count(it_id) == 2
+
+
+@pytest.fixture
+def buffered(app, monkeypatch):
+    monkeypatch.setattr(agree_buffer, 'interval', 60)
+    # Flush by hand: a started flusher thread would race the assertions
+    monkeypatch.setattr(agree_buffer, '_thread', threading.current_thread())
+    return agree_buffer
+
+
+def test_failed_flush_keeps_agrees_for_the_next_one(app, user, make_it, buffered):
+    with app.app_context():
+        it = make_it(user)
+        db.session.add(it)
+        db.session.commit()
+        buffered.add(user, it.id)
+        buffered.add(user, it.id)
+        assert buffered.pending(it.id) == 1
+
+        def fail(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO agree'):
+                raise RuntimeError('disk I/O error')
+
+        event.listen(db.engine, 'before_cursor_execute', fail)
+        try:
+            with pytest.raises(RuntimeError):
+                buffered.flush()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', fail)
+        assert buffered.pending(it.id) == 1
+        assert db.session.scalar(select(Agree).where(Agree.it_id == it.id)) is None
+
+        assert buffered.flush() == 1
+        assert buffered.pending(it.id) == 0
+        db.session.expire_all()
+        assert db.session.get(ImpossibleTrinity, it.id).agree_count == 1
+        assert db.session.scalar(select(Agree.user_id).where(Agree.it_id == it.id)) == user
+
+
+def test_flusher_logs_failures_and_keeps_running(app, buffered, monkeypatch, caplog):
+    class Stop(Exception):
+        pass
+
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) > 2:
+            raise Stop
+
+    def broken_flush():
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr('counters.time.sleep', sleep)
+    monkeypatch.setattr(buffered, 'flush', broken_flush)
+    with pytest.raises(Stop):
+        buffered._run()
+    failures = [r for r in caplog.records if r.getMessage() == 'Flushing the agree buffer failed']
+    assert len(failures) == 2 and failures[0].exc_info
@@ -0,0 +1,58 @@
+"""Synthetic data generator: reproducible output with consistent counters"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATAGEN = os.path.join(ROOT, 'benchmarks', 'datagen.py')
+SMALL = ['--users', '20', '--its', '60', '--comments', '200', '--agrees', '300']
+
+
+def generate(path, seed):
+    # The app binds its engine on first import, so each run needs a fresh process
+    subprocess.run([sys.executable, DATAGEN, str(path), *SMALL, '--seed', str(seed)],
+                   cwd=ROOT, check=True, capture_output=True)
+    connection = sqlite3.connect(path)
+    try:
+        return {
+            table: connection.execute(f'SELECT {columns} FROM {table} ORDER BY 1, 2').fetchall()
+            for table, columns in {
+                'user': 'id, username, is_admin',
+                'impossible_trinity': 'id, name, field, description, created_at, agree_count, '
+                                      'comments_count, hot_score, creator_id',
+                'comment': 'it_id, created_at, content, user_id',
+                'agree': 'user_id, it_id',
+                'field': 'name, item_count',
+            }.items()
+        }, connection.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_same_seed_gives_the_same_database(tmp_path):
+    first, version = generate(tmp_path / 'a.db', seed=7)
+    second, _ = generate(tmp_path / 'b.db', seed=7)
+    other, _ = generate(tmp_path / 'c.db', seed=8)
+    assert first == second
+    assert first['impossible_trinity'] != other['impossible_trinity']
+
+    from schema import latest_version
+    assert version == latest_version()
+    assert len(first['user']) == 20 and len(first['comment']) == 200 and len(first['agree']) == 300
+
+    its = first['impossible_trinity']
+    agrees = [it_id for _, it_id in first['agree']]
+    comments = [row[0] for row in first['comment']]
+    assert [row[5] for row in its] == [agrees.count(row[0]) for row in its]
+    assert [row[6] for row in its] == [comments.count(row[0]) for row in its]
+    assert sum(count for _, count in first['field']) == len(its)
+
+
+def test_existing_database_is_not_overwritten(tmp_path):
+    path = tmp_path / 'taken.db'
+    path.write_bytes(b'')
+    result = subprocess.run([sys.executable, DATAGEN, str(path), *SMALL], cwd=ROOT, capture_output=True)
+    assert result.returncode != 0 and b'FileExistsError' in result.stderr
+    assert path.read_bytes() == b''
@@ -0,0 +1,60 @@
+"""Detail page: prev/next neighbours and cursor-paged comments"""
+
+from datetime import datetime
+
+import pytest
+
+from app import FEED_ORDER
+from models import db, Comment, ImpossibleTrinity
+from pagination import neighbours
+
+
+@pytest.fixture
+def tied(app, user, add_it):
+    """Three ITs sharing one timestamp, then a newer one, in id order"""
+    moment = datetime(2020, 5, 1, 12, 0)
+    ids = [add_it(user, name=f'同时 {i}', created_at=moment) for i in range(3)]
+    return ids + [add_it(user, name='稍后', created_at=datetime(2020, 5, 1, 12, 1))]
+
+
+def test_neighbours_step_through_equal_timestamps(app, tied):
+    with app.app_context():
+        def around(it_id):
+            it = db.session.get(ImpossibleTrinity, it_id)
+            return neighbours(db.session, FEED_ORDER, (it.created_at, it.id))
+
+        # Newest first: tied[3], tied[2], tied[1], tied[0]
+        assert around(tied[1]) == (tied[2], tied[0])
+        assert around(tied[2])[0] == tied[3]
+        assert around(tied[3])[1] == tied[2]
+
+
+def test_comment_pages_cover_tied_comments_once(app, user, add_it):
+    it_id = add_it(user)
+    moment = datetime(2021, 1, 1)
+    with app.app_context():
+        for i in range(5):
+            db.session.add(Comment(content=f'评论 {i}', it_id=it_id, user_id=user, created_at=moment))
+        db.session.commit()
+
+    client = app.test_client()
+    seen, cursor = [], None
+    while True:
+        page = client.get(f'/api/its/{it_id}/comments',
+                          query_string={'per_page': 2, **({'cursor': cursor} if cursor else {})}).get_json()
+        seen += [item['content'] for item in page['items']]
+        if not page['has_more']:
+            break
+        cursor = page['next_cursor']
+    assert seen == [f'评论 {i}' for i in reversed(range(5))]
+    assert page['total'] == 5
+
+
+def test_detail_links_neighbours_and_pages_comment_fragments(app, user, tied):
+    client = app.test_client()
+    page = client.get(f'/detail/{tied[1]}').get_data(as_text=True)
+    assert f'/detail/{tied[2]}' in page and f'/detail/{tied[0]}' in page
+
+    assert client.get(f'/detail/{tied[1]}/comments?cursor=not-a-cursor').status_code == 400
+    assert client.get(f'/api/its/{tied[1]}/comments?cursor=not-a-cursor').status_code == 400
+    assert client.get('/api/its/999999/comments').status_code == 404
@@ -0,0 +1,54 @@
+"""Feed: the index's first page and /api/its scroll one filtered listing"""
+
+import html
+import os
+import re
+
+import pytest
+
+
+@pytest.fixture
+def field(user, add_it):
+    """A field of 30 ITs, 20 of them matching the search word 连续, which also matches elsewhere"""
+    name = f'信息流 {os.urandom(4).hex()}'
+    for i in range(30):
+        add_it(user, field=name, name=f'{"连续" if i % 3 else "其他"} {i}', agree_count=i % 4)
+    add_it(user, name='连续 在别处')
+    return name
+
+
+def scroll(client, cursor=None, **params):
+    """Names on every page from ``cursor`` on, and the last response body"""
+    names = []
+    while True:
+        query = {'fields': 'name', **params, **({'cursor': cursor} if cursor else {})}
+        body = client.get('/api/its', query_string=query).get_json()
+        names += [item['name'] for item in body['items']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            return names, body
+
+
+def test_infinite_scroll_continues_the_filtered_search(app, field):
+    client = app.test_client()
+    page = client.get('/', query_string={'field': field, 'q': '连续'}).get_data(as_text=True)
+    container = re.search(r'data-cursor="([^"]*)"[^>]*data-field="([^"]*)"[^>]*data-q="([^"]*)"'
+                          r'[^>]*data-sort="([^"]*)"', page)
+    cursor, data_field, q, sort = map(html.unescape, container.groups())
+    assert (data_field, q, sort) == (field, '连续', 'relevance')
+
+    first = re.findall(r'(?:连续|其他) \d+', page)
+    assert cursor and len(first) == 12
+    rest, body = scroll(client, cursor, field=field, q=q, sort=sort)
+    assert body['total'] == 20 and body['sort'] == 'relevance'
+    assert sorted(first + rest) == sorted(f'连续 {i}' for i in range(30) if i % 3)
+
+
+@pytest.mark.parametrize('sort', ['new', 'hot', 'top'])
+def test_each_sort_scrolls_the_field_once(app, field, sort):
+    names, body = scroll(app.test_client(), field=field, sort=sort, per_page=4)
+    assert len(names) == len(set(names)) == body['total'] == 30
+
+
+def test_unknown_sort_is_rejected(app, field):
+    assert app.test_client().get('/api/its', query_string={'sort': 'oldest'}).status_code == 400
@@ -0,0 +1,48 @@
+"""/api/its projection with fields= and negotiated compression"""
+
+import gzip
+import json
+import os
+
+import compression
+from feed import DEFAULT_FIELDS, PREVIEW_LENGTH
+
+
+def api(client, headers=None, **params):
+    return client.get('/api/its', query_string=params, headers=headers or {})
+
+
+def test_fields_select_only_the_named_attributes(app, user, add_it):
+    field = f'投影 {os.urandom(4).hex()}'
+    add_it(user, field=field, description='长' * 400, agree_count=2)
+    client = app.test_client()
+
+    item, = api(client, field=field, fields='name,description_preview,agree_count,agreed').get_json()['items']
+    assert set(item) == {'name', 'description_preview', 'agree_count', 'agreed'}
+    assert len(item['description_preview']) == PREVIEW_LENGTH
+    assert (item['agree_count'], item['agreed']) == (2, False)
+
+    item, = api(client, field=field).get_json()['items']
+    assert list(item) == DEFAULT_FIELDS
+
+    assert api(client, fields='name,password_hash').status_code == 400
+
+
+def test_large_bodies_are_gzipped_when_accepted(app, user, add_it, monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    field = f'压缩 {os.urandom(4).hex()}'
+    for i in range(10):
+        add_it(user, field=field, description='很长的描述' * 40)
+    client = app.test_client()
+
+    plain = api(client, field=field)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    packed = api(client, {'Accept-Encoding': 'br, gzip'}, field=field)
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(packed.get_data())) == plain.get_json()
+    assert len(packed.get_data()) < len(plain.get_data())
+
+    small = api(client, {'Accept-Encoding': 'gzip'}, field=field, fields='id', per_page=1)
+    assert 'Content-Encoding' not in small.headers
@@ -0,0 +1,91 @@
+"""Image fetching: only public addresses, allowed hosts and http(s) redirects"""
+
+import socket
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import images
+from images import BlockedAddress, ImageStore, http_fetch, public_connection
+
+
+def resolving_to(monkeypatch, *addresses):
+    """Make every host resolve to ``addresses`` and record connect attempts"""
+    connected = []
+
+    def getaddrinfo(host, port, *args):
+        return [
+            (socket.AF_INET6 if ':' in a else socket.AF_INET, socket.SOCK_STREAM, 0, '', (a, port))
+            for a in addresses
+        ]
+
+    class FakeSocket:
+        def __init__(self, *args):
+            pass
+
+        def connect(self, sockaddr):
+            connected.append(sockaddr[0])
+
+    monkeypatch.setattr(images.socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(images.socket, 'socket', FakeSocket)
+    return connected
+
+
+@pytest.mark.parametrize('address', [
+    '127.0.0.1', '10.0.0.5', '172.16.3.4', '192.168.1.1', '169.254.169.254',
+    '0.0.0.0', '100.64.0.1', '::1', 'fe80::1', 'fd00::1', '::ffff:127.0.0.1', '224.0.0.1',
+])
+def test_non_public_addresses_are_refused(monkeypatch, address):
+    connected = resolving_to(monkeypatch, address)
+    with pytest.raises(BlockedAddress):
+        public_connection(('images.example', 80))
+    assert connected == []
+
+
+def test_public_address_is_used_even_after_a_private_answer(monkeypatch):
+    connected = resolving_to(monkeypatch, '10.1.2.3', '93.184.216.34')
+    public_connection(('images.example', 443))
+    assert connected == ['93.184.216.34']
+
+
+def test_default_fetcher_cannot_reach_a_local_server():
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.handle_request, daemon=True)
+    thread.start()
+    try:
+        with pytest.raises(BlockedAddress):
+            http_fetch(f'http://127.0.0.1:{server.server_port}/secret')
+        assert hits == []
+    finally:
+        server.server_close()
+
+
+def test_redirects_leave_http_only_through_the_guard():
+    handler = images._RedirectHandler()
+    request = urllib.request.Request('https://images.example/a.png')
+    with pytest.raises(BlockedAddress):
+        handler.redirect_request(request, None, 302, 'Found', {}, 'file:///etc/passwd')
+
+
+def test_fetchable_checks_scheme_and_allowed_hosts():
+    store = ImageStore()
+    assert store.fetchable('https://any.example/a.png')
+    assert not store.fetchable('ftp://any.example/a.png')
+    assert not store.fetchable('https:///a.png')
+
+    store.allowed_hosts = {'cdn.example'}
+    assert store.fetchable('https://CDN.example/a.png')
+    assert not store.fetchable('https://other.example/a.png')
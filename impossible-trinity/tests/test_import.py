@@ -0,0 +1,66 @@
+"""Bulk CSV import: export round trip, deduplication and the error report"""
+
+import io
+
+from sqlalchemy import select
+
+from csvio import import_rows, iter_csv_bytes, iter_export_batches
+from models import db, ImpossibleTrinity
+
+HEADER = 'name,field,element1,element2,element3,description\n'
+
+
+def run_import(app, user_id, text, **options):
+    with app.app_context():
+        return import_rows(io.StringIO(text), user_id, **options)
+
+
+def stored(app, field):
+    with app.app_context():
+        table = ImpossibleTrinity.__table__
+        rows = db.session.execute(
+            select(table.c.name, table.c.description).where(table.c.field == field).order_by(table.c.name)
+        ).all()
+        return [tuple(row) for row in rows]
+
+
+def test_exported_csv_imports_back_as_duplicates(app, user, add_it):
+    add_it(user, name='往返', field='导入往返', description='带 "引号", 逗号\n和换行')
+    with app.app_context():
+        text = b''.join(iter_csv_bytes(iter_export_batches())).decode('utf-8-sig')
+    before = stored(app, '导入往返')
+
+    report = run_import(app, user, text)
+    assert (report.inserted, report.updated, report.errored) == (0, 0, 0)
+    assert report.skipped == report.processed > 0
+    assert stored(app, '导入往返') == before
+
+
+def test_duplicates_are_skipped_or_updated_within_and_across_batches(app, user):
+    text = HEADER + '甲,导入去重,一,二,三,旧\n乙,导入去重,一,二,三,旧\n甲,导入去重,一,二,三,同批\n'
+    report = run_import(app, user, text, batch_size=2)
+    assert (report.inserted, report.skipped) == (2, 1)
+    assert stored(app, '导入去重') == [('乙', '旧'), ('甲', '旧')]
+
+    report = run_import(app, user, HEADER + '甲,导入去重,一,二,三,新\n丙,导入去重,一,二,三,新\n',
+                        on_duplicate='update')
+    assert (report.inserted, report.updated) == (1, 1)
+    assert stored(app, '导入去重') == [('丙', '新'), ('乙', '旧'), ('甲', '新')]
+
+
+def test_invalid_rows_are_reported_by_line_and_the_rest_imported(app, user):
+    text = HEADER + '好,导入错误,一,二,三,\n,导入错误,一,二,三,\n' + '长' * 300 + ',导入错误,一,二,三,\n'
+    report = run_import(app, user, text)
+    assert report.inserted == 1
+    assert [error['line'] for error in report.errors] == [3, 4]
+    assert 'name' in report.errors[0]['message']
+    assert stored(app, '导入错误') == [('好', '')]
+
+
+def test_imported_rows_are_searchable_and_counted(app, user):
+    run_import(app, user, HEADER + '导入检索词,导入目录,一,二,三,\n')
+    client = app.test_client()
+    fields = {f['name']: f['item_count'] for f in client.get('/api/fields').get_json()['fields']}
+    assert fields['导入目录'] == 1
+    items = client.get('/api/its', query_string={'q': '导入检索词', 'fields': 'name'}).get_json()['items']
+    assert [item['name'] for item in items] == ['导入检索词']
@@ -0,0 +1,64 @@
+"""Background import/export jobs: progress totals and file cleanup"""
+
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.datastructures import FileStorage
+
+from csvio import count_records
+from jobs import job_runner
+from models import db, Job
+
+CSV_WITH_NEWLINES = (
+    'name,field,element1,element2,element3,description\n'
+    '多行,测试,甲,乙,丙,"第一行\n第二行\n第三行"\n'
+    '\n'
+    '单行,测试,甲,乙,丙,描述\n'
+)
+
+
+def wait(job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        job = db.session.get(Job, job_id)
+        if job.status in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_count_records_ignores_quoted_newlines_and_blank_lines():
+    assert count_records(io.StringIO(CSV_WITH_NEWLINES)) == 2
+    assert count_records(io.StringIO('')) == 0
+
+
+def test_import_total_matches_progress_and_upload_is_deleted(app, user):
+    upload = FileStorage(io.BytesIO(CSV_WITH_NEWLINES.encode()), filename='its.csv')
+    with app.app_context():
+        job = job_runner.submit('import', user, upload=upload, creator_id=user)
+        upload_dir = os.path.dirname(job.input_path)
+        job = wait(job.id)
+        assert job.status == 'done', job.error
+        assert job.total == job.progress == 2
+        assert job.input_path is None
+        assert not os.path.exists(upload_dir)
+
+
+def test_export_file_is_kept_until_it_expires(app, user):
+    with app.app_context():
+        job = wait(job_runner.submit('export', user).id)
+        assert job.status == 'done', job.error
+        path = job.output_path
+        assert os.path.exists(path)
+
+        job_runner.sweep()
+        assert os.path.exists(path)
+
+        job.finished_at = datetime.utcnow() - timedelta(hours=app.config['JOB_RETENTION_HOURS'] + 1)
+        db.session.commit()
+        job_runner.sweep()
+        assert not os.path.exists(path)
+        assert db.session.get(Job, job.id).output_path is None
@@ -0,0 +1,53 @@
+"""/metrics access, Server-Timing and the admin profiler"""
+
+import pytest
+
+
+@pytest.fixture
+def token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret')
+    return 's3cret'
+
+
+def test_metrics_need_the_token_or_an_admin(app, user, admin, login, token):
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 403
+    # Behind a reverse proxy everything arrives from localhost
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+    login(client, user)
+    assert client.get('/metrics').status_code == 403
+    login(client, admin)
+    assert client.get('/metrics').status_code == 200
+
+
+def test_without_a_token_only_admins_may_scrape(app, admin, login, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+    client = app.test_client()
+    assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer None'}).status_code == 403
+    login(client, admin)
+    assert client.get('/metrics').status_code == 200
+
+
+def test_requests_are_timed_and_counted(app, token):
+    client = app.test_client()
+    response = client.get('/api/fields')
+    assert response.headers['Server-Timing'].startswith('app;dur=')
+    assert 'queries"' in response.headers['Server-Timing']
+
+    body = client.get('/metrics', headers={'Authorization': f'Bearer {token}'}).get_data(as_text=True)
+    assert 'it_request_duration_seconds_bucket{endpoint="api_fields",method="GET"' in body
+    assert 'it_requests_total{endpoint="api_fields",method="GET",status="200"}' in body
+
+
+def test_profile_is_for_admins_only(app, user, admin, login):
+    client = app.test_client()
+    login(client, user)
+    assert client.get('/api/fields?_profile=1').mimetype == 'application/json'
+    login(client, admin)
+    profile = client.get('/api/fields?_profile=1')
+    assert profile.mimetype == 'text/plain'
+    assert profile.headers['Cache-Control'] == 'no-store'
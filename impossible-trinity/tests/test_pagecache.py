@@ -0,0 +1,53 @@
+"""Rendered page cache: hits, generation invalidation and ETags"""
+
+import pytest
+from flask import Flask, request
+from flask_login import LoginManager
+
+from pagecache import PageCache
+
+
+@pytest.fixture
+def cached_app():
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', PAGE_CACHE_TTL=60)
+    LoginManager(app).user_loader(lambda user_id: None)
+    cache = PageCache()
+    cache.init_app(app)
+    renders = []
+
+    @app.route('/items/<int:id>')
+    @cache.cached(lambda view_args: ['structure', f"item:{view_args['id']}"], args=('view',))
+    def item(id):
+        renders.append((id, request.args.get('view')))
+        return f'item {id} #{len(renders)}'
+
+    return app, cache, renders
+
+
+def test_repeat_requests_are_served_from_the_cache(cached_app):
+    app, cache, renders = cached_app
+    client = app.test_client()
+    first = client.get('/items/1')
+    assert client.get('/items/1').get_data() == first.get_data()
+    assert client.get('/items/1?ignored=1').get_data() == first.get_data()
+    client.get('/items/1?view=table')
+    assert renders == [(1, None), (1, 'table')]
+
+    revalidated = client.get('/items/1', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_invalidation_stales_only_the_affected_pages(cached_app):
+    app, cache, renders = cached_app
+    client = app.test_client()
+    client.get('/items/1')
+    client.get('/items/2')
+    cache.invalidate(1)
+    client.get('/items/1')
+    client.get('/items/2')
+    assert renders == [(1, None), (2, None), (1, None)]
+
+    cache.invalidate(structure=True)
+    client.get('/items/2')
+    assert renders[-1] == (2, None) and len(renders) == 4
@@ -0,0 +1,75 @@
+"""
+Query-count regression test for the list views
+
+Every list page must run a fixed number of SQL statements whatever its size:
+counts come from the denormalized ``comments_count`` column, never from
+loading each IT's comments.
+
+    python -m pytest tests
+"""
+
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from models import db, User, ImpossibleTrinity, Comment
+
+IT_COUNT = 120
+COMMENTS_PER_IT = 3
+
+
+@pytest.fixture(scope='module')
+def client(app):
+    with app.app_context():
+        user = User(username='query-counter', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        for i in range(IT_COUNT):
+            it = ImpossibleTrinity(
+                name=f'三角 {i}', field=f'领域 {i % 4}', creator_id=user.id,
+                element1='甲', element2='乙', element3='丙',
+                element1_sacrifice_explanation='一', element2_sacrifice_explanation='二',
+                element3_sacrifice_explanation='三', description='描述',
+            )
+            db.session.add(it)
+            db.session.flush()
+            db.session.add_all(
+                Comment(content=f'评论 {j}', it_id=it.id, user_id=user.id)
+                for j in range(COMMENTS_PER_IT)
+            )
+        db.session.commit()
+    return app.test_client()
+
+
+def count_statements(client, url):
+    """Statements the request thread runs for ``url``, after a warm-up request"""
+    assert client.get(url).status_code == 200
+    statements = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # Background workers (agree buffer, related lists) run on their own threads
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    with client.application.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get(url).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+
+def test_api_its_statements_independent_of_page_size(client):
+    small = count_statements(client, '/api/its?per_page=5')
+    large = count_statements(client, '/api/its?per_page=100')
+    assert len(small) == len(large) == 1, small + large
+
+
+def test_index_statements_independent_of_view(client):
+    cards = count_statements(client, '/')
+    table = count_statements(client, '/?view=table')
+    assert len(cards) == len(table) == 1, cards + table
@@ -0,0 +1,28 @@
+"""Hot scores: the periodic refresh rewrites only rows that drifted"""
+
+from sqlalchemy import update
+
+from models import db, ImpossibleTrinity
+from ranking import hot_score, refresh_hot_scores
+
+
+def test_refresh_rescores_drifted_rows_only(app, user, make_it):
+    with app.app_context():
+        it = make_it(user, name='热度')
+        db.session.add(it)
+        db.session.commit()
+        refresh_hot_scores(db.session.connection())
+        db.session.commit()
+        assert refresh_hot_scores(db.session.connection()) == 0
+
+        # A bulk write around the counters leaves the score stale
+        table = ImpossibleTrinity.__table__
+        db.session.execute(update(table).where(table.c.id == it.id).values(agree_count=7))
+        db.session.expire_all()
+        updated_at = db.session.get(ImpossibleTrinity, it.id).updated_at
+        assert refresh_hot_scores(db.session.connection()) == 1
+        db.session.commit()
+
+        it = db.session.get(ImpossibleTrinity, it.id)
+        assert it.hot_score == hot_score(7, it.comments_count, it.created_at)
+        assert it.updated_at == updated_at
@@ -0,0 +1,74 @@
+"""Related lists: incremental updates agree with recomputing from scratch"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import related
+from models import db, Related
+from related import RelatedModel, related_index, term_counts, _documents
+from sqlalchemy import select
+
+TOPICS = ['缓存 一致性', '可用性 分区', '延迟 吞吐', '成本 质量', '速度 精度']
+
+
+def topical(make_it, user_id, i, topic):
+    first, second = topic.split()
+    return make_it(user_id, name=f'{topic} 三角 {i}', element1=first, element2=second,
+                   element3=f'元素{i % 3}', description=f'{topic} 的权衡')
+
+
+def recomputed(model, connection):
+    """Lists from fresh vectors under the model's vocabulary"""
+    rows = _documents(connection)
+    fresh = RelatedModel(model.vocab, model.idf, model.df, [r['id'] for r in rows], None, model.synced_at)
+    fresh.matrix = fresh._vectors([term_counts(r) for r in rows])
+    return fresh, fresh.top(range(len(fresh.ids)))
+
+
+def test_side_rows_read_and_merge_like_a_refit():
+    rows = [{'id': i, **{c: TOPICS[i % 5] for c in related.TEXT_WEIGHTS}} for i in range(1, 31)]
+    model = RelatedModel.fit(rows, None)
+    changed = [(3, term_counts({c: '全新 文本' for c in related.TEXT_WEIGHTS})),
+               (99, term_counts(rows[0]))]
+    model.replace(changed)
+    model.remove([7])
+    fresh = RelatedModel(model.vocab, model.idf, model.df, [3, 99], None, None)
+    fresh.matrix = fresh._vectors([counts for _, counts in changed])
+    assert abs(model._rows([model.pos[3], model.pos[99]]) - fresh.matrix).max() < 1e-12
+    assert model.ids[model.pos[99]] == 99 and 7 not in model.pos
+
+    live = sorted(model.pos.values())
+    before = model.top(live)
+    model.merge()
+    assert model.side.shape[0] == 0 and model.matrix.shape[0] == len(model.ids)
+    assert model.top(live) == before
+
+
+def test_incremental_update_matches_recompute(app, user, make_it, monkeypatch):
+    monkeypatch.setattr(related, 'MERGE_ROWS', 3)
+    with app.app_context():
+        its = [topical(make_it, user, i, TOPICS[i % 5]) for i in range(40)]
+        db.session.add_all(its)
+        db.session.commit()
+        related_index.rebuild(db.session.connection())
+        db.session.commit()
+        related_index.model = None
+
+        its[0].name = '延迟 吞吐 全新'
+        db.session.add(topical(make_it, user, 99, TOPICS[1]))
+        db.session.delete(its[1])
+        db.session.commit()
+        its[2].element1 = '精度'
+        db.session.commit()
+        related_index._pool.submit(lambda: None).result()
+        assert related_index.model is not None
+
+        fresh, expected = recomputed(related_index.model, db.session.connection())
+        stored = {}
+        for it_id, related_id, score in db.session.execute(
+            select(Related.it_id, Related.related_id, Related.score).order_by(Related.it_id, Related.rank)
+        ):
+            stored.setdefault(it_id, []).append(round(score, 4))
+        for it_id in fresh.ids:
+            assert stored.get(it_id, []) == [round(s, 4) for _, s in expected[it_id]], it_id
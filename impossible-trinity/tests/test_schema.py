@@ -0,0 +1,120 @@
+"""Schema migrations: a pre-versioning database upgraded to the latest version"""
+
+import sqlite3
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect
+
+from models import db
+from schema import MIGRATIONS, check_schema, latest_version, schema_version, upgrade_schema
+
+# The tables as they were before migrations were versioned (user_version 0)
+UNVERSIONED_SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE,
+    password_hash VARCHAR(128) NOT NULL, is_admin BOOLEAN, created_at DATETIME
+);
+CREATE TABLE impossible_trinity (
+    id INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, name_en VARCHAR(200),
+    field VARCHAR(100) NOT NULL, element1 VARCHAR(100) NOT NULL,
+    element2 VARCHAR(100) NOT NULL, element3 VARCHAR(100) NOT NULL,
+    description TEXT NOT NULL, created_at DATETIME, agree_count INTEGER,
+    hyperlink VARCHAR(500), feature_image_url VARCHAR(500),
+    element1_image_url VARCHAR(500), element2_image_url VARCHAR(500),
+    element3_image_url VARCHAR(500), updated_at DATETIME,
+    element1_sacrifice_explanation TEXT, element2_sacrifice_explanation TEXT,
+    element3_sacrifice_explanation TEXT,
+    creator_id INTEGER NOT NULL REFERENCES user (id)
+);
+CREATE TABLE comment (
+    id INTEGER PRIMARY KEY, content TEXT NOT NULL, created_at DATETIME,
+    it_id INTEGER NOT NULL REFERENCES impossible_trinity (id),
+    user_id INTEGER NOT NULL REFERENCES user (id)
+);
+INSERT INTO user VALUES (1, 'old', 'x', 0, '2024-01-01 00:00:00');
+INSERT INTO impossible_trinity (id, name, field, element1, element2, element3, description,
+    created_at, agree_count, updated_at, creator_id)
+VALUES (1, '旧', '经济', '甲', '乙', '丙', '', '2024-01-01 00:00:00', NULL, '2024-01-01 00:00:00', 1),
+       (2, '旧二', '经济', '甲', '乙', '丙', '', '2024-01-02 00:00:00', 3, '2024-01-02 00:00:00', 1);
+INSERT INTO comment VALUES (1, '评论', '2024-01-01 00:00:00', 1, 1),
+                           (2, '评论', '2024-01-01 00:00:00', 1, 1);
+'''
+
+
+def unversioned(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(UNVERSIONED_SCHEMA)
+    connection.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Run ``fn`` in an app context bound to a separate database file"""
+    path = tmp_path / 'schema.db'
+    other = Flask(__name__)
+    other.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(other)
+
+    def run(fn):
+        with other.app_context():
+            try:
+                return fn()
+            finally:
+                db.engine.dispose()
+    return path, run
+
+
+def model_schema(run):
+    """Columns and indexes per table, excluding SQLite internals"""
+    def read():
+        with db.engine.connect() as connection:
+            inspector = inspect(connection)
+            return {
+                table: (
+                    {c['name'] for c in inspector.get_columns(table)},
+                    {i['name'] for i in inspector.get_indexes(table)},
+                )
+                for table in inspector.get_table_names() if table in db.metadata.tables
+            }
+    return run(read)
+
+
+def test_unversioned_database_upgrades_step_by_step(database):
+    path, run = database
+    unversioned(path)
+
+    assert run(upgrade_schema) == [version for version, _ in MIGRATIONS]
+    assert run(upgrade_schema) == []
+    run(check_schema)
+
+    def counters():
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql(
+                'SELECT id, comments_count, agree_count, hot_score IS NOT NULL '
+                'FROM impossible_trinity ORDER BY id'
+            ).all()
+            fields = connection.exec_driver_sql('SELECT name, item_count FROM field').all()
+            return [tuple(row) for row in rows], [tuple(row) for row in fields], schema_version(connection)
+    rows, fields, version = run(counters)
+    assert rows == [(1, 2, 0, 1), (2, 0, 3, 1)]
+    assert fields == [('经济', 2)]
+    assert version == latest_version()
+
+
+def test_upgraded_schema_matches_a_fresh_one(database):
+    path, run = database
+    unversioned(path)
+    run(upgrade_schema)
+    upgraded = model_schema(run)
+
+    path.unlink()
+    assert run(upgrade_schema) == []
+    assert model_schema(run) == upgraded
+
+
+def test_check_schema_refuses_an_old_database(database):
+    path, run = database
+    unversioned(path)
+    with pytest.raises(RuntimeError, match='upgrade-db'):
+        run(check_schema)
@@ -0,0 +1,38 @@
+"""Full-text search: tokenizing, MATCH expressions and index upkeep"""
+
+from models import db, ImpossibleTrinity
+from search import build_match, tokenize
+
+
+def search(client, query):
+    body = client.get('/api/its', query_string={'q': query, 'fields': 'id', 'per_page': 100}).get_json()
+    return {item['id'] for item in body['items']}
+
+
+def test_tokenize_splits_cjk_into_bigrams_and_lowercases_words():
+    assert tokenize('不可能三角 CAP定理') == ['不可', '可能', '能三', '三角', '角', 'cap', '定理', '理']
+    assert tokenize(None) == []
+
+
+def test_build_match_quotes_terms_and_prefixes_partial_ones():
+    assert build_match('三角 CAP 三') == '"三角" AND "cap"* AND "三"*'
+    assert build_match('"; DROP --') == '"drop"*'
+    assert build_match('!!') is None
+
+
+def test_index_follows_inserts_edits_and_deletes(app, user, add_it):
+    it_id = add_it(user, name='量子纠缠悖论', description='zebracorn 实验')
+    client = app.test_client()
+    assert it_id in search(client, '纠缠')
+    assert it_id in search(client, 'zebrac')
+
+    with app.app_context():
+        db.session.get(ImpossibleTrinity, it_id).name = '薛定谔难题'
+        db.session.commit()
+    assert it_id not in search(client, '纠缠')
+    assert it_id in search(client, '定谔')
+
+    with app.app_context():
+        db.session.delete(db.session.get(ImpossibleTrinity, it_id))
+        db.session.commit()
+    assert it_id not in search(client, '定谔')
@@ -0,0 +1,58 @@
+"""Production entry point: warm start, worker count and the page cache"""
+
+import logging
+import multiprocessing
+import os
+import runpy
+
+import pytest
+from flask import Flask
+
+from pagecache import MemoryBackend, PageCache
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+
+
+def page_cache_with_memory():
+    app = Flask(__name__)
+    app.config['PAGE_CACHE_TTL'] = 60
+    cache = PageCache()
+    cache.init_app(app)
+    assert isinstance(cache.backend, MemoryBackend)
+    return cache
+
+
+def test_in_process_page_cache_is_kept_only_for_one_worker(caplog):
+    logger = logging.getLogger('test_server')
+    cache = page_cache_with_memory()
+    cache.require_shared(1, logger)
+    assert isinstance(cache.backend, MemoryBackend)
+
+    cache.require_shared(4, logger)
+    assert cache.backend is None
+    assert 'PAGE_CACHE_URL' in caplog.text
+
+    shared = object()
+    cache.backend = shared
+    cache.require_shared(4, logger)
+    assert cache.backend is shared
+
+
+@pytest.mark.parametrize('env, workers', [
+    ({}, 1),
+    ({'PAGE_CACHE_URL': 'redis://cache'}, multiprocessing.cpu_count()),
+    ({'WEB_CONCURRENCY': '3'}, 3),
+])
+def test_gunicorn_worker_count_follows_the_page_cache(monkeypatch, env, workers):
+    for name in ('PAGE_CACHE_URL', 'WEB_CONCURRENCY', 'MAX_REQUESTS'):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    settings = runpy.run_path(CONFIG)
+    assert settings['workers'] == workers
+    assert settings['preload_app'] and settings['max_requests'] == 0
+
+
+def test_create_app_checks_the_schema_and_warms_up(app):
+    from app import create_app
+    assert create_app(workers=1) is app
@@ -0,0 +1,41 @@
+"""Creator dashboard: grouped stats, memo upkeep and paging"""
+
+import re
+
+from models import db, ImpossibleTrinity
+from stats import user_stats
+
+
+def test_stats_group_by_field_and_follow_own_writes(app, user, add_it):
+    first = add_it(user, field='统计甲', agree_count=2, comments_count=1)
+    add_it(user, field='统计甲', agree_count=3)
+    add_it(user, field='统计乙')
+    with app.app_context():
+        stats = user_stats(user)
+        assert (stats.it_count, stats.agree_count, stats.comments_count) == (3, 5, 1)
+        assert [(f.name, f.it_count) for f in stats.top_fields] == [('统计甲', 2), ('统计乙', 1)]
+        assert user_stats(user) is stats
+
+        db.session.get(ImpossibleTrinity, first).field = '统计乙'
+        db.session.commit()
+        assert [(f.name, f.it_count) for f in user_stats(user).top_fields] == [('统计乙', 2), ('统计甲', 1)]
+
+        db.session.delete(db.session.get(ImpossibleTrinity, first))
+        db.session.commit()
+        assert user_stats(user).it_count == 2
+
+
+def test_dashboard_pages_with_a_cursor(app, user, add_it, login, monkeypatch):
+    monkeypatch.setattr('app.DASHBOARD_PER_PAGE', 2)
+    for i in range(3):
+        add_it(user, name=f'仪表盘 {i}')
+    client = app.test_client()
+    login(client, user)
+
+    first = client.get('/dashboard').get_data(as_text=True)
+    assert '仪表盘 2' in first and '仪表盘 0' not in first
+    cursor = re.search(r'/dashboard\?cursor=([^"&]+)', first).group(1)
+    second = client.get(f'/dashboard?cursor={cursor}').get_data(as_text=True)
+    assert '仪表盘 0' in second and '仪表盘 2' not in second
+
+    assert client.get('/dashboard?cursor=garbage').status_code == 302
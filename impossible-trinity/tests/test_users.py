@@ -0,0 +1,68 @@
+"""User snapshots: cached identity, dropped after committed changes only"""
+
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db, User
+from users import load_user, load_users, UserSnapshot
+
+
+@contextmanager
+def recorded_statements():
+    """Statements this thread runs inside the block"""
+    statements = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_warm_loader_answers_without_a_query(app, user, admin):
+    with app.app_context():
+        identity = load_user(str(user))
+        assert isinstance(identity, UserSnapshot) and not identity.is_admin
+        with recorded_statements() as statements:
+            assert load_user(user) is identity
+            assert load_users([user, admin, user])[admin].is_admin
+        assert len(statements) == 1
+        with recorded_statements() as statements:
+            assert set(load_users([user, admin])) == {user, admin}
+        assert statements == []
+
+
+def test_committed_changes_drop_the_snapshot_and_rollbacks_keep_it(app, user):
+    with app.app_context():
+        before = load_user(user)
+        db.session.get(User, user).is_admin = True
+        db.session.flush()
+        db.session.rollback()
+        assert load_user(user) is before
+
+        db.session.get(User, user).is_admin = True
+        db.session.commit()
+        assert load_user(user).is_admin
+
+        db.session.get(User, user).is_admin = False
+        db.session.commit()
+        assert not load_user(user).is_admin
+
+
+def test_deleted_user_is_no_longer_loaded(app):
+    with app.app_context():
+        gone = User(username='待删除', password_hash='x')
+        db.session.add(gone)
+        db.session.commit()
+        gone_id = gone.id
+        assert load_user(gone_id) is not None
+        db.session.delete(gone)
+        db.session.commit()
+        assert load_user(gone_id) is None
@@ -0,0 +1,100 @@
+"""
+Cached identity for logged-in users
+
+Flask-Login calls the user loader on every authenticated request, including
+AJAX calls such as ``/agree/<id>``. The loader here answers from a per-process
+cache of immutable ``UserSnapshot`` tuples (id, username, is_admin), so a warm
+worker authenticates a request without touching the database, and no
+session-bound ORM object outlives the request that loaded it. ``load_users``
+resolves the authors of a whole page of comments the same way, with at most
+one query for the ones not cached.
+
+Changes to a user's name or admin flag, and deletions, drop the snapshot after
+the committing transaction; the TTL bounds how long other processes (another
+worker, ``create_admin.py``) can serve a stale one.
+"""
+
+from collections import namedtuple
+
+from flask_login import UserMixin
+from sqlalchemy import event, inspect, select
+from cache import LRUCache
+from hooks import defer, on_commit
+from models import db, User
+
+# Longest time another process may serve a stale snapshot (seconds)
+USER_CACHE_TTL = 60
+
+# user_id -> UserSnapshot
+_users = LRUCache(maxsize=10000, ttl=USER_CACHE_TTL)
+
+
+class UserSnapshot(namedtuple('UserSnapshot', ['id', 'username', 'is_admin']), UserMixin):
+    """The parts of a User that requests and templates need, detached from any session"""
+    __slots__ = ()
+
+
+def snapshot(user):
+    """Cache and return the snapshot of a loaded ``User``"""
+    identity = UserSnapshot(user.id, user.username, bool(user.is_admin))
+    _users.set(identity.id, identity)
+    return identity
+
+
+def load_user(user_id):
+    """Flask-Login user loader: a ``UserSnapshot`` or None"""
+    user_id = int(user_id)
+    identity = _users.get(user_id)
+    if identity is None:
+        row = db.session.execute(
+            select(User.id, User.username, User.is_admin).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        identity = UserSnapshot(row.id, row.username, bool(row.is_admin))
+        _users.set(user_id, identity)
+    return identity
+
+
+def load_users(user_ids):
+    """``{id: UserSnapshot}`` for many users: cached ones, plus one query for the rest"""
+    found, missing = {}, []
+    for user_id in set(user_ids):
+        identity = _users.get(user_id)
+        if identity is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = identity
+    if missing:
+        for row in db.session.execute(
+            select(User.id, User.username, User.is_admin).where(User.id.in_(missing))
+        ):
+            identity = found[row.id] = UserSnapshot(row.id, row.username, bool(row.is_admin))
+            _users.set(row.id, identity)
+    return found
+
+
+def forget_user(user_id):
+    _users.delete(user_id)
+
+
+def _changed(target):
+    defer(target, 'users', target.id)
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.is_admin.history.has_changes() or state.attrs.username.history.has_changes():
+        _changed(target)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    _changed(target)
+
+
+@on_commit('users')
+def _drop_snapshots(user_ids):
+    for user_id in user_ids:
+        forget_user(user_id)
@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module checks the schema and warms the app (see
+``app.create_app``); with ``preload_app`` that happens once in the gunicorn
+master, and every worker forks from the warm process.
+"""
+
+import os
+
+from app import create_app
+
+app = create_app(workers=int(os.environ.get('WEB_CONCURRENCY', 1)))